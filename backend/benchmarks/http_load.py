@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+# Closed-loop HTTP load generator: keeps `concurrency` requests in flight
+# for `duration` seconds, cycling through the given paths, and reports
+# throughput and latency percentiles. It speaks just enough HTTP/1.1 for
+# our endpoints (JSON bodies, Content-Length or chunked responses,
+# keep-alive when offered), so it runs anywhere the backend does, without
+# extra packages. benchmarks.scenarios builds on it.
+#
+#   python -m benchmarks.http_load http://localhost:8000 /api/products/ -c 64 -d 30
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path, method='GET', data=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nAccept: */*\r\n'
+        payload = b''
+        if data is not None:
+            payload = json.dumps(data).encode('utf-8')
+            head += f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+        self.writer.write(f'{head}\r\n'.encode('latin-1') + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self.read_chunked()
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return int(status_line.split()[1]), body
+
+    async def read_chunked(self):
+        # Streamed exports come chunked; trailers aren't used.
+        chunks = []
+        while size := int((await self.reader.readline()).split(b';')[0], 16):
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+        await self.reader.readline()
+        return b''.join(chunks)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(base_url, paths, concurrency, duration, warmup=0):
+    # `paths` are GET paths or (method, path, json_body) tuples; a callable
+    # body is called for every request.
+    requests = [path if isinstance(path, tuple) else ('GET', path, None) for path in paths]
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    latencies, errors, sizes = [], 0, 0
+    recording = False
+    deadline = time.monotonic() + warmup + duration
+
+    async def client(index):
+        nonlocal errors, sizes
+        connection = Connection(host, port)
+        position = index
+        while time.monotonic() < deadline:
+            method, path, data = requests[position % len(requests)]
+            position += 1
+            if callable(data):
+                data = data()
+            started = time.perf_counter()
+            try:
+                status, body = await connection.request(path, method, data)
+                size, failed = len(body), status >= 400
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                connection.close()
+                status, size, failed = None, 0, True
+            elapsed = time.perf_counter() - started
+            if recording:
+                latencies.append(elapsed)
+                sizes += size
+                errors += failed
+        connection.close()
+
+    async def start_recording():
+        nonlocal recording
+        await asyncio.sleep(warmup)
+        recording = True
+
+    await asyncio.gather(start_recording(), *(client(index) for index in range(concurrency)))
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': errors / len(latencies) if latencies else 0,
+        'requests_per_sec': len(latencies) / duration,
+        'bytes_per_request': sizes / len(latencies) if latencies else 0,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'max_ms': latencies[-1] * 1000 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Closed-loop HTTP load test for the inventory API')
+    parser.add_argument('base_url', help='e.g. http://localhost:8000')
+    parser.add_argument('paths', nargs='+', help='Request paths, used round-robin')
+    parser.add_argument('-c', '--concurrency', type=int, default=64, help='Requests kept in flight')
+    parser.add_argument('-d', '--duration', type=float, default=30, help='Seconds measured')
+    parser.add_argument('-w', '--warmup', type=float, default=3, help='Seconds run before measuring')
+    args = parser.parse_args()
+    result = asyncio.run(run(args.base_url, args.paths, args.concurrency, args.duration, args.warmup))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
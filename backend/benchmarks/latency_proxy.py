@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import time
+
+# TCP proxy that delivers every chunk `delay` ms after it arrives, in both
+# directions. Put it between the app and a local Postgres to reproduce the
+# round trip to a database on another host, where workers spend most of a
+# request waiting rather than computing.
+#
+#   python -m benchmarks.latency_proxy --listen 6543 --target-unix /tmp/pg/.s.PGSQL.5432 --delay 5
+
+
+async def pipe(reader, writer, delay):
+    queue = asyncio.Queue()
+
+    async def deliver():
+        while (item := await queue.get()) is not None:
+            due, data = item
+            await asyncio.sleep(max(0, due - time.monotonic()))
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    delivery = asyncio.create_task(deliver())
+    try:
+        while data := await reader.read(65536):
+            queue.put_nowait((time.monotonic() + delay, data))
+    except ConnectionError:
+        pass
+    queue.put_nowait(None)
+    await delivery
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Forward TCP connections with added latency')
+    parser.add_argument('--listen', type=int, required=True, help='Local port to listen on')
+    parser.add_argument('--target-host', default='127.0.0.1')
+    parser.add_argument('--target-port', type=int, default=5432)
+    parser.add_argument('--target-unix', help='Unix socket to forward to instead of host/port')
+    parser.add_argument('--delay', type=float, default=5, help='One-way delay in milliseconds')
+    args = parser.parse_args()
+    delay = args.delay / 1000
+
+    async def handle(client_reader, client_writer):
+        if args.target_unix:
+            server_reader, server_writer = await asyncio.open_unix_connection(args.target_unix)
+        else:
+            server_reader, server_writer = await asyncio.open_connection(args.target_host, args.target_port)
+        await asyncio.gather(
+            pipe(client_reader, server_writer, delay),
+            pipe(server_reader, client_writer, delay),
+        )
+
+    async def serve():
+        server = await asyncio.start_server(handle, '127.0.0.1', args.listen)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
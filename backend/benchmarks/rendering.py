@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import django
+
+# Micro-benchmark of response rendering, in process against a seeded
+# database: the same rows through the serializers and JSONRenderer
+# (before) and through .values() and the orjson renderer (after, the
+# INVENTORY_FAST_RENDERING path). Both include the query. Reports rows/sec
+# for each and checks that the bytes are identical.
+#
+#   python -m benchmarks.rendering --rows 1000 --repeat 20
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventorymgmt.settings')
+    django.setup()
+
+
+def cases():
+    from django.db.models import F
+
+    from inventory.models import Inventory, Product, Store
+    from inventory.serializers import InventoryListSerializer, ProductSerializer
+
+    store = Store.objects.order_by('name').first()
+    if store is None:
+        raise RuntimeError('The benchmark needs a seeded database (see "Benchmarks" in the README).')
+    inventory = Inventory.objects.filter(store=store).order_by('product_id')
+    alerts = Inventory.objects.filter(quantity__lt=F('minStock')).order_by('store_id', 'product_id')
+    products = Product.objects.order_by('name', 'id')
+    expand = {'expand': {'product', 'store'}, 'fields': {}}
+    plain = {'expand': set(), 'fields': {}}
+    # name: (serializer, queryset, serializer options)
+    return {
+        'store_inventory': (InventoryListSerializer, inventory, plain),
+        'store_inventory_expanded': (InventoryListSerializer, inventory, expand),
+        'inventory_alerts': (InventoryListSerializer, alerts, plain),
+        'product_list': (ProductSerializer, products, None),
+    }
+
+
+def render_serialized(serializer, queryset, options, rows):
+    from rest_framework.renderers import JSONRenderer
+
+    if options is None:
+        page = list(queryset[:rows])
+        data = serializer(page, many=True).data
+    else:
+        page = list(serializer.prepare_queryset(queryset, **options)[:rows])
+        data = serializer(page, many=True, **options).data
+    return len(page), JSONRenderer().render(data)
+
+
+def render_values(serializer, queryset, options, rows):
+    from inventory.renderers import FastJSONRenderer
+
+    layout = serializer.values_layout(**(options or {}))
+    page = list(serializer.values_queryset(queryset, layout)[:rows])
+    return len(page), FastJSONRenderer().render(serializer.from_values(page, layout))
+
+
+def measure(render, args, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count, content = render(*args)
+        timings.append(time.perf_counter() - started)
+    seconds = statistics.median(timings)
+    return count, content, seconds
+
+
+def run(rows, repeat):
+    from django.test import override_settings
+
+    results = {}
+    for name, (serializer, queryset, options) in cases().items():
+        args = (serializer, queryset, options, rows)
+        count, before, before_seconds = measure(render_serialized, args, repeat)
+        with override_settings(INVENTORY_FAST_RENDERING={'ENABLED': True}):
+            _, after, after_seconds = measure(render_values, args, repeat)
+        if before != after:
+            raise AssertionError(f'{name}: the fast path returned different bytes')
+        results[name] = {
+            'rows': count,
+            'bytes': len(before),
+            'before_rows_per_sec': count / before_seconds,
+            'after_rows_per_sec': count / after_seconds,
+            'speedup': before_seconds / after_seconds,
+        }
+        print(
+            f"{name:<26} {count:6d} rows  before {count / before_seconds:10.0f} rows/s  "
+            f"after {count / after_seconds:10.0f} rows/s  x{before_seconds / after_seconds:.1f}",
+            file=sys.stderr
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serializer and fast-path rendering throughput')
+    parser.add_argument('-n', '--rows', type=int, default=1000, help='Rows per response (a full keyset page by default)')
+    parser.add_argument('-r', '--repeat', type=int, default=20, help='Renders per case; the median is reported')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    setup()
+    results = run(args.rows, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+            output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+
+from .http_load import Connection, run
+
+# Workload scenarios run against a server holding a seeded catalog (see
+# "Benchmarks" in the README). Each one is a closed loop of requests built
+# from ids the API returns, so they work against any seed. Results are
+# written as JSON and compared with a stored baseline, metric by metric.
+# Each scenario runs several times and reports the median of every metric,
+# which keeps a noisy run from passing for a regression.
+#
+#   python -m benchmarks.scenarios http://localhost:8000 --output results.json
+#   python -m benchmarks.scenarios http://localhost:8000 --baseline benchmarks/baseline.json
+
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+# Relative change tolerated before a metric counts as a regression.
+DEFAULT_TOLERANCE = 0.2
+# Error rates are compared in absolute terms.
+ERROR_RATE_TOLERANCE = 0.01
+HIGHER_IS_BETTER = ('requests_per_sec',)
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms')
+# Shown but never a regression: a few slow requests move it too much.
+REPORTED = ('p99_ms',)
+
+
+async def get_json(base_url, path, params=None):
+    url = urlsplit(base_url)
+    connection = Connection(url.hostname, url.port or 80)
+    try:
+        status, body = await connection.request(f'{path}?{urlencode(params or {})}')
+    finally:
+        connection.close()
+    if status != 200:
+        raise RuntimeError(f'GET {path} returned {status}')
+    return json.loads(body)
+
+
+async def discover(base_url, stores=8, products=50):
+    # Picks the stores and products the scenarios work on, and a hot SKU
+    # stocked in the first two stores for the transfer scenario.
+    store_ids = [
+        store['id'] for store in
+        (await get_json(base_url, '/api/stores/', {'pagination': 'cursor', 'page_size': stores}))['results']
+    ]
+    if len(store_ids) < 2:
+        raise RuntimeError('The benchmarks need a seeded database with at least two stores.')
+    catalog = (await get_json(base_url, '/api/products/', {'pagination': 'cursor', 'page_size': products}))['results']
+    stock = [
+        {row['product']: row['quantity'] for row in (await get_json(
+            base_url, f'/api/stores/{store}/inventory/', {'page_size': 1000}
+        ))['results']}
+        for store in store_ids[:2]
+    ]
+    hot_sku = max(stock[0], key=lambda product: min(stock[0][product], stock[1].get(product, 0)))
+    return {
+        'stores': store_ids,
+        'products': [product['id'] for product in catalog],
+        'categories': sorted({product['category'] for product in catalog}),
+        'words': sorted({product['name'].split()[0] for product in catalog}),
+        'hot_sku': hot_sku,
+    }
+
+
+def catalog_browsing(data):
+    # Listing, filtering, searching and opening products, as a storefront
+    # would; the response cache serves the repeats.
+    paths = ['/api/stores/', '/api/products/', '/api/products/?page=2']
+    for category in data['categories']:
+        paths.append(f'/api/products/?{urlencode({"category": category})}')
+        paths.append(f'/api/products/?{urlencode({"category": category, "price_max": 100})}')
+    for word in data['words']:
+        paths.append(f'/api/products/?{urlencode({"search": word})}')
+    paths += [f'/api/products/{product}/' for product in data['products']]
+    paths.append('/api/products/?pagination=cursor&has_stock=true')
+    return paths
+
+
+def hot_sku_transfers(data):
+    # Every request moves one unit of the same product between the same two
+    # stores, so they all queue on the same two inventory rows. Directions
+    # alternate, which keeps the stock from running out.
+    source, target = data['stores'][:2]
+    line = {'product_id': data['hot_sku'], 'quantity': 1}
+    return [
+        ('POST', '/api/inventory/transfer/', {**line, 'source_store_id': source, 'target_store_id': target}),
+        ('POST', '/api/inventory/transfer/', {**line, 'source_store_id': target, 'target_store_id': source}),
+    ]
+
+
+def alert_polling(data):
+    # Dashboards polling the low-stock list, overall and per store.
+    paths = ['/api/inventory/alerts/']
+    paths += [f'/api/inventory/alerts/?store={store}' for store in data['stores']]
+    return paths
+
+
+def inventory_dumps(data):
+    # Full NDJSON exports of whole stores.
+    return [f'/api/stores/{store}/inventory/?format=ndjson' for store in data['stores']]
+
+
+POS_BATCH_SIZE = 500
+
+
+def pos_ingestion(data):
+    # Tills posting batches of scanned items: every product is received and
+    # sold once per batch, so stock doesn't drift, and event ids are fresh
+    # so nothing is deduplicated. Events/sec is requests_per_sec times
+    # POS_BATCH_SIZE.
+    def batch():
+        events = []
+        for index in range(POS_BATCH_SIZE // 2):
+            line = {
+                'product_id': data['products'][index % len(data['products'])],
+                'store_id': data['stores'][index % len(data['stores'])],
+                'quantity': 1,
+            }
+            events.append({**line, 'event_id': str(uuid.uuid4()), 'type': 'IN'})
+            events.append({**line, 'event_id': str(uuid.uuid4()), 'type': 'OUT'})
+        return {'events': events}
+    return [('POST', '/api/inventory/events/', batch)]
+
+
+# name: (builder, default concurrency)
+SCENARIOS = {
+    'catalog_browsing': (catalog_browsing, 32),
+    'hot_sku_transfers': (hot_sku_transfers, 16),
+    'alert_polling': (alert_polling, 16),
+    'inventory_dumps': (inventory_dumps, 4),
+    'pos_ingestion': (pos_ingestion, 4),
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def median_result(runs):
+    return {
+        metric: statistics.median(run[metric] for run in runs) if runs[0][metric] is not None else None
+        for metric in runs[0]
+    }
+
+
+async def run_scenarios(base_url, names, duration, warmup, repeat=3, concurrency=None):
+    data = await discover(base_url)
+    results = {}
+    for name in names:
+        build, default_concurrency = SCENARIOS[name]
+        clients = concurrency or default_concurrency
+        runs = [await run(base_url, build(data), clients, duration, warmup) for _ in range(repeat)]
+        result = median_result(runs)
+        results[name] = {'concurrency': clients, **result, 'runs': runs}
+        print(
+            f"{name:<20} {result['requests_per_sec']:8.1f} req/s  p50 {result['p50_ms'] or 0:8.1f} ms  "
+            f"p95 {result['p95_ms'] or 0:8.1f} ms  p99 {result['p99_ms'] or 0:8.1f} ms  "
+            f"errors {result['error_rate']:.2%}",
+            file=sys.stderr
+        )
+    return {
+        'revision': git_revision(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'base_url': base_url,
+        'duration': duration,
+        'warmup': warmup,
+        'repeat': repeat,
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns one row per compared metric: (scenario, metric, baseline,
+    # current, relative change, regressed). Scenarios missing from either
+    # side are skipped.
+    rows = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric in (*HIGHER_IS_BETTER, *LOWER_IS_BETTER, *REPORTED):
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if metric in HIGHER_IS_BETTER:
+                regressed = change < -tolerance
+            else:
+                regressed = metric in LOWER_IS_BETTER and change > tolerance
+            rows.append((name, metric, before, after, change, regressed))
+        before, after = previous.get('error_rate', 0), current.get('error_rate', 0)
+        rows.append((name, 'error_rate', before, after, after - before, after - before > ERROR_RATE_TOLERANCE))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'scenario':<20} {'metric':<17} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for name, metric, before, after, change, regressed in rows:
+        lines.append(
+            f'{name:<20} {metric:<17} {before:>10.2f} {after:>10.2f} {change:>+8.1%}'
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark scenarios against a seeded server')
+    parser.add_argument('base_url', help='e.g. http://localhost:8000')
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS, help='Scenario to run (repeatable, all by default)')
+    parser.add_argument('-c', '--concurrency', type=int, help="Requests kept in flight, instead of each scenario's default")
+    parser.add_argument('-d', '--duration', type=float, default=10, help='Seconds measured per run')
+    parser.add_argument('-w', '--warmup', type=float, default=2, help='Seconds run before measuring')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs per scenario; the median is reported')
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', help=f'Compare with this results file, e.g. {DEFAULT_BASELINE}')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Relative change allowed before a metric regresses')
+    args = parser.parse_args()
+
+    results = asyncio.run(run_scenarios(
+        args.base_url, args.scenario or list(SCENARIOS), args.duration, args.warmup, args.repeat, args.concurrency
+    ))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+            output.write('\n')
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            rows = compare(results, json.load(baseline), args.tolerance)
+        print(format_comparison(rows), file=sys.stderr)
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+
+# SERVER_MODE=asgi serves inventorymgmt.asgi (async read views) on uvicorn
+# workers; wsgi keeps the sync workers. See "Serving" in the README.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'inventorymgmt.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # A request waiting on Postgres doesn't hold an event loop, so one
+    # worker per core is enough; extra workers split keep-alive clients
+    # unevenly and lengthen the latency tail.
+    workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+else:
+    wsgi_app = 'inventorymgmt.wsgi:application'
+    worker_class = 'sync'
+    workers = int(os.getenv('WEB_CONCURRENCY', 3))
+
+
+def on_starting(server):
+    # Metrics files left by a previous run would be summed into this one.
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.db'):
+                os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import async_views, urls
+
+# The read endpoints with async views; every other route is the sync one.
+ASYNC_ROUTES = [
+    path('products/', async_views.product_list, name='product-list-create'),
+    path('stores/', async_views.store_list, name='store-list'),
+    path('stores/<uuid:store_id>/inventory/', async_views.store_inventory, name='store-inventory'),
+    path('inventory/alerts/', async_views.inventory_alerts, name='inventory-alerts'),
+]
+
+urlpatterns = ASYNC_ROUTES + [
+    pattern for pattern in urls.urlpatterns
+    if pattern.name not in {route.name for route in ASYNC_ROUTES}
+]
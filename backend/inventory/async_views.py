@@ -0,0 +1,207 @@
+from functools import wraps
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    MethodNotAllowed,
+    NotAuthenticated,
+    ValidationError
+)
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
+
+from . import views
+from .cache import cache_entry, cached_response, get_response_cache
+from .filters import InventoryAlertFilter, InventoryAlertPagination, StoreInventoryPagination
+from .models import Inventory, Store
+from .renderers import (
+    CSVRenderer,
+    FastJSONRenderer,
+    NDJSONRenderer,
+    astream_csv,
+    astream_ndjson,
+    fast_rendering_enabled
+)
+from .routers import reads_from_replica
+from .serializers import InventoryListSerializer
+
+# Async versions of the read endpoints, served by inventorymgmt.asgi_urls.
+# Queries go through the async ORM, so a request waiting on Postgres doesn't
+# hold a worker. Responses are the JSON the sync views render.
+
+EXPORT_STREAMS = {
+    NDJSONRenderer.format: astream_ndjson,
+    CSVRenderer.format: astream_csv,
+}
+EXPORT_RENDERERS = [JSONRenderer(), NDJSONRenderer(), CSVRenderer()]
+
+
+def _render(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type=JSONRenderer.media_type)
+
+
+async def _aiter_rows(queryset, chunk_size):
+    # QuerySet.aiterator() builds the values_list() iterator on the event
+    # loop, which already opens the cursor there and raises
+    # SynchronousOnlyOperation. The sync iterator is driven from the
+    # request's thread instead, one chunk per hop.
+    rows = queryset.iterator(chunk_size=chunk_size)
+    fetch = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await fetch():
+        for row in chunk:
+            yield row
+
+
+def _check_access(api_view, request):
+    # What APIView.initial() enforces before a handler runs. Authenticators
+    # and throttles may query the database or the cache, so this runs in
+    # the request's thread.
+    api_view.perform_authentication(request)
+    api_view.check_permissions(request)
+    api_view.check_throttles(request)
+
+
+def _error_response(api_view, request, exc):
+    # As APIView.handle_exception() and DRF's exception handler: 401 only
+    # when an authenticator can send a challenge, 403 otherwise.
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = _render(data, status=exc.status_code)
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        header = api_view.get_authenticate_header(request)
+        if header:
+            response['WWW-Authenticate'] = header
+        else:
+            response.status_code = 403
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+def async_api_view(fallback=None, view_class=APIView):
+    # Async counterpart of @api_view(['GET']): the view gets a DRF Request
+    # (query_params, content negotiation), authentication, permissions and
+    # throttles are checked with `view_class`'s policies (those of the sync
+    # view it mirrors), and API exceptions become the usual JSON errors.
+    # The view instance is in request.parser_context['view']. Other methods
+    # go to the sync `fallback` view.
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                if fallback is not None:
+                    return await sync_to_async(fallback)(request, *args, **kwargs)
+                return _render({'detail': MethodNotAllowed(request.method).detail}, status=405)
+            api_view = view_class(args=args, kwargs=kwargs, format_kwarg=None)
+            request = api_view.request = api_view.initialize_request(request, *args, **kwargs)
+            try:
+                await sync_to_async(_check_access)(api_view, request)
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                return _error_response(api_view, request, exc)
+        return wrapper
+    return decorator
+
+
+async def _cached(view, request, build):
+    response_cache = get_response_cache()
+    if (
+        not response_cache.enabled
+        or getattr(request, 'pinned_to_primary', False)
+        or any(param in request.query_params for param in view.cache_bypass_params)
+    ):
+        return _render(await build())
+
+    # Keyed like CachedResponseMixin, so both paths share entries.
+    request.accepted_media_type = JSONRenderer.media_type
+    key = await response_cache.arun(response_cache.key_for, view.cache_namespace, request)
+    if key is None:
+        return _render(await build())
+    entry = await response_cache.arun(response_cache.get, key)
+    if entry is None:
+        entry = cache_entry(FastJSONRenderer().render(await build()), JSONRenderer.media_type)
+        await response_cache.arun(response_cache.set, key, entry)
+    return cached_response(request, entry)
+
+
+def async_list_view(view_class):
+    # Serves GET for a generic list view from the view's own configuration:
+    # queryset, filter backends, paginator, serializer and response cache.
+    async def list_view(request, *args, **kwargs):
+        view = request.parser_context['view']
+
+        async def build():
+            queryset = view.get_queryset()
+            # Filter backends only build the queryset, without queries.
+            for backend in view.filter_backends:
+                queryset = backend().filter_queryset(request, queryset, view)
+            layout = view.get_values_layout() if hasattr(view, 'get_values_layout') else None
+            if layout is not None:
+                serializer_class = view.get_serializer_class()
+                queryset = serializer_class.values_queryset(queryset, layout)
+                page = await view.paginator.apaginate_queryset(queryset, request, view)
+                return view.get_paginated_response(serializer_class.from_values(page, layout)).data
+            page = await view.paginator.apaginate_queryset(queryset, request, view)
+            return view.get_paginated_response(view.get_serializer(page, many=True).data).data
+
+        return await _cached(view, request, build)
+
+    list_view.__name__ = view_class.__name__
+    view = async_api_view(fallback=view_class.as_view(), view_class=view_class)(list_view)
+    view.read_replica = getattr(view_class, 'read_replica', False)
+    return view
+
+
+product_list = async_list_view(views.ProductListCreateAPIView)
+store_list = async_list_view(views.StoreListAPIView)
+
+
+async def _inventory_page(request, queryset, paginator):
+    # Same as views._inventory_page, with the async ORM.
+    options = InventoryListSerializer.get_options(request.query_params)
+    if fast_rendering_enabled():
+        layout = InventoryListSerializer.values_layout(**options)
+        page = await paginator.apaginate_queryset(InventoryListSerializer.values_queryset(queryset, layout), request)
+        return paginator.get_paginated_response(InventoryListSerializer.from_values(page, layout)).data
+    page = await paginator.apaginate_queryset(InventoryListSerializer.prepare_queryset(queryset, **options), request)
+    serializer = InventoryListSerializer(page, many=True, **options)
+    return paginator.get_paginated_response(serializer.data).data
+
+
+@reads_from_replica
+@async_api_view(view_class=views.store_inventory.cls)
+async def store_inventory(request, store_id):
+    if not await Store.objects.filter(pk=store_id).aexists():
+        return _render({'error': 'Store not found'}, status=404)
+
+    inventory = Inventory.objects.filter(store_id=store_id)
+
+    renderer, _ = DefaultContentNegotiation().select_renderer(request, EXPORT_RENDERERS)
+    stream = EXPORT_STREAMS.get(renderer.format)
+    if stream is not None:
+        rows = _aiter_rows(inventory.order_by('product_id').values_list(
+            'id', 'quantity', 'minStock', 'product_id', 'store_id'
+        ), views.EXPORT_CHUNK_SIZE)
+        return StreamingHttpResponse(
+            stream(views.INVENTORY_EXPORT_FIELDS, rows),
+            content_type=renderer.media_type
+        )
+
+    return _render(await _inventory_page(request, inventory, StoreInventoryPagination()))
+
+
+@reads_from_replica
+@async_api_view(view_class=views.inventory_alerts.cls)
+async def inventory_alerts(request):
+    low_stock_items = Inventory.objects.filter(quantity__lt=F('minStock'))
+    filterset = InventoryAlertFilter(request.query_params, queryset=low_stock_items)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+
+    return _render(await _inventory_page(request, filterset.qs, InventoryAlertPagination()))
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.response import Response
+
+from .routers import get_replica_settings, reading_from_replica
+
+PRODUCTS = 'products'
+STORES = 'stores'
+REPLENISHMENT = 'replenishment'
+
+DEFAULTS = {
+    'BACKEND': 'lru',
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 60,
+    'KEY_PREFIX': 'inventory:response',
+}
+
+
+def _new_version(current=0):
+    # Versions are the time of the last bump (see ResponseCache.key_for). A
+    # missing one (first use, or evicted from a shared cache) also restarts
+    # from the clock, so it can never come back to a value already used.
+    return max(time.time_ns(), current + 1)
+
+
+class LRUBackend:
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_version(self, namespace):
+        with self._lock:
+            return self._versions.setdefault(namespace, _new_version())
+
+    def bump_version(self, namespace):
+        with self._lock:
+            self._versions[namespace] = _new_version(self._versions.get(namespace, 0))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias, timeout, key_prefix):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def version_key(self, namespace):
+        return f'{self.key_prefix}:version:{namespace}'
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def get_version(self, namespace):
+        version_key = self.version_key(namespace)
+        version = self.cache.get(version_key)
+        if version is None:
+            self.cache.add(version_key, _new_version(), None)
+            version = self.cache.get(version_key)
+        return version
+
+    def bump_version(self, namespace):
+        # Not atomic, but concurrent bumps each leave a new value.
+        version_key = self.version_key(namespace)
+        self.cache.set(version_key, _new_version(self.cache.get(version_key) or 0), None)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResponseCache:
+    def __init__(self, options):
+        self.key_prefix = options['KEY_PREFIX']
+        if options['BACKEND'] == 'lru':
+            self.backend = LRUBackend(options['MAX_ENTRIES'], options['TIMEOUT'])
+        elif options['BACKEND'] == 'django':
+            self.backend = DjangoCacheBackend(options['CACHE_ALIAS'], options['TIMEOUT'], self.key_prefix)
+        else:
+            self.backend = None
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def key_for(self, namespace, request):
+        # Blank parameters are dropped and the rest sorted, so equivalent
+        # query strings share one entry.
+        params = sorted(
+            (name, value)
+            for name in request.query_params
+            for value in request.query_params.getlist(name)
+            if value != ''
+        )
+        return self.key_for_values(namespace, [request.path, request.accepted_media_type, params])
+
+    def key_for_values(self, namespace, values):
+        # None when the response must not be cached: a replica may not have
+        # replayed the write behind a bump yet, so for as long as a client
+        # stays pinned to the primary after a write, what replicas return
+        # isn't stored.
+        version = self.backend.get_version(namespace)
+        if reading_from_replica() and time.time_ns() - version < get_replica_settings()['PIN_SECONDS'] * 10**9:
+            return None
+        digest = hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+        return f'{self.key_prefix}:{namespace}:{version}:{digest}'
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    async def arun(self, method, *args):
+        # For async views: the in-process LRU never blocks, a shared backend
+        # does network I/O and is called from a worker thread.
+        if isinstance(self.backend, LRUBackend):
+            return method(*args)
+        return await sync_to_async(method)(*args)
+
+    def invalidate(self, *namespaces):
+        # Once the write commits: a read in between would still see the old
+        # rows and cache them under the new version.
+        if self.enabled:
+            transaction.on_commit(lambda: self._bump(namespaces))
+
+    def _bump(self, namespaces):
+        for namespace in namespaces:
+            self.backend.bump_version(namespace)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache({**DEFAULTS, **getattr(settings, 'INVENTORY_RESPONSE_CACHE', {})})
+    return _response_cache
+
+
+@receiver(setting_changed)
+def _reset_response_cache(setting, **kwargs):
+    global _response_cache
+    if setting == 'INVENTORY_RESPONSE_CACHE':
+        _response_cache = None
+
+
+def _etag_matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    return etag in [tag.strip() for tag in header.split(',')] or header.strip() == '*'
+
+
+def cache_entry(content, content_type):
+    etag = '"%s"' % hashlib.md5(content).hexdigest()
+    return etag, content, content_type
+
+
+def cached_response(request, entry):
+    etag, content, content_type = entry
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    return response
+
+
+class CachedResponseMixin:
+    # Read-through cache for GET on generic views. Entries are keyed on the
+    # namespace version, so writes invalidate by bumping it (see signals).
+    cache_namespace = None
+    cache_bypass_params = ()
+
+    def get(self, request, *args, **kwargs):
+        self.cache_key = None
+        response_cache = get_response_cache()
+        cacheable = (
+            response_cache.enabled
+            and request.accepted_renderer.format == 'json'
+            and not getattr(request, 'pinned_to_primary', False)
+            and not any(param in request.query_params for param in self.cache_bypass_params)
+        )
+        if not cacheable:
+            return super().get(request, *args, **kwargs)
+
+        self.cache_key = response_cache.key_for(self.cache_namespace, request)
+        entry = None if self.cache_key is None else response_cache.get(self.cache_key)
+        if entry is None:
+            return super().get(request, *args, **kwargs)
+        return cached_response(request, entry)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'cache_key', None) is None:
+            return response
+        if not isinstance(response, Response) or response.status_code != 200:
+            return response
+
+        response.render()
+        entry = cache_entry(response.content, response['Content-Type'])
+        get_response_cache().set(self.cache_key, entry)
+        etag = entry[0]
+        if _etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
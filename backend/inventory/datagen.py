@@ -0,0 +1,153 @@
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    Inventory,
+    Movement,
+    Product,
+    Store,
+    MOVEMENT_IN,
+    MOVEMENT_OUT,
+    MOVEMENT_TRANSFER
+)
+
+CATEGORIES = (
+    'Books', 'Electronics', 'Garden', 'Grocery', 'Health',
+    'Home', 'Kitchen', 'Office', 'Sports', 'Toys',
+)
+ADJECTIVES = (
+    'Classic', 'Compact', 'Deluxe', 'Eco', 'Essential', 'Heavy-Duty',
+    'Lightweight', 'Modern', 'Portable', 'Premium', 'Smart', 'Vintage',
+)
+MATERIALS = (
+    'Aluminium', 'Bamboo', 'Canvas', 'Ceramic', 'Cotton', 'Glass',
+    'Leather', 'Oak', 'Plastic', 'Rubber', 'Steel', 'Wool',
+)
+NOUNS = (
+    'Backpack', 'Blender', 'Bottle', 'Chair', 'Desk Lamp', 'Headphones',
+    'Jacket', 'Kettle', 'Notebook', 'Planter', 'Speaker', 'Toolkit',
+)
+MIN_STOCK_LEVELS = (5, 10, 15, 20)
+# OUT is the most common event, IN restocks and TRANSFER rebalances stores.
+MOVEMENT_KINDS = (MOVEMENT_OUT, MOVEMENT_IN, MOVEMENT_TRANSFER)
+MOVEMENT_WEIGHTS = (6, 3, 1)
+
+
+def _rng(seed, *scope):
+    # Every block of rows gets its own generator derived from the seed and
+    # the block's position, so the output doesn't depend on how the work is
+    # split between processes.
+    return random.Random(':'.join(str(part) for part in (seed, *scope)))
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def copy_rows(model, fields, rows):
+    # COPY skips per-statement parsing and planning entirely; row triggers
+    # (the stock rollup) still fire as they would for INSERT.
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+    sql = f'COPY {model._meta.db_table} ({columns}) FROM STDIN'
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        with cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def store_rows(seed, count, faker):
+    rng = _rng(seed, 'stores')
+    faker.seed_instance(seed)
+    for index in range(count):
+        yield (
+            _uuid(rng),
+            f'{faker.company()} #{seed}-{index + 1}',
+            faker.address(),
+            faker.city(),
+            True
+        )
+
+
+def product_rows(seed, start, stop):
+    rng = _rng(seed, 'products', start)
+    for index in range(start, stop):
+        category = rng.choice(CATEGORIES)
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(MATERIALS)} {rng.choice(NOUNS)}'
+        yield (
+            _uuid(rng),
+            name,
+            f'{name} from the {category.lower()} range.',
+            category,
+            Decimal(rng.randint(100, 50000)) / 100,
+            f'{category[:3].upper()}-{seed}-{index:07d}'
+        )
+
+
+def stock_rows(seed, start, product_ids, store_ids, movements, days, now):
+    # Each product starts every store with opening stock, then plays
+    # `movements` random events over the last `days` days. Quantities are
+    # carried forward so stock never goes negative and the final Inventory
+    # equals opening stock plus the generated ledger.
+    rng = _rng(seed, 'stock', start)
+    window = timedelta(days=days).total_seconds()
+    inventory, ledger = [], []
+    for product_id in product_ids:
+        balances = [rng.randint(10, 100) for _ in store_ids]
+        offsets = sorted(rng.random() * window for _ in range(movements))
+        for offset in offsets:
+            timestamp = now - timedelta(seconds=window - offset)
+            kind = rng.choices(MOVEMENT_KINDS, MOVEMENT_WEIGHTS)[0]
+            store = rng.randrange(len(store_ids))
+            if kind == MOVEMENT_IN:
+                quantity = rng.randint(10, 50)
+                balances[store] += quantity
+                ledger.append((_uuid(rng), product_id, None, store_ids[store], quantity, timestamp, kind))
+                continue
+            if not balances[store]:
+                continue
+            quantity = rng.randint(1, min(balances[store], 10))
+            balances[store] -= quantity
+            if kind == MOVEMENT_OUT or len(store_ids) < 2:
+                ledger.append((_uuid(rng), product_id, store_ids[store], None, quantity, timestamp, MOVEMENT_OUT))
+                continue
+            target = rng.randrange(len(store_ids) - 1)
+            target += target >= store
+            balances[target] += quantity
+            ledger.append((_uuid(rng), product_id, store_ids[store], store_ids[target], quantity, timestamp, kind))
+        for store, quantity in enumerate(balances):
+            inventory.append((_uuid(rng), product_id, store_ids[store], quantity, rng.choice(MIN_STOCK_LEVELS)))
+    return inventory, ledger
+
+
+PRODUCT_FIELDS = ('id', 'name', 'description', 'category', 'price', 'sku')
+STORE_FIELDS = ('id', 'name', 'address', 'city', 'is_active')
+INVENTORY_FIELDS = ('id', 'product', 'store', 'quantity', 'minStock')
+MOVEMENT_FIELDS = ('id', 'product', 'sourceStore', 'targetStore', 'quantity', 'timestamp', 'type')
+
+
+def load_stores(seed, count, faker):
+    rows = list(store_rows(seed, count, faker))
+    with transaction.atomic():
+        copy_rows(Store, STORE_FIELDS, rows)
+    return [row[0] for row in rows]
+
+
+def load_products(seed, start, stop, store_ids, movements=0, days=90, now=None):
+    # One transaction per block keeps the rollup's staging table and the
+    # memory held here bounded by the block size, whatever the total.
+    products = list(product_rows(seed, start, stop))
+    inventory, ledger = stock_rows(
+        seed, start, [row[0] for row in products], store_ids,
+        movements, days, now or timezone.now()
+    )
+    with transaction.atomic():
+        copy_rows(Product, PRODUCT_FIELDS, products)
+        copy_rows(Inventory, INVENTORY_FIELDS, inventory)
+        copy_rows(Movement, MOVEMENT_FIELDS, ledger)
+    return len(products), len(inventory), len(ledger)
+
@@ -1,7 +1,92 @@
+import base64
+import binascii
+import json
+import operator
+from functools import reduce
+
 import django_filters
-from rest_framework.pagination import PageNumberPagination
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, InvalidPage, Page, PageNotAnInteger, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Case, Exists, F, FloatField, Q, When
+from django.db.models.functions import Cast
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import MOVEMENT_TYPE_CHOICES, SEARCH_CONFIG, Inventory, Movement, Product
+
+# The relevance annotation of ProductSearchFilter.
+SEARCH_RANK = 'search_rank'
+
+
+def estimate_count(queryset):
+    # Planner estimates instead of COUNT(*): pg_class.reltuples for a whole
+    # table, the EXPLAIN row estimate once filters are applied.
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            estimate = cursor.fetchone()[0]
+        # reltuples is -1 (or 0) until the table is first vacuumed/analyzed.
+        return estimate if estimate > 0 else queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+aestimate_count = sync_to_async(estimate_count)
+
+
+class EstimatedCountPage(Page):
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
 
-from .models import Product
+    def has_next(self):
+        return self.more
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    # The planner estimate is only reported as the count. Pages are cut from
+    # the rows themselves, one past the page telling whether there is a next
+    # one, so a low estimate neither hides pages nor truncates them.
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page_rows(self, number):
+        bottom = (number - 1) * self.per_page
+        return self.object_list[bottom:bottom + self.per_page + 1]
+
+    def page(self, number):
+        number = self.validate_number(number)
+        return self.page_of(number, list(self.page_rows(number)))
+
+    def page_of(self, number, rows):
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        return EstimatedCountPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
 
 
 class StandardPagination(PageNumberPagination):
@@ -10,18 +95,331 @@ class StandardPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class KeysetPagination(BasePagination):
+    # Seeks past the last row of the previous page with a row comparison on
+    # the ordering columns, so every page costs the same as the first one.
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view, queryset):
+        ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        # Search results page by relevance; the rank leads the keyset.
+        if SEARCH_RANK in queryset.query.annotations:
+            ordering = (f'-{SEARCH_RANK}', *ordering)
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursors come from get_position(), one string per column; anything
+        # that doesn't parse as its column's type was edited.
+        if not all(isinstance(value, str) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                self.get_cursor_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_position(self, row):
+        # Rows are model instances, or dicts on the fast rendering path.
+        if isinstance(row, dict):
+            return [str(row[field.lstrip('-')]) for field in self.ordering]
+        return [str(getattr(row, field.lstrip('-'))) for field in self.ordering]
+
+    def seek(self, queryset, position):
+        # The bound on the leading column is implied by the OR below, but
+        # spelling it out lets Postgres start the index scan at the cursor.
+        leading = self.ordering[0]
+        bound = 'lte' if leading.startswith('-') else 'gte'
+        queryset = queryset.filter(**{f'{leading.lstrip("-")}__{bound}': position[0]})
+
+        clauses = []
+        for index, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions = {
+                previous.lstrip('-'): value
+                for previous, value in zip(self.ordering[:index], position)
+            }
+            conditions[f'{field.lstrip("-")}__{lookup}'] = position[index]
+            clauses.append(Q(**conditions))
+        return queryset.filter(reduce(operator.or_, clauses))
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view, queryset)
+        self.current_page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = self.seek(queryset, position)
+        return queryset[:self.current_page_size + 1]
+
+    def get_page_rows(self, rows):
+        self.has_next = len(rows) > self.current_page_size
+        rows = rows[:self.current_page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        rows = list(self.get_page_queryset(queryset, request, view))
+        return self.get_page_rows(rows)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        rows = [row async for row in self.get_page_queryset(queryset, request, view)]
+        return self.get_page_rows(rows)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CatalogKeysetPagination(KeysetPagination):
+    page_size = StandardPagination.page_size
+    max_page_size = StandardPagination.max_page_size
+
+
+class CatalogPagination(StandardPagination):
+    # Page numbers by default; ?pagination=cursor (or following a cursor link)
+    # switches to keyset paging on the view's keyset_ordering. ?count=approx
+    # replaces COUNT(*) with a planner estimate, ?count=none skips it.
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+
+    def get_count_mode(self, request, default):
+        mode = request.query_params.get(self.count_query_param, default)
+        return mode if mode in ('exact', 'approx', 'none') else default
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = CatalogKeysetPagination()
+            self.display_page_controls = False
+            count_mode = self.get_count_mode(request, 'none')
+            self.keyset_count = None
+            if count_mode == 'exact':
+                self.keyset_count = queryset.count()
+            elif count_mode == 'approx':
+                self.keyset_count = estimate_count(queryset)
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        if self.use_estimate(request):
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def use_estimate(self, request):
+        # The last page can't be found from an estimate, so ?page=last
+        # counts the rows.
+        return (
+            self.get_count_mode(request, 'exact') == 'approx'
+            and request.query_params.get(self.page_query_param) not in self.last_page_strings
+        )
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same pages as paginate_queryset; the count and the page rows are
+        # fetched with the async ORM and handed to the Django paginator, so
+        # it never queries by itself.
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = CatalogKeysetPagination()
+            self.display_page_controls = False
+            count_mode = self.get_count_mode(request, 'none')
+            self.keyset_count = None
+            if count_mode == 'exact':
+                self.keyset_count = await queryset.acount()
+            elif count_mode == 'approx':
+                self.keyset_count = await aestimate_count(queryset)
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+
+        self.request = request
+        if self.use_estimate(request):
+            paginator = EstimatedCountPaginator(queryset, self.get_page_size(request))
+            paginator.count = await aestimate_count(queryset)
+        else:
+            paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+            paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            if isinstance(paginator, EstimatedCountPaginator):
+                number = paginator.validate_number(page_number)
+                rows = [row async for row in paginator.page_rows(number)]
+                self.page = paginator.page_of(number, rows)
+            else:
+                self.page = paginator.page(page_number)
+                self.page.object_list = [row async for row in self.page.object_list]
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        response = self.keyset.get_paginated_response(data)
+        if self.keyset_count is not None:
+            response.data = {'count': self.keyset_count, **response.data}
+        return response
+
+
+class StoreInventoryPagination(KeysetPagination):
+    ordering = ('product_id',)
+
+
+class InventoryAlertPagination(KeysetPagination):
+    ordering = ('store_id', 'product_id')
+
+
+class MovementPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
 class ProductFilter(django_filters.FilterSet):
     price_min = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
     price_max = django_filters.NumberFilter(field_name="price", lookup_expr='lte')
     category = django_filters.CharFilter(field_name="category", lookup_expr='iexact')
     has_stock = django_filters.BooleanFilter(method='filter_has_stock')
+    min_total_stock = django_filters.NumberFilter(field_name="stock__total_quantity", lookup_expr='gte')
+    max_total_stock = django_filters.NumberFilter(field_name="stock__total_quantity", lookup_expr='lte')
 
     def filter_has_stock(self, queryset, name, value):
+        # Reads the ProductStock rollup, a one-to-one join, instead of
+        # joining every inventory row and de-duplicating.
         if value:
-            return queryset.filter(products_inventory__quantity__gt=0).distinct()
+            return queryset.filter(stock__stores_in_stock__gt=0)
         else:
-            return queryset.exclude(products_inventory__quantity__gt=0).distinct()
+            return queryset.filter(Q(stock__isnull=True) | Q(stock__stores_in_stock__lte=0))
 
     class Meta:
         model = Product
-        fields = ['category', 'price_min', 'price_max']
\ No newline at end of file
+        fields = ['category', 'price_min', 'price_max']
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    # Full-text search over name, sku and description (each term matched as a
+    # prefix) through the search_vector GIN index, ranked with ts_rank. Only
+    # when that finds nothing does it fall back to trigram word similarity on
+    # name, which tolerates typos but is much less selective.
+    search_param = 'search'
+    search_title = 'Search'
+    search_description = 'Search products by name, SKU or description.'
+
+    def get_search_terms(self, request):
+        value = request.query_params.get(self.search_param, '')
+        return ''.join(char if char.isalnum() else ' ' for char in value).split()
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        text = ' '.join(terms)
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            search_type='raw',
+            config=SEARCH_CONFIG
+        )
+        matching = Q(search_vector=query) | Q(sku__istartswith=request.query_params[self.search_param].strip())
+        matches = queryset.filter(matching)
+        # One query for both cases: the trigram side of the union only runs
+        # (a one-time filter in the plan) when there is no full-text match,
+        # and a row's rank follows the side it can come from.
+        similar = queryset.filter(name__trigram_word_similar=text).exclude(Exists(matches))
+        return queryset.filter(
+            pk__in=matches.values('pk').union(similar.values('pk'), all=True)
+        ).annotate(**{
+            # Both ranks are reals; as doubles they survive the round trip
+            # through a keyset cursor exactly.
+            SEARCH_RANK: Cast(Case(
+                When(matching, then=SearchRank(F('search_vector'), query)),
+                default=TrigramWordSimilarity(text, 'name'),
+            ), FloatField())
+        }).order_by(f'-{SEARCH_RANK}', 'name', 'id')
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': self.search_description,
+            'schema': {'type': 'string'},
+        }]
+
+
+class InventoryAlertFilter(django_filters.FilterSet):
+    store = django_filters.UUIDFilter(field_name='store_id')
+    city = django_filters.CharFilter(field_name='store__city', lookup_expr='iexact')
+    category = django_filters.CharFilter(field_name='product__category', lookup_expr='iexact')
+
+    class Meta:
+        model = Inventory
+        fields = ['store', 'city', 'category']
+
+
+class MovementFilter(django_filters.FilterSet):
+    # since/until bound the timestamp so only the matching monthly
+    # partitions are scanned.
+    product = django_filters.UUIDFilter(field_name='product_id')
+    store = django_filters.UUIDFilter(method='filter_store')
+    source_store = django_filters.UUIDFilter(field_name='sourceStore_id')
+    target_store = django_filters.UUIDFilter(field_name='targetStore_id')
+    type = django_filters.ChoiceFilter(choices=MOVEMENT_TYPE_CHOICES)
+    since = django_filters.DateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    until = django_filters.DateTimeFilter(field_name='timestamp', lookup_expr='lt')
+
+    def filter_store(self, queryset, name, value):
+        return queryset.filter(Q(sourceStore_id=value) | Q(targetStore_id=value))
+
+    class Meta:
+        model = Movement
+        fields = ['product', 'store', 'source_store', 'target_store', 'type', 'since', 'until']
@@ -0,0 +1,57 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils import encoders
+
+from inventory.parsers import iter_csv, iter_ndjson
+from inventory.services import IMPORT_CHUNK_SIZE, import_products
+
+READERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+
+
+class Command(BaseCommand):
+    help = 'Create or update products by SKU from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin')
+        parser.add_argument('--format', choices=READERS, help='Input format (defaults to the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows validated and written per batch')
+        parser.add_argument('--errors', help='Write the per-row error report to this file as NDJSON')
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        input_format = kwargs['format'] or path.rpartition('.')[2].lower()
+        if input_format not in READERS:
+            raise CommandError('Cannot tell the input format, pass --format csv or --format ndjson.')
+        if kwargs['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        started = time.perf_counter()
+        if path == '-':
+            report = import_products(READERS[input_format](sys.stdin), kwargs['chunk_size'])
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as source:
+                    report = import_products(READERS[input_format](source), kwargs['chunk_size'])
+            except OSError as e:
+                raise CommandError(e)
+        elapsed = time.perf_counter() - started
+
+        if kwargs['errors']:
+            with open(kwargs['errors'], 'w', encoding='utf-8') as target:
+                for error in report['errors']:
+                    target.write(json.dumps(error, cls=encoders.JSONEncoder) + '\n')
+        else:
+            for error in report['errors']:
+                self.stderr.write(json.dumps(error, cls=encoders.JSONEncoder))
+
+        rate = report['rows'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['rows']} rows in {elapsed:.2f}s ({rate:.0f} rows/sec): "
+            f"{report['created']} created, {report['updated']} updated, {report['failed']} failed."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.partitions import (
+    AHEAD_MONTHS,
+    HOT_MONTHS,
+    compact_partitions,
+    ensure_partitions,
+    expire_partitions,
+    partition_name
+)
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming Movement partitions, compact old ones and roll up expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=AHEAD_MONTHS, help='Months to create past the current one')
+        parser.add_argument('--hot-months', type=int, default=HOT_MONTHS, help='Recent months that keep a B-tree on time')
+        parser.add_argument('--retain-months', type=int, help='Months kept before the current one; older partitions are rolled up and detached')
+        parser.add_argument('--drop', action='store_true', help='Drop expired partitions after detaching them')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['ahead'] < 0 or kwargs['hot_months'] < 1:
+            raise CommandError('--ahead must not be negative and --hot-months must be positive.')
+        if kwargs['retain_months'] is not None and kwargs['retain_months'] < kwargs['hot_months']:
+            raise CommandError('--retain-months must be at least --hot-months.')
+
+        for month in ensure_partitions(ahead=kwargs['ahead'], hot_months=kwargs['hot_months']):
+            self.stdout.write(f"Created {partition_name(month)}")
+        for month in compact_partitions(kwargs['hot_months']):
+            self.stdout.write(f"Compacted {partition_name(month)} to BRIN only")
+        if kwargs['retain_months'] is not None:
+            expired = expire_partitions(kwargs['retain_months'], drop=kwargs['drop'])
+            action = 'dropped' if kwargs['drop'] else 'detached'
+            for month, rows in expired.items():
+                self.stdout.write(f"Rolled up {partition_name(month)} into {rows} daily rows and {action} it")
+        self.stdout.write(self.style.SUCCESS("Movement partitions are up to date."))
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from inventory import services
+from inventory.replenishment import PLAN_BATCH_SIZE, plan_replenishment
+
+
+class Command(BaseCommand):
+    help = 'Plan transfers from stores above their minimum stock to stores below it, preferring the same city'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help='Only products of this category')
+        parser.add_argument('--city', help='Only stores in this city')
+        parser.add_argument('--output', help='Write the plan as JSON ({"lines": [...]}) to this file')
+        parser.add_argument('--apply', action='store_true', help=f'Submit the plan as batch transfers of {PLAN_BATCH_SIZE} lines')
+
+    def handle(self, *args, **kwargs):
+        plan = plan_replenishment(category=kwargs['category'], city=kwargs['city'])
+        self.stdout.write(
+            f"{plan['transfers']} transfers moving {plan['quantity']} units "
+            f"({plan['same_city_quantity']} within a city); {plan['unmet_quantity']} units short remain uncovered."
+        )
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as output:
+                json.dump({'lines': plan['lines']}, output, cls=DjangoJSONEncoder)
+
+        if kwargs['apply']:
+            # Stock may have moved since the plan was made, so each batch
+            # applies the lines that still fit and reports the others.
+            transferred = failed = 0
+            lines = plan['lines']
+            for start in range(0, len(lines), PLAN_BATCH_SIZE):
+                report = services.transfer_stock_batch(lines[start:start + PLAN_BATCH_SIZE], atomic=False)
+                transferred += report['transferred']
+                failed += report['failed']
+            self.stdout.write(self.style.SUCCESS(f"Applied {transferred} transfers, {failed} failed."))
@@ -1,17 +1,17 @@
 import random
-import requests
-from django.core.management.base import BaseCommand
-from django.db import transaction
+import time
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections
+from django.utils import timezone
 from faker import Faker
-from itertools import chain
-from math import floor
 
-from inventory.utils import generate_unique_sku
-from inventory.models import (
-    Inventory,
-    Product,
-    Store
-)
+from inventory.cache import PRODUCTS, STORES, get_response_cache
+from inventory.datagen import load_products, load_stores
+from inventory.partitions import ensure_partitions
 
 
 class Command(BaseCommand):
@@ -20,52 +20,76 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('num_products', type=int, help='Number of products to create')
         parser.add_argument('num_stores', type=int, help='Number of stores to create')
+        parser.add_argument('--seed', type=int, help='Seed for reproducible data (random if omitted)')
+        parser.add_argument('--movements', type=int, default=0, help='Movements to generate per product')
+        parser.add_argument('--days', type=int, default=90, help='Days of movement history')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Inventory rows written per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Processes loading products in parallel')
 
-    @transaction.atomic
     def handle(self, *args, **kwargs):
         num_products = kwargs['num_products']
         num_stores = kwargs['num_stores']
-        fake = Faker()
+        seed = kwargs['seed'] if kwargs['seed'] is not None else random.randrange(1_000_000)
+        if min(num_products, num_stores, kwargs['movements']) < 0 or kwargs['days'] < 1:
+            raise CommandError('Counts must not be negative and --days must be positive.')
+        if kwargs['chunk_size'] < 1 or kwargs['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive.')
 
-        self.stdout.write("Creating data...")
+        self.stdout.write(f"Creating data with seed {seed}...")
+        started = time.perf_counter()
 
-        stores_to_create = [
-            Store(
-                name=fake.unique.company(),
-                address=fake.address(),
-                city=fake.city()
-            ) for _ in range(num_stores)
-        ]
-        new_stores = Store.objects.bulk_create(stores_to_create)
+        try:
+            store_ids = load_stores(seed, num_stores, Faker())
+        except IntegrityError:
+            raise CommandError(f'Data for seed {seed} is already loaded, pass another --seed.')
         self.stdout.write(self.style.SUCCESS(f"Successfully created {num_stores} stores."))
 
-        response = requests.get('https://fakestoreapi.com/products')
-        fake_products = response.json()[:num_products]
-
-        products_to_create = [
-            Product(
-                name=item['title'],
-                description=item['description'],
-                category=item['category'],
-                price=item['price'],
-                sku=generate_unique_sku(product=item,faker=fake)
-            ) for item in fake_products
+        # Blocks are sized so each transaction writes about chunk_size
+        # inventory rows, and only one block is held in memory per process.
+        block = max(1, kwargs['chunk_size'] // max(num_stores, 1))
+        now = timezone.now()
+        # The history gets monthly partitions of its own instead of piling
+        # into the default partition.
+        ensure_partitions(since=now - timedelta(days=kwargs['days']))
+        blocks = [
+            (seed, start, min(start + block, num_products), store_ids,
+             kwargs['movements'], kwargs['days'], now)
+            for start in range(0, num_products, block)
         ]
-        new_products = Product.objects.bulk_create(products_to_create)
-        self.stdout.write(self.style.SUCCESS(f"Successfully created {num_products} products."))
+        try:
+            totals = self.load(blocks, kwargs['workers'])
+        except IntegrityError:
+            raise CommandError(f'Data for seed {seed} is already loaded, pass another --seed.')
+        finally:
+            # COPY sends no model signals, so cached catalog pages are
+            # dropped here.
+            get_response_cache().invalidate(PRODUCTS, STORES)
 
-        inventory_by_store = [
-            [
-                Inventory(
-                    product=new_product,
-                    store=new_store,
-                    quantity=floor(random.uniform(10.0, 101.0)),
-                    minStock=random.choice([5, 10, 15, 20])
-                )
-                for new_product in new_products
-            ] for new_store in new_stores
-        ]
-        inventory_iterator = chain.from_iterable(inventory_by_store)
-        inventory_to_create = list(inventory_iterator)
-        Inventory.objects.bulk_create(inventory_to_create)
-        self.stdout.write(self.style.SUCCESS(f"Successfully created {num_products * num_stores} inventory items."))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Successfully created {totals[0]} products."))
+        self.stdout.write(self.style.SUCCESS(f"Successfully created {totals[1]} inventory items."))
+        self.stdout.write(self.style.SUCCESS(f"Successfully created {totals[2]} movements."))
+        self.stdout.write(f"Loaded in {elapsed:.1f}s ({sum(totals) / elapsed:.0f} rows/sec).")
+
+    def load(self, blocks, workers):
+        totals = [0, 0, 0]
+        if workers == 1:
+            for args in blocks:
+                self.add(totals, load_products(*args))
+            return totals
+
+        # Children must open their own connections rather than share the
+        # parent's socket (or its pool's threads), so they are closed before
+        # forking.
+        connections.close_all()
+        for connection in connections.all(initialized_only=True):
+            if getattr(connection, 'pool', None) is not None:
+                connection.close_pool()
+        with ProcessPoolExecutor(workers, mp_context=get_context('fork')) as pool:
+            for future in as_completed([pool.submit(load_products, *args) for args in blocks]):
+                self.add(totals, future.result())
+        return totals
+
+    def add(self, totals, counts):
+        for index, count in enumerate(counts):
+            totals[index] += count
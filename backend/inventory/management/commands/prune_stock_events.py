@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.services import STOCK_EVENT_RETENTION, prune_stock_events
+
+
+class Command(BaseCommand):
+    help = 'Forget POS event ids older than the retention; retries of those events are no longer deduplicated'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=STOCK_EVENT_RETENTION.days, help='Days an event id is kept')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['days'] < 1:
+            raise CommandError('--days must be positive.')
+        deleted = prune_stock_events(timedelta(days=kwargs['days']))
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} event ids."))
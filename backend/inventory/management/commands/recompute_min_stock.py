@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.reorder import ReorderRunInProgress, recompute_min_stock
+
+
+class Command(BaseCommand):
+    help = 'Recompute minStock reorder points from the OUT and TRANSFER movements since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild the demand window and rewrite every row')
+
+    def handle(self, *args, **kwargs):
+        try:
+            run = recompute_min_stock(full=kwargs['full'])
+        except ReorderRunInProgress as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {run.movements} movements up to {run.processed_until:%Y-%m-%d %H:%M:%S}; '
+            f'{run.updated} reorder points changed.'
+        ))
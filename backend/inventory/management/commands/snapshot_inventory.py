@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.snapshots import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Record today's inventory snapshot (only rows that changed since the previous one)"
+
+    def handle(self, *args, **kwargs):
+        day, rows = take_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Snapshot for {day}: {rows} changed rows written."))
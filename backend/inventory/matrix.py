@@ -0,0 +1,131 @@
+import struct
+
+import numpy as np
+from django.db import connections
+
+from .models import Inventory, Product, Store
+
+# Product rows fetched from the server-side cursor at a time; each carries
+# up to 8 bytes per store.
+MATRIX_CHUNK_SIZE = 1000
+# 40 MB of int32 quantities; the whole catalog across every store is
+# several hundred million cells.
+MATRIX_MAX_CELLS = 10_000_000
+
+
+class MatrixTooLarge(Exception):
+    pass
+
+
+def _store_axis(city=None, stores=None):
+    # Active stores only, as for the replenishment plan.
+    queryset = Store.objects.filter(is_active=True).order_by('id')
+    if city:
+        queryset = queryset.filter(city__iexact=city)
+    if stores:
+        queryset = queryset.filter(id__in=stores)
+    return list(queryset.values_list('id', flat=True))
+
+
+def load_matrix(category=None, city=None, stores=None):
+    # The stock of every product stocked in at least one store in scope, as
+    # a (products, stores) int32 array; cells without an Inventory row are
+    # 0. Both axes are sorted by id. The cells come from one query ordered
+    # by product, one row per product with its (store position, quantity)
+    # pairs as a single bytea. The first row carries the number of products,
+    # so the array is allocated once and filled chunk by chunk from a
+    # server-side cursor, without a Python object per cell. The size limit
+    # is checked beforehand: against the products in the category, and only
+    # when those are too many against the products stocked in scope, which
+    # costs a scan of its rows but none of the aggregation and sorting.
+    store_ids = _store_axis(city=city, stores=stores)
+    inventory_table = Inventory._meta.db_table
+    product_table = Product._meta.db_table
+    scope, params = '', [store_ids]
+    if category:
+        scope = f'WHERE product_id IN (SELECT id FROM {product_table} WHERE upper(category) = upper(%s)) '
+        params.append(category)
+    rows_in_scope = (
+        f'FROM {inventory_table} '
+        f'JOIN unnest(%s::uuid[]) WITH ORDINALITY AS store (id, position) ON store.id = store_id '
+        f'{scope}'
+    )
+    sql = (
+        f"SELECT uuid_send(product_id), string_agg(int4send(store.position::int4 - 1) || int4send(quantity), ''), "
+        f'count(*) OVER () '
+        f'{rows_in_scope}'
+        f'GROUP BY product_id ORDER BY product_id'
+    )
+
+    product_ids = bytearray()
+    quantities = np.zeros((0, len(store_ids)), dtype='<i4')
+    if store_ids:
+        connection = connections[Inventory.objects.db]
+        products = Product.objects.all()
+        if category:
+            products = products.filter(category__iexact=category)
+        count = products.count()
+        if count * len(store_ids) > MATRIX_MAX_CELLS:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(DISTINCT product_id) {rows_in_scope}', params)
+                count = cursor.fetchone()[0]
+        if count * len(store_ids) > MATRIX_MAX_CELLS:
+            raise MatrixTooLarge(
+                f'{count} products × {len(store_ids)} stores is more than {MATRIX_MAX_CELLS} cells; '
+                f'filter by category, city or store.'
+            )
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchmany(MATRIX_CHUNK_SIZE)
+            # Rows written since the count may have changed it.
+            count = rows[0][2] if rows else 0
+            product_ids = bytearray(16 * count)
+            quantities = np.zeros((count, len(store_ids)), dtype='<i4')
+            offset = 0
+            while rows:
+                ids, cells, _ = zip(*rows)
+                end = offset + len(rows)
+                product_ids[16 * offset:16 * end] = b''.join(ids)
+                sizes = np.fromiter(map(len, cells), dtype=np.int64, count=len(cells)) // 8
+                pairs = np.frombuffer(b''.join(cells), dtype='>i4').reshape(-1, 2)
+                quantities[np.repeat(np.arange(offset, end), sizes), pairs[:, 0]] = pairs[:, 1]
+                offset = end
+                rows = cursor.fetchmany(MATRIX_CHUNK_SIZE)
+
+    return {
+        'product_ids': bytes(product_ids),
+        'store_ids': b''.join(store_id.bytes for store_id in store_ids),
+        'quantities': quantities,
+    }
+
+
+def _uuid_strings(ids):
+    # Formatting the hex of all ids at once is several times faster than a
+    # uuid.UUID per id.
+    text = ids.hex()
+    return [
+        f'{text[i:i + 8]}-{text[i + 8:i + 12]}-{text[i + 12:i + 16]}-{text[i + 16:i + 20]}-{text[i + 20:i + 32]}'
+        for i in range(0, len(text), 32)
+    ]
+
+
+def to_json(matrix):
+    # Quantities are flat, row-major: product i, store j is at
+    # i * len(stores) + j.
+    return {
+        'products': _uuid_strings(matrix['product_ids']),
+        'stores': _uuid_strings(matrix['store_ids']),
+        'quantities': matrix['quantities'].ravel().tolist(),
+    }
+
+
+def pack(matrix):
+    # Little-endian uint32 product and store counts, the 16-byte product
+    # ids, the 16-byte store ids, then the int32 quantities, row-major.
+    products, stores = matrix['quantities'].shape
+    return b''.join([
+        struct.pack('<II', products, stores),
+        matrix['product_ids'],
+        matrix['store_ids'],
+        matrix['quantities'].tobytes(),
+    ])
@@ -0,0 +1,238 @@
+import logging
+import os
+import re
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'HEADERS': False,
+    'SLOW_QUERY_COUNT': 0,
+    'SLOW_QUERY_TOP': 5,
+}
+
+# Prometheus metrics served at /metrics. Under gunicorn every worker keeps
+# its own values; with PROMETHEUS_MULTIPROC_DIR set they are written to
+# that directory and a scrape of any worker reports all of them (gauges are
+# summed over live workers).
+
+POOL_CONNECTIONS = Gauge(
+    'inventory_db_pool_connections', 'Connections held by the pool, by state',
+    ['alias', 'state'], multiprocess_mode='livesum'
+)
+POOL_MAX_SIZE = Gauge(
+    'inventory_db_pool_max_size', 'Connections the pool may open',
+    ['alias'], multiprocess_mode='livesum'
+)
+POOL_WAITING = Gauge(
+    'inventory_db_pool_requests_waiting', 'Requests waiting for a connection',
+    ['alias'], multiprocess_mode='livesum'
+)
+POOL_REQUESTS = Counter('inventory_db_pool_requests', 'Connections handed out by the pool', ['alias'])
+POOL_QUEUED = Counter('inventory_db_pool_requests_queued', 'Requests that had to wait for a connection', ['alias'])
+POOL_WAIT = Counter('inventory_db_pool_wait_seconds', 'Time spent waiting for a connection', ['alias'])
+POOL_TIMEOUTS = Counter('inventory_db_pool_timeouts', 'Requests that gave up waiting for a connection', ['alias'])
+POOL_CONNECTS = Counter('inventory_db_pool_connects', 'Connections opened to the database', ['alias'])
+
+REQUEST_LATENCY = Histogram(
+    'inventory_request_duration_seconds', 'Time to produce a response, by view',
+    ['view', 'method']
+)
+REQUEST_QUERIES = Histogram(
+    'inventory_request_queries', 'SQL queries run by a request, by view',
+    ['view'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float('inf'))
+)
+REQUEST_SQL = Histogram('inventory_request_sql_seconds', 'Time spent in SQL by a request, by view', ['view'])
+REQUEST_SERIALIZER = Histogram(
+    'inventory_request_serializer_seconds', 'Time spent in serializers by a request, by view', ['view']
+)
+RESPONSE_SIZE = Histogram(
+    'inventory_response_size_bytes', 'Size of non-streaming response bodies, by view',
+    ['view'], buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, float('inf'))
+)
+
+# Stats of the request being served, None outside RequestMetricsMiddleware.
+# Like the replica alias, it follows the request into the async ORM's
+# threads.
+_request_stats = ContextVar('inventory_request_stats', default=None)
+
+
+def get_request_metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_REQUEST_METRICS', {})}
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+    @property
+    def sql_seconds(self):
+        return sum(duration for _, duration in self.queries)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection (see signals), so queries run from
+    # serializers, pagination or the async ORM are all counted.
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries.append((sql, time.perf_counter() - start))
+
+
+@contextmanager
+def serializing():
+    # Nested serializers and list items run inside the outermost one, which
+    # is the only one timed.
+    stats = _request_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - start
+        stats.serializing = False
+
+
+_PLACEHOLDERS = re.compile(r"%(?:\(\w+\))?s|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\?(?:, \?)+\)')
+
+
+def fingerprint(sql):
+    # Parameters and literals become '?' and value lists '(...)', so the
+    # same query issued for different rows is counted together.
+    sql = _PLACEHOLDERS.sub('?', ' '.join(sql.split()))
+    return _LISTS.sub('(...)', sql)
+
+
+class RequestMetricsMiddleware:
+    # Records latency, query count, SQL and serializer time and response
+    # size per view. With HEADERS on they are also returned as X-Query-Count
+    # and Server-Timing; a request running more than SLOW_QUERY_COUNT
+    # queries logs its most repeated ones. Streaming bodies run their
+    # queries after the response leaves here, so only the ones before the
+    # first byte count.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.record(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.record(request, response, stats)
+
+    def record(self, request, response, stats):
+        elapsed = time.perf_counter() - stats.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        query_count, sql_seconds = len(stats.queries), stats.sql_seconds
+
+        REQUEST_LATENCY.labels(view, request.method).observe(elapsed)
+        REQUEST_QUERIES.labels(view).observe(query_count)
+        REQUEST_SQL.labels(view).observe(sql_seconds)
+        REQUEST_SERIALIZER.labels(view).observe(stats.serializer_seconds)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+        options = get_request_metrics_settings()
+        if options['HEADERS']:
+            response['X-Query-Count'] = str(query_count)
+            response['Server-Timing'] = (
+                f'db;dur={sql_seconds * 1000:.2f};desc="{query_count} queries", '
+                f'serializer;dur={stats.serializer_seconds * 1000:.2f}, '
+                f'total;dur={elapsed * 1000:.2f}'
+            )
+        if options['SLOW_QUERY_COUNT'] and query_count > options['SLOW_QUERY_COUNT']:
+            self.log_queries(request, stats, options['SLOW_QUERY_TOP'])
+        return response
+
+    def log_queries(self, request, stats, top):
+        counts, durations = Tally(), Tally()
+        for sql, duration in stats.queries:
+            key = fingerprint(sql)
+            counts[key] += 1
+            durations[key] += duration
+        worst = sorted(counts, key=lambda key: (counts[key], durations[key]), reverse=True)[:top]
+        logger.warning(
+            '%s %s ran %d queries (%.1f ms of SQL); most repeated:\n%s',
+            request.method, request.path, len(stats.queries), stats.sql_seconds * 1000,
+            '\n'.join(f'  {counts[key]}x {durations[key] * 1000:.1f} ms  {key}' for key in worst)
+        )
+
+
+def record_pool_stats():
+    # pop_stats() resets the pool's counters, so each call adds what
+    # happened since the previous one. Only pools that already exist are
+    # read: connection.pool would open a connection and a pool for every
+    # alias a worker has not used yet.
+    for connection in connections.all(initialized_only=True):
+        pool = getattr(connection, '_connection_pools', {}).get(connection.alias)
+        if pool is None:
+            continue
+        alias = connection.alias
+        stats = pool.pop_stats()
+        in_use = stats['pool_size'] - stats['pool_available']
+        POOL_CONNECTIONS.labels(alias, 'in_use').set(in_use)
+        POOL_CONNECTIONS.labels(alias, 'idle').set(stats['pool_available'])
+        POOL_MAX_SIZE.labels(alias).set(stats['pool_max'])
+        POOL_WAITING.labels(alias).set(stats.get('requests_waiting', 0))
+        POOL_REQUESTS.labels(alias).inc(stats.get('requests_num', 0))
+        POOL_QUEUED.labels(alias).inc(stats.get('requests_queued', 0))
+        POOL_WAIT.labels(alias).inc(stats.get('requests_wait_ms', 0) / 1000)
+        POOL_TIMEOUTS.labels(alias).inc(stats.get('requests_errors', 0))
+        POOL_CONNECTS.labels(alias).inc(stats.get('connections_num', 0))
+
+
+def render():
+    record_pool_stats()
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['store', 'product'], name='inventory_i_store_i_4c2256_idx'),
+        ),
+    ]
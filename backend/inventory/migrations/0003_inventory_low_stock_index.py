@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_inventory_store_product_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__lt', models.F('minStock'))), fields=['store', 'product'], name='inventory_low_stock_idx'),
+        ),
+    ]
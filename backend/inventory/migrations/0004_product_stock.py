@@ -0,0 +1,131 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Inventory writes append per-row deltas to a staging table; a deferred
+# constraint trigger folds the transaction's deltas into ProductStock at
+# commit, in product order and skipping products whose net change is zero.
+# Transfers between stores therefore never touch the rollup unless a store
+# runs out of (or gets back into) stock, and the rollup row is only locked
+# for the instant of the commit, after all Inventory locks are held. Only the
+# first delta of a transaction is flagged to queue the apply trigger (tracked
+# with a transaction-local setting the apply step clears again): queuing it
+# per row re-scanned the transaction's deltas on every firing, so commit time
+# grew quadratically with the rows a transaction wrote.
+STOCK_ROLLUP_SQL = '''
+CREATE TABLE inventory_productstock_delta (
+    txid bigint NOT NULL DEFAULT txid_current(),
+    product_id uuid NOT NULL,
+    quantity bigint NOT NULL,
+    stores integer NOT NULL,
+    flush boolean NOT NULL DEFAULT false
+);
+CREATE INDEX inventory_productstock_delta_txid ON inventory_productstock_delta (txid);
+
+CREATE FUNCTION inventory_stock_delta() RETURNS trigger AS $$
+DECLARE
+    flush boolean := coalesce(current_setting('inventory.stock_flush_queued', true), '') <> 'on';
+BEGIN
+    IF flush THEN
+        PERFORM set_config('inventory.stock_flush_queued', 'on', true);
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.product_id = NEW.product_id THEN
+        INSERT INTO inventory_productstock_delta (product_id, quantity, stores, flush)
+        VALUES (
+            NEW.product_id,
+            NEW.quantity - OLD.quantity,
+            (NEW.quantity > 0)::int - (OLD.quantity > 0)::int,
+            flush
+        );
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO inventory_productstock_delta (product_id, quantity, stores, flush)
+        VALUES (OLD.product_id, -OLD.quantity, -(OLD.quantity > 0)::int, flush);
+        flush := false;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        INSERT INTO inventory_productstock_delta (product_id, quantity, stores, flush)
+        VALUES (NEW.product_id, NEW.quantity, (NEW.quantity > 0)::int, flush);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER inventory_stock_delta_write
+    AFTER INSERT OR DELETE ON inventory_inventory
+    FOR EACH ROW EXECUTE FUNCTION inventory_stock_delta();
+CREATE TRIGGER inventory_stock_delta_update
+    AFTER UPDATE OF quantity, product_id ON inventory_inventory
+    FOR EACH ROW
+    WHEN (OLD.quantity IS DISTINCT FROM NEW.quantity OR OLD.product_id IS DISTINCT FROM NEW.product_id)
+    EXECUTE FUNCTION inventory_stock_delta();
+
+CREATE FUNCTION inventory_apply_stock_deltas() RETURNS trigger AS $$
+BEGIN
+    PERFORM set_config('inventory.stock_flush_queued', '', true);
+    WITH delta AS (
+        DELETE FROM inventory_productstock_delta
+        WHERE txid = txid_current()
+        RETURNING product_id, quantity, stores
+    ), net AS (
+        SELECT product_id, sum(quantity) AS quantity, sum(stores) AS stores
+        FROM delta
+        GROUP BY product_id
+    )
+    INSERT INTO inventory_productstock (product_id, total_quantity, stores_in_stock)
+    SELECT net.product_id, net.quantity, net.stores
+    FROM net
+    JOIN inventory_product ON inventory_product.id = net.product_id
+    WHERE net.quantity <> 0 OR net.stores <> 0
+    ORDER BY net.product_id
+    ON CONFLICT (product_id) DO UPDATE SET
+        total_quantity = inventory_productstock.total_quantity + EXCLUDED.total_quantity,
+        stores_in_stock = inventory_productstock.stores_in_stock + EXCLUDED.stores_in_stock;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE CONSTRAINT TRIGGER inventory_apply_stock_deltas
+    AFTER INSERT ON inventory_productstock_delta
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW
+    WHEN (NEW.flush)
+    EXECUTE FUNCTION inventory_apply_stock_deltas();
+
+INSERT INTO inventory_productstock (product_id, total_quantity, stores_in_stock)
+SELECT product_id, sum(quantity), count(*) FILTER (WHERE quantity > 0)
+FROM inventory_inventory
+GROUP BY product_id;
+'''
+
+DROP_STOCK_ROLLUP_SQL = '''
+DROP TRIGGER inventory_stock_delta_write ON inventory_inventory;
+DROP TRIGGER inventory_stock_delta_update ON inventory_inventory;
+DROP TABLE inventory_productstock_delta;
+DROP FUNCTION inventory_stock_delta();
+DROP FUNCTION inventory_apply_stock_deltas();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_inventory_low_stock_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='inventory.product')),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('stores_in_stock', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['total_quantity'], name='inventory_p_total_q_0d65de_idx'), models.Index(fields=['stores_in_stock'], name='inventory_p_stores__76f9a8_idx')],
+            },
+        ),
+        migrations.RunSQL(STOCK_ROLLUP_SQL, DROP_STOCK_ROLLUP_SQL),
+    ]
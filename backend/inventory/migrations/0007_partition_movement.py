@@ -0,0 +1,197 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:49
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+# Movement becomes a table range-partitioned by month on timestamp. Postgres
+# requires the partition key in every unique index, so the primary key is
+# (id, timestamp). Partitions exist from the oldest movement to three months
+# ahead (the movement_partitions command keeps that window moving); anything
+# outside lands in the default partition. Only the current and previous
+# month keep a B-tree on (timestamp, id); every partition has a BRIN index.
+# Foreign keys are added after the copy: deferred checks queued by the
+# INSERT would otherwise block the index builds.
+MOVEMENT_FOREIGN_KEYS = '''
+ALTER TABLE inventory_movement
+    ADD CONSTRAINT inventory_movement_product_id_3c28cb3b_fk_inventory_product_id
+    FOREIGN KEY (product_id) REFERENCES inventory_product (id) DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT "inventory_movement_sourceStore_id_33ac8265_fk_inventory"
+    FOREIGN KEY ("sourceStore_id") REFERENCES inventory_store (id) DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT "inventory_movement_targetStore_id_c53ab2e1_fk_inventory"
+    FOREIGN KEY ("targetStore_id") REFERENCES inventory_store (id) DEFERRABLE INITIALLY DEFERRED;
+'''
+
+MOVEMENT_COLUMNS = '''
+    id, quantity, "timestamp", type, product_id, "sourceStore_id", "targetStore_id"
+'''
+
+PARTITION_MOVEMENT_SQL = f'''
+ALTER TABLE inventory_movement RENAME TO inventory_movement_old;
+
+CREATE TABLE inventory_movement (
+    id uuid NOT NULL,
+    quantity integer NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    type varchar NOT NULL,
+    product_id uuid NOT NULL,
+    "sourceStore_id" uuid NULL,
+    "targetStore_id" uuid NULL
+) PARTITION BY RANGE ("timestamp");
+
+DO $$
+DECLARE
+    current_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC');
+    month timestamp := date_trunc(
+        'month',
+        coalesce((SELECT min("timestamp") FROM inventory_movement_old), now()) AT TIME ZONE 'UTC'
+    );
+    part text;
+BEGIN
+    WHILE month < current_month + interval '4 months' LOOP
+        part := 'inventory_movement_p' || to_char(month, 'YYYYMM');
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF inventory_movement FOR VALUES FROM (%L) TO (%L)',
+            part, month AT TIME ZONE 'UTC', (month + interval '1 month') AT TIME ZONE 'UTC'
+        );
+        IF month >= current_month - interval '1 month' THEN
+            EXECUTE format('CREATE INDEX %I ON %I ("timestamp", id)', part || '_ts', part);
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+END $$;
+CREATE TABLE inventory_movement_default PARTITION OF inventory_movement DEFAULT;
+
+INSERT INTO inventory_movement ({MOVEMENT_COLUMNS})
+SELECT {MOVEMENT_COLUMNS} FROM inventory_movement_old;
+DROP TABLE inventory_movement_old;
+
+ALTER TABLE inventory_movement ADD PRIMARY KEY (id, "timestamp");
+CREATE INDEX inventory_m_product_682418_idx ON inventory_movement (product_id, "timestamp" DESC);
+CREATE INDEX inventory_movement_source_idx ON inventory_movement ("sourceStore_id", "timestamp" DESC);
+CREATE INDEX inventory_movement_target_idx ON inventory_movement ("targetStore_id", "timestamp" DESC);
+CREATE INDEX inventory_movement_ts_brin ON inventory_movement USING brin ("timestamp");
+{MOVEMENT_FOREIGN_KEYS}'''
+
+UNPARTITION_MOVEMENT_SQL = f'''
+ALTER TABLE inventory_movement RENAME TO inventory_movement_partitioned;
+ALTER TABLE inventory_movement_partitioned RENAME CONSTRAINT inventory_movement_pkey TO inventory_movement_partitioned_pkey;
+ALTER INDEX inventory_m_product_682418_idx RENAME TO inventory_movement_partitioned_product;
+
+CREATE TABLE inventory_movement (
+    id uuid NOT NULL,
+    quantity integer NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    type varchar NOT NULL,
+    product_id uuid NOT NULL,
+    "sourceStore_id" uuid NULL,
+    "targetStore_id" uuid NULL
+);
+INSERT INTO inventory_movement ({MOVEMENT_COLUMNS})
+SELECT {MOVEMENT_COLUMNS} FROM inventory_movement_partitioned;
+DROP TABLE inventory_movement_partitioned;
+
+ALTER TABLE inventory_movement ADD PRIMARY KEY (id);
+
+CREATE INDEX inventory_movement_timestamp_80b5eaf2 ON inventory_movement ("timestamp");
+CREATE INDEX inventory_movement_type_a1f65534 ON inventory_movement (type);
+CREATE INDEX inventory_movement_type_a1f65534_like ON inventory_movement (type varchar_pattern_ops);
+CREATE INDEX inventory_movement_product_id_3c28cb3b ON inventory_movement (product_id);
+CREATE INDEX "inventory_movement_sourceStore_id_33ac8265" ON inventory_movement ("sourceStore_id");
+CREATE INDEX "inventory_movement_targetStore_id_c53ab2e1" ON inventory_movement ("targetStore_id");
+CREATE INDEX inventory_m_product_682418_idx ON inventory_movement (product_id, "timestamp" DESC);
+CREATE INDEX inventory_m_type_87331a_idx ON inventory_movement (type, "timestamp" DESC);
+CREATE INDEX "inventory_m_sourceS_445220_idx" ON inventory_movement ("sourceStore_id", "targetStore_id");
+{MOVEMENT_FOREIGN_KEYS}'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovementDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('type', models.CharField(choices=[('IN', 'In'), ('OUT', 'Out'), ('TRANSFER', 'Transfer')])),
+                ('quantity_in', models.BigIntegerField(default=0)),
+                ('quantity_out', models.BigIntegerField(default=0)),
+                ('movements', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_MOVEMENT_SQL, UNPARTITION_MOVEMENT_SQL),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='movement',
+                    name='inventory_m_type_87331a_idx',
+                ),
+                migrations.RemoveIndex(
+                    model_name='movement',
+                    name='inventory_m_sourceS_445220_idx',
+                ),
+                migrations.AlterField(
+                    model_name='movement',
+                    name='product',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='inventory.product'),
+                ),
+                migrations.AlterField(
+                    model_name='movement',
+                    name='sourceStore',
+                    field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movements_out', to='inventory.store'),
+                ),
+                migrations.AlterField(
+                    model_name='movement',
+                    name='targetStore',
+                    field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movements_in', to='inventory.store'),
+                ),
+                migrations.AlterField(
+                    model_name='movement',
+                    name='timestamp',
+                    field=models.DateTimeField(auto_now_add=True),
+                ),
+                migrations.AlterField(
+                    model_name='movement',
+                    name='type',
+                    field=models.CharField(choices=[('IN', 'In'), ('OUT', 'Out'), ('TRANSFER', 'Transfer')]),
+                ),
+                migrations.AddIndex(
+                    model_name='movement',
+                    index=models.Index(fields=['sourceStore', '-timestamp'], name='inventory_movement_source_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='movement',
+                    index=models.Index(fields=['targetStore', '-timestamp'], name='inventory_movement_target_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='movement',
+                    index=django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='inventory_movement_ts_brin'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movementdailyrollup',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movement_rollups', to='inventory.product'),
+        ),
+        migrations.AddField(
+            model_name='movementdailyrollup',
+            name='store',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movement_rollups', to='inventory.store'),
+        ),
+        migrations.AddIndex(
+            model_name='movementdailyrollup',
+            index=models.Index(fields=['store', 'day'], name='inventory_m_store_i_428e4e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='movementdailyrollup',
+            constraint=models.UniqueConstraint(fields=('product', 'day', 'store', 'type'), name='inventory_movement_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:54
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_partition_movement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshotRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField(unique=True)),
+                ('taken_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField()),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='inventory.product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='inventory.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'store', 'day'), name='inventory_snapshot_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_inventory_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockEvent',
+            fields=[
+                ('event_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('received_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
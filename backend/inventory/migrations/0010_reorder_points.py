@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:06
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_stock_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderPointRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField()),
+                ('processed_until', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('movements', models.BigIntegerField(default=0)),
+                ('updated', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockDemandDay',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField(db_index=True)),
+                ('quantity', models.BigIntegerField()),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='demand_days', to='inventory.product')),
+                ('store', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='demand_days', to='inventory.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'store', 'day'), name='inventory_demand_day_key')],
+            },
+        ),
+    ]
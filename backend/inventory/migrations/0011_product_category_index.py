@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:53
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_reorder_points'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='inventory_p_categor_4cd409_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('category'), models.F('name'), models.F('id'), name='inventory_product_category'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 import uuid
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
 
 MOVEMENT_IN = 'IN'
 MOVEMENT_OUT = 'OUT'
@@ -10,6 +13,13 @@ MOVEMENT_TYPE_CHOICES = (
     (MOVEMENT_TRANSFER, 'Transfer')
 )
 
+SEARCH_CONFIG = 'english'
+PRODUCT_SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('sku', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+)
+
 
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -18,6 +28,13 @@ class Product(models.Model):
     category = models.CharField(max_length=100, db_index=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     sku = models.CharField(max_length=100, unique=True, db_index=True)
+    # Stored generated column: Postgres recomputes it on every write, and
+    # ranking reads it instead of re-parsing the text for each match.
+    search_vector = models.GeneratedField(
+        expression=PRODUCT_SEARCH_VECTOR,
+        output_field=SearchVectorField(),
+        db_persist=True
+    )
 
     def __str__(self):
         return self.name
@@ -25,7 +42,12 @@ class Product(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['name']),
-            models.Index(fields=['category', 'name'])
+            # The category filter is case-insensitive (upper(category)), and
+            # the list is ordered on (name, id).
+            models.Index(Upper('category'), 'name', 'id', name='inventory_product_category'),
+            GinIndex(fields=['search_vector'], name='inventory_product_search_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='inventory_product_name_trgm'),
+            GinIndex(OpClass(Upper('sku'), name='gin_trgm_ops'), name='inventory_product_sku_trgm'),
         ]
 
 
@@ -65,24 +87,55 @@ class Inventory(models.Model):
     class Meta:
         unique_together = ('product', 'store')
         indexes = [
-            models.Index(fields=['product', 'store'])
+            models.Index(fields=['product', 'store']),
+            models.Index(fields=['store', 'product']),
+            # Only rows below their minimum are indexed, so the index holds
+            # the current alert set and stays in sync with every write.
+            models.Index(
+                fields=['store', 'product'],
+                condition=models.Q(quantity__lt=models.F('minStock')),
+                name='inventory_low_stock_idx'
+            )
+        ]
+
+
+class ProductStock(models.Model):
+    # Per-product rollup of Inventory, maintained by database triggers
+    # (see migration 0004). Products without a row have no stock at all.
+    product = models.OneToOneField(
+        Product, related_name='stock',
+        on_delete=models.CASCADE, primary_key=True
+    )
+    total_quantity = models.BigIntegerField(default=0)
+    stores_in_stock = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.product} - {self.total_quantity}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['total_quantity']),
+            models.Index(fields=['stores_in_stock']),
         ]
 
 
 class Movement(models.Model):
+    # Append-only ledger, range-partitioned by month on timestamp (migration
+    # 0007, managed by the movement_partitions command). The table's primary
+    # key is (id, timestamp); id alone is still unique.
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False)
     sourceStore = models.ForeignKey(
         Store, on_delete=models.CASCADE,
-        related_name='movements_out', null=True
+        related_name='movements_out', null=True, db_index=False
     )
     targetStore =  models.ForeignKey(
         Store, on_delete=models.CASCADE,
-        related_name='movements_in', null=True
+        related_name='movements_in', null=True, db_index=False
     )
     quantity = models.IntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
-    type = models.CharField(choices=MOVEMENT_TYPE_CHOICES, db_index=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+    type = models.CharField(choices=MOVEMENT_TYPE_CHOICES)
 
     def __str__(self):
         return f"{self.type} {self.quantity} <{self.product}> FROM <{self.sourceStore}> TO <{self.targetStore}>"
@@ -90,6 +143,135 @@ class Movement(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['product', '-timestamp']),
-            models.Index(fields=['type', '-timestamp']),
-            models.Index(fields=['sourceStore', 'targetStore']),
+            models.Index(fields=['sourceStore', '-timestamp'], name='inventory_movement_source_idx'),
+            models.Index(fields=['targetStore', '-timestamp'], name='inventory_movement_target_idx'),
+            # Partitions past the hot window drop their B-tree on
+            # (timestamp, id) and are range-scanned through this instead.
+            BrinIndex(fields=['timestamp'], name='inventory_movement_ts_brin'),
+        ]
+
+
+class StockEvent(models.Model):
+    # Client ids of the POS events already recorded as IN/OUT movements, so
+    # a retried event is skipped instead of counted twice. Kept for a
+    # retention window (the prune_stock_events command).
+    event_id = models.CharField(max_length=100, primary_key=True)
+    received_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.event_id
+
+
+class MovementDailyRollup(models.Model):
+    # Daily per product/store totals of Movement partitions that expired and
+    # were detached. A transfer counts out of its source and into its target.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField()
+    product = models.ForeignKey(
+        Product, related_name='movement_rollups',
+        on_delete=models.CASCADE, db_index=False
+    )
+    store = models.ForeignKey(
+        Store, related_name='movement_rollups',
+        on_delete=models.CASCADE, db_index=False
+    )
+    type = models.CharField(choices=MOVEMENT_TYPE_CHOICES)
+    quantity_in = models.BigIntegerField(default=0)
+    quantity_out = models.BigIntegerField(default=0)
+    movements = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.type} <{self.product}> AT <{self.store}>"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'day', 'store', 'type'],
+                name='inventory_movement_rollup_key'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['store', 'day']),
+        ]
+
+
+class StockDemandDay(models.Model):
+    # Units that left a store per product and day (UTC): OUT movements and
+    # transfers out, over the reorder point window. Maintained incrementally
+    # by inventory.reorder from the movements after the last run.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField(db_index=True)
+    product = models.ForeignKey(
+        Product, related_name='demand_days',
+        on_delete=models.CASCADE, db_index=False
+    )
+    store = models.ForeignKey(
+        Store, related_name='demand_days',
+        on_delete=models.CASCADE, db_index=False
+    )
+    quantity = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.day} {self.product} - {self.store}: {self.quantity}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'store', 'day'],
+                name='inventory_demand_day_key'
+            )
+        ]
+
+
+class ReorderPointRun(models.Model):
+    # One per minStock recomputation. The next run reads the movements after
+    # `processed_until`; a run without `finished_at` didn't write all its
+    # reorder points back, so the next one rewrites every row.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    started_at = models.DateTimeField()
+    processed_until = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField(null=True)
+    movements = models.BigIntegerField(default=0)
+    updated = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.started_at} (until {self.processed_until})"
+
+
+class InventorySnapshotRun(models.Model):
+    # One per snapshot day: InventorySnapshot rows for `day` reflect
+    # Inventory as it was at `taken_at`.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField(unique=True)
+    taken_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.day} ({self.taken_at})"
+
+
+class InventorySnapshot(models.Model):
+    # Compact daily snapshots of Inventory: a day only stores the rows whose
+    # quantity changed since the previous snapshot, so a row's quantity on
+    # a day is the latest snapshot at or before it (0 if there is none).
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    day = models.DateField()
+    product = models.ForeignKey(
+        Product, related_name='inventory_snapshots',
+        on_delete=models.CASCADE, db_index=False
+    )
+    store = models.ForeignKey(
+        Store, related_name='inventory_snapshots',
+        on_delete=models.CASCADE
+    )
+    quantity = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.day} {self.product} - {self.store}: {self.quantity}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'store', 'day'],
+                name='inventory_snapshot_key'
+            )
         ]
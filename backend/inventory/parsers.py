@@ -0,0 +1,39 @@
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+def iter_ndjson(lines):
+    # A line that isn't valid JSON is passed through as-is, so it shows up
+    # as a per-row validation error instead of aborting the whole import.
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def iter_csv(lines):
+    return csv.DictReader(lines)
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # Rows are read lazily from the request body.
+        return iter_ndjson(stream)
+
+
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return iter_csv(codecs.iterdecode(stream, encoding))
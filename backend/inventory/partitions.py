@@ -0,0 +1,162 @@
+import re
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Movement, MovementDailyRollup
+
+PARTITION_PREFIX = 'inventory_movement_p'
+DEFAULT_PARTITION = 'inventory_movement_default'
+AHEAD_MONTHS = 3
+HOT_MONTHS = 2
+
+
+def month_of(value):
+    value = value.astimezone(dt_timezone.utc)
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month:%Y%m}'
+
+
+def _bound(month):
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def list_partitions():
+    sql = (
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [Movement._meta.db_table])
+        names = [name for name, in cursor.fetchall()]
+    pattern = re.compile(rf'{PARTITION_PREFIX}(\d{{4}})(\d{{2}})')
+    return sorted(
+        date(int(match[1]), int(match[2]), 1)
+        for match in map(pattern.fullmatch, names) if match
+    )
+
+
+def create_partition(month, hot=True):
+    table = Movement._meta.db_table
+    name = partition_name(month)
+    start, end = _bound(month), _bound(add_months(month, 1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        # Rows that reached the default partition before their month existed
+        # are moved across; ATTACH would fail while the default holds them.
+        cursor.execute(
+            f'WITH moved AS ('
+            f'DELETE FROM {DEFAULT_PARTITION} '
+            f'WHERE "timestamp" >= {start} AND "timestamp" < {end} RETURNING *'
+            f') INSERT INTO {name} SELECT * FROM moved'
+        )
+        if hot:
+            cursor.execute(f'CREATE INDEX {name}_ts ON {name} ("timestamp", id)')
+        cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})')
+
+
+def ensure_partitions(since=None, ahead=AHEAD_MONTHS, hot_months=HOT_MONTHS):
+    # Creates the partitions for `ahead` months past the current one, every
+    # month from `since` onwards, and any month found in the default
+    # partition. Returns the months created.
+    current = month_of(timezone.now())
+    wanted = {add_months(current, count) for count in range(ahead + 1)}
+    if since is not None:
+        month = month_of(since)
+        while month < current:
+            wanted.add(month)
+            month = add_months(month, 1)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\" AT TIME ZONE 'UTC')::date "
+            f'FROM {DEFAULT_PARTITION}'
+        )
+        wanted.update(month for month, in cursor.fetchall())
+
+    hot_from = add_months(current, 1 - hot_months)
+    created = sorted(wanted - set(list_partitions()))
+    for month in created:
+        create_partition(month, hot=month >= hot_from)
+    return created
+
+
+def compact_partitions(hot_months=HOT_MONTHS):
+    # Partitions that left the hot window only take appends by accident, so
+    # their B-tree on time is dropped and the BRIN index serves range scans.
+    hot_from = add_months(month_of(timezone.now()), 1 - hot_months)
+    compacted = []
+    with connection.cursor() as cursor:
+        for month in list_partitions():
+            index = f'{partition_name(month)}_ts'
+            cursor.execute('SELECT to_regclass(%s)', [index])
+            if month < hot_from and cursor.fetchone()[0] is not None:
+                cursor.execute(f'DROP INDEX {index}')
+                compacted.append(month)
+    return compacted
+
+
+def rollup_partition(month, drop=False):
+    # Folds the partition into MovementDailyRollup and detaches it in one
+    # transaction, so its movements are counted exactly once.
+    table = Movement._meta.db_table
+    rollup_table = MovementDailyRollup._meta.db_table
+    name = partition_name(month)
+    sql = (
+        f'INSERT INTO {rollup_table} '
+        f'(id, day, product_id, store_id, type, quantity_in, quantity_out, movements) '
+        f'SELECT gen_random_uuid(), day, product_id, store_id, type, sum(quantity_in), sum(quantity_out), count(*) '
+        f'FROM ('
+        f'SELECT ("timestamp" AT TIME ZONE \'UTC\')::date AS day, product_id, "targetStore_id" AS store_id, type, '
+        f'quantity AS quantity_in, 0 AS quantity_out FROM {name} WHERE "targetStore_id" IS NOT NULL '
+        f'UNION ALL '
+        f'SELECT ("timestamp" AT TIME ZONE \'UTC\')::date, product_id, "sourceStore_id", type, '
+        f'0, quantity FROM {name} WHERE "sourceStore_id" IS NOT NULL'
+        f') legs '
+        f'GROUP BY day, product_id, store_id, type '
+        f'ORDER BY product_id, day, store_id, type '
+        f'ON CONFLICT (product_id, day, store_id, type) DO UPDATE SET '
+        f'quantity_in = {rollup_table}.quantity_in + EXCLUDED.quantity_in, '
+        f'quantity_out = {rollup_table}.quantity_out + EXCLUDED.quantity_out, '
+        f'movements = {rollup_table}.movements + EXCLUDED.movements'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql)
+        rows = cursor.rowcount
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+    return rows
+
+
+def expire_partitions(retain_months, drop=False):
+    # Partitions more than `retain_months` months older than the current one
+    # are rolled up and detached. Returns {month: rollup rows written}.
+    cutoff = add_months(month_of(timezone.now()), -retain_months)
+    return {
+        month: rollup_partition(month, drop=drop)
+        for month in list_partitions() if month < cutoff
+    }
+
+
+def retained_since():
+    # Movements before this instant may have been rolled up and detached by
+    # expire_partitions; None while nothing has expired. It is the start of
+    # the oldest partition still attached, which is conservative when months
+    # in between never had a partition of their own.
+    if not MovementDailyRollup.objects.exists():
+        return None
+    months = list_partitions()
+    if not months:
+        return None
+    return datetime.combine(months[0], time(), dt_timezone.utc)
@@ -0,0 +1,169 @@
+import csv
+import json
+from decimal import Decimal
+
+import orjson
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+STREAM_BUFFER_ROWS = 500
+
+DEFAULTS = {
+    'ENABLED': False,
+}
+
+
+def _dumps(data):
+    return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def get_fast_rendering_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_FAST_RENDERING', {})}
+
+
+def fast_rendering_enabled():
+    # The fast path leaves Decimals to the encoder, which writes numbers;
+    # with COERCE_DECIMAL_TO_STRING the serializers' strings are needed.
+    return get_fast_rendering_settings()['ENABLED'] and not api_settings.COERCE_DECIMAL_TO_STRING
+
+
+_drf_default = encoders.JSONEncoder().default
+_FAST_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+)
+
+
+def _fast_default(value):
+    # orjson writes floats below 1e-4 as 1e-7 where Python writes 1e-07, so
+    # Decimals become Python's float repr verbatim. Subclasses of the basic
+    # types are converted first: orjson reads a list subclass's own storage,
+    # which is empty for Django's ErrorList (a UserList). Everything else
+    # orjson doesn't encode like DRF (datetimes, dataclasses, querysets...)
+    # goes through DRF's encoder.
+    if isinstance(value, Decimal):
+        return orjson.Fragment(repr(float(value)).encode('ascii'))
+    for base in (str, int, dict, list):
+        if isinstance(value, base):
+            return base(value)
+    return _drf_default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    # JSONRenderer's exact bytes through orjson when fast rendering is on:
+    # UUIDs, strings and ints encode natively, without a Python call each.
+    # Anything JSONRenderer would format differently (indent, ASCII or
+    # non-compact output) or orjson can't encode (ints over 64 bits, non-str
+    # keys) is left to JSONRenderer. Native floats are the one gap (NaN, and
+    # exponents as above), and none of the views using it return any.
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or not fast_rendering_enabled()
+            or not (self.compact and not self.ensure_ascii)
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=_fast_default, option=_FAST_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two for JavaScript embedding.
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only non-streamed payloads (errors) are rendered here.
+        if data is None:
+            return b''
+        return (_dumps(data) + '\n').encode(self.charset)
+
+
+class StockMatrixRenderer(BaseRenderer):
+    # The stock matrix packed as binary (see inventory.matrix.pack).
+    media_type = 'application/octet-stream'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only errors are rendered here, as JSON.
+        if data is None:
+            return b''
+        return _dumps(data).encode('utf-8')
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        writer = csv.writer(_Echo())
+        return (writer.writerow(data.keys()) + writer.writerow(data.values())).encode(self.charset)
+
+
+def _buffered(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= STREAM_BUFFER_ROWS:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+async def _abuffered(lines):
+    buffer = []
+    async for line in lines:
+        buffer.append(line)
+        if len(buffer) >= STREAM_BUFFER_ROWS:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def stream_ndjson(fields, rows):
+    return _buffered(_dumps(dict(zip(fields, row))) + '\n' for row in rows)
+
+
+def stream_csv(fields, rows):
+    writer = csv.writer(_Echo())
+    header = (writer.writerow(fields),)
+    return _buffered(
+        line for chunk in (header, (writer.writerow(row) for row in rows)) for line in chunk
+    )
+
+
+# Async counterparts for rows coming from QuerySet.aiterator().
+
+def astream_ndjson(fields, rows):
+    return _abuffered(_dumps(dict(zip(fields, row))) + '\n' async for row in rows)
+
+
+async def _acsv_lines(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    async for row in rows:
+        yield writer.writerow(row)
+
+
+def astream_csv(fields, rows):
+    return _abuffered(_acsv_lines(fields, rows))
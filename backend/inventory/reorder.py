@@ -0,0 +1,193 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import REPLENISHMENT, get_response_cache
+from .models import (
+    MOVEMENT_OUT, MOVEMENT_TRANSFER, Inventory, Movement, ReorderPointRun, StockDemandDay
+)
+
+# minStock becomes a reorder point: the demand expected over the lead time
+# plus safety stock for its variability,
+#   ceil(mean * LEAD_TIME_DAYS + SERVICE_FACTOR * stddev * sqrt(LEAD_TIME_DAYS))
+# from the units that left each store per day (OUT movements and transfers
+# out) over the last WINDOW_DAYS days, days without any included. Movements
+# newer than SETTLE_SECONDS are left for the next run, so rows committed
+# late with an earlier timestamp aren't skipped.
+DEFAULTS = {
+    'WINDOW_DAYS': 28,
+    'LEAD_TIME_DAYS': 7,
+    # 1.65 standard deviations: about a 95% chance of not running out.
+    'SERVICE_FACTOR': 1.65,
+    'MIN_STOCK_FLOOR': 0,
+    'SETTLE_SECONDS': 300,
+    # Inventory rows written back per transaction.
+    'CHUNK_SIZE': 5000,
+}
+# Key of the session advisory lock held for a whole run.
+REORDER_LOCK = 'inventory.reorder'
+
+
+class ReorderRunInProgress(Exception):
+    pass
+
+
+def get_reorder_settings():
+    config = {**DEFAULTS, **getattr(settings, 'INVENTORY_REORDER_POINTS', {})}
+    if config['WINDOW_DAYS'] < 2:
+        raise ValueError('INVENTORY_REORDER_POINTS WINDOW_DAYS must be at least 2.')
+    return config
+
+
+def _collect_demand(since, until):
+    # Adds the movements in (since, until] to the daily demand and returns
+    # the number read and the (product, store) keys whose demand changed.
+    demand_table = StockDemandDay._meta.db_table
+    movement_table = Movement._meta.db_table
+    sql = (
+        f'WITH slice AS ('
+        f'SELECT product_id, "sourceStore_id" AS store_id, '
+        f"(timestamp AT TIME ZONE 'UTC')::date AS day, sum(quantity) AS quantity, count(*) AS movements "
+        f'FROM {movement_table} '
+        f'WHERE timestamp > %s AND timestamp <= %s AND type IN (%s, %s) AND "sourceStore_id" IS NOT NULL '
+        f'GROUP BY 1, 2, 3'
+        f'), upserted AS ('
+        f'INSERT INTO {demand_table} (id, day, product_id, store_id, quantity) '
+        f'SELECT gen_random_uuid(), day, product_id, store_id, quantity FROM slice '
+        f'ORDER BY product_id, store_id, day '
+        f'ON CONFLICT (product_id, store_id, day) DO UPDATE SET '
+        f'quantity = {demand_table}.quantity + EXCLUDED.quantity '
+        f'RETURNING product_id, store_id'
+        f') '
+        f'SELECT (SELECT coalesce(sum(movements), 0) FROM slice), '
+        f'(SELECT array_agg(DISTINCT (product_id, store_id)::text) FROM upserted)'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [since, until, MOVEMENT_OUT, MOVEMENT_TRANSFER])
+        movements, keys = cursor.fetchone()
+    return int(movements), _parse_keys(keys)
+
+
+def _expire_demand(window_start):
+    # Drops the days that left the window; their keys need a new point too.
+    demand_table = StockDemandDay._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH expired AS (DELETE FROM {demand_table} WHERE day < %s RETURNING product_id, store_id) '
+            f'SELECT array_agg(DISTINCT (product_id, store_id)::text) FROM expired',
+            [window_start]
+        )
+        return _parse_keys(cursor.fetchone()[0])
+
+
+def _parse_keys(keys):
+    # Composite values come back as '(product,store)'.
+    return {tuple(key[1:-1].split(',')) for key in keys or []}
+
+
+def _write_points(keys, window_start, config):
+    # One UPDATE for the chunk, computing each key's point from its daily
+    # demand; rows whose minStock already matches aren't rewritten. A key
+    # listed twice would count its demand twice, hence the DISTINCT.
+    demand_table = StockDemandDay._meta.db_table
+    inventory_table = Inventory._meta.db_table
+    sql = (
+        f'UPDATE {inventory_table} SET "minStock" = point.value FROM ('
+        f'SELECT key.product_id, key.store_id, greatest(%(floor)s, ceil('
+        f'total / %(days)s * %(lead)s + %(z)s * sqrt(%(lead)s) '
+        f'* sqrt(greatest((squares - total * total / %(days)s) / (%(days)s - 1), 0))'
+        f'))::integer AS value '
+        f'FROM (SELECT key.product_id, key.store_id, '
+        f'coalesce(sum(demand.quantity::float8), 0) AS total, '
+        f'coalesce(sum(demand.quantity::float8 * demand.quantity), 0) AS squares '
+        f'FROM (SELECT DISTINCT * FROM unnest(%(products)s::uuid[], %(stores)s::uuid[]) AS key (product_id, store_id)) key '
+        f'LEFT JOIN {demand_table} demand ON demand.product_id = key.product_id '
+        f'AND demand.store_id = key.store_id AND demand.day >= %(start)s '
+        f'GROUP BY key.product_id, key.store_id) key'
+        f') point '
+        f'WHERE {inventory_table}.product_id = point.product_id AND {inventory_table}.store_id = point.store_id '
+        f'AND {inventory_table}."minStock" <> point.value'
+    )
+    products, stores = zip(*keys)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'floor': config['MIN_STOCK_FLOOR'],
+            'days': config['WINDOW_DAYS'],
+            'lead': config['LEAD_TIME_DAYS'],
+            'z': config['SERVICE_FACTOR'],
+            'start': window_start,
+            'products': list(products),
+            'stores': list(stores),
+        })
+        return cursor.rowcount
+
+
+def recompute_min_stock(full=False, now=None):
+    # One run at a time: a session advisory lock is held from the demand
+    # collection to the last write-back, which span several transactions.
+    # A second run fails instead of waiting, since the first one already
+    # covers what it would do.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s))', [REORDER_LOCK])
+        if not cursor.fetchone()[0]:
+            raise ReorderRunInProgress('Another reorder point run is in progress.')
+    try:
+        return _recompute_min_stock(full, now)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', [REORDER_LOCK])
+
+
+def _recompute_min_stock(full, now):
+    # Folds the movements since the last run into the daily demand, then
+    # writes back the points of the keys whose demand changed (new
+    # movements or days leaving the window), in chunks. Work follows the
+    # movements since the last run, not the size of the ledger. The first
+    # run and `full` rebuild the window; they and a run after one that didn't
+    # finish write back every row that may be off.
+    config = get_reorder_settings()
+    now = now or timezone.now()
+    until = now - timedelta(seconds=config['SETTLE_SECONDS'])
+    window_start = until.astimezone(dt_timezone.utc).date() - timedelta(days=config['WINDOW_DAYS'] - 1)
+    window_since = datetime.combine(window_start, time.min, tzinfo=dt_timezone.utc)
+
+    with transaction.atomic():
+        last = ReorderPointRun.objects.order_by('-processed_until').first()
+        rebuild = full or last is None or last.finished_at is None
+        if full or last is None:
+            StockDemandDay.objects.all().delete()
+            since = window_since
+        else:
+            # Demand older than the window would be dropped again anyway.
+            since = max(last.processed_until, window_since)
+        until = max(until, since)
+        movements, keys = _collect_demand(since, until)
+        keys |= _expire_demand(window_start)
+        run = ReorderPointRun.objects.create(
+            started_at=now, processed_until=until, movements=movements
+        )
+
+    if rebuild:
+        # Every row is either at the floor with no demand, and already right,
+        # or one of these; keys listed twice just don't change the second time.
+        keys = chain(
+            Inventory.objects.exclude(minStock=config['MIN_STOCK_FLOOR']).order_by().values_list(
+                'product_id', 'store_id'
+            ).iterator(chunk_size=config['CHUNK_SIZE']),
+            StockDemandDay.objects.order_by().values_list('product_id', 'store_id').distinct().iterator(
+                chunk_size=config['CHUNK_SIZE']
+            ),
+        )
+    keys, updated = iter(keys), 0
+    while chunk := list(islice(keys, config['CHUNK_SIZE'])):
+        updated += _write_points(chunk, window_start, config)
+    if updated:
+        get_response_cache().invalidate(REPLENISHMENT)
+
+    run.finished_at = timezone.now()
+    run.updated = updated
+    run.save(update_fields=['finished_at', 'updated'])
+    return run
@@ -0,0 +1,190 @@
+import uuid
+
+import numpy as np
+from django.db import connections
+
+from .models import Inventory, Product, Store
+
+# Transfer lines accepted by one batch transfer request.
+PLAN_BATCH_SIZE = 1000
+
+
+def load_stock(category=None, city=None):
+    # The stock of every product that is short in at least one active store
+    # in scope, in one query. Short products are found through the partial
+    # low-stock index, so stock that can't help anyone is never read. Each
+    # column comes back as a single bytea of fixed-width binary values
+    # (16-byte ids, big-endian integers), which NumPy reads as an array
+    # without building a Python object per row. Cities are matched
+    # case-insensitively, as the city filter is.
+    inventory_table = Inventory._meta.db_table
+    store_table = Store._meta.db_table
+    product_table = Product._meta.db_table
+    stores, scope, params = ['is_active'], ['store_id IN (SELECT id FROM store)'], []
+    if city:
+        stores.append('upper(city) = upper(%s)')
+        params.append(city)
+    if category:
+        # The scope is applied twice, to short products and to their stock.
+        scope.append(f'product_id IN (SELECT id FROM {product_table} WHERE upper(category) = upper(%s))')
+        params += [category, category]
+    stores, scope = ' AND '.join(stores), ' AND '.join(scope)
+    sql = (
+        f'WITH store AS (SELECT id, upper(city) AS city FROM {store_table} WHERE {stores}), '
+        f'short AS (SELECT DISTINCT product_id FROM {inventory_table} WHERE quantity < "minStock" AND {scope}) '
+        f"SELECT (SELECT string_agg(uuid_send(id), '' ORDER BY id) FROM store), "
+        f'(SELECT array_agg(city ORDER BY id) FROM store), '
+        f"string_agg(uuid_send(store_id), ''), string_agg(uuid_send(product_id), ''), "
+        f"string_agg(int4send(quantity), ''), string_agg(int4send(\"minStock\"), '') "
+        f'FROM {inventory_table} WHERE product_id IN (SELECT product_id FROM short) AND {scope}'
+    )
+    with connections[Inventory.objects.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        store_ids, cities, stores, products, quantity, minimum = (
+            b'' if value is None else value for value in cursor.fetchone()
+        )
+
+    # Both sides are sorted by id (Postgres compares uuids bytewise), so a
+    # binary search gives each row its store's position.
+    store_ids = np.frombuffer(store_ids, dtype='S16')
+    product_ids, product = _factorize(np.frombuffer(products, dtype='S16'))
+    _, store_city = _factorize(np.array(cities or [], dtype=str))
+    return {
+        'store_ids': store_ids,
+        'product_ids': product_ids,
+        'store_city': store_city,
+        'store': np.searchsorted(store_ids, np.frombuffer(stores, dtype='S16')),
+        'product': product,
+        'quantity': np.frombuffer(quantity, dtype='>i4').astype(np.int64),
+        'minimum': np.frombuffer(minimum, dtype='>i4').astype(np.int64),
+    }
+
+
+def _factorize(values):
+    # (sorted distinct values, code of each value). Sorting is several
+    # times faster than np.unique, which hashes.
+    order = np.argsort(values)
+    ordered = values[order]
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = ordered[1:] != ordered[:-1]
+    codes = np.empty(len(values), dtype=np.int64)
+    codes[order] = np.cumsum(first) - 1
+    return ordered[first], codes
+
+
+def _uuid(value):
+    # NumPy drops trailing NUL bytes from fixed-width bytes.
+    return uuid.UUID(bytes=bytes(value).ljust(16, b'\0'))
+
+
+def _largest_first(group, amounts):
+    # Order by group, then by amount descending. One argsort on a combined
+    # key is several times faster than np.lexsort; both fit in an int64
+    # (groups are at most one per row, amounts are 32-bit).
+    scale = int(amounts.max()) + 1 if len(amounts) else 1
+    return np.argsort(group * scale + (scale - 1 - amounts))
+
+
+def match(demand_keys, demand, supply_keys, supply):
+    # Greedy matching of demands to supplies with the same key, largest
+    # first on both sides. Within a key, demands and supplies are laid end
+    # to end on one axis and every overlap between a demand's interval and
+    # a supply's is a transfer of its length; keys get disjoint stretches of
+    # the axis. Returns (demand index, supply index, quantity) arrays.
+    # Supplies with no demand under their key are dropped first: they are
+    # usually most of them.
+    groups, group = _factorize(np.concatenate([demand_keys, supply_keys]))
+    demand_group, supply_group = group[:len(demand)], group[len(demand):]
+    wanted = np.zeros(len(groups), dtype=bool)
+    wanted[demand_group] = True
+    candidates = np.flatnonzero(wanted[supply_group])
+    supply_group, supply = supply_group[candidates], supply[candidates]
+
+    demand_order = _largest_first(demand_group, demand)
+    supply_order = _largest_first(supply_group, supply)
+    demand_total = np.bincount(demand_group, weights=demand, minlength=len(groups)).astype(np.int64)
+    supply_total = np.bincount(supply_group, weights=supply, minlength=len(groups)).astype(np.int64)
+    width = np.maximum(demand_total, supply_total)
+    offset = np.cumsum(width) - width
+
+    def intervals(group, amounts, totals, order):
+        group, amounts = group[order], amounts[order]
+        ends = np.cumsum(amounts) - (np.cumsum(totals) - totals)[group] + offset[group]
+        return ends - amounts, ends
+
+    demand_start, demand_end = intervals(demand_group, demand, demand_total, demand_order)
+    supply_start, supply_end = intervals(supply_group, supply, supply_total, supply_order)
+
+    # Every interval starts at 0 or where another one ends, so the ends
+    # alone cut the axis into segments. Walking them in order, the ends
+    # passed so far on each side give the demand and supply a segment falls
+    # in; it's a transfer if both cover it.
+    ends = np.concatenate([demand_end, supply_end])
+    order = np.argsort(ends)
+    points = ends[order]
+    demand_passed = np.cumsum(order < len(demand_end))
+    supply_passed = np.cumsum(order >= len(demand_end))
+    last = np.ones(len(points), dtype=bool)
+    last[:-1] = points[1:] != points[:-1]
+    points, demand_passed, supply_passed = points[last], demand_passed[last], supply_passed[last]
+
+    left = np.concatenate([[0], points])[:-1]
+    d = np.concatenate([[0], demand_passed])[:-1]
+    s = np.concatenate([[0], supply_passed])[:-1]
+    covered = (d < len(demand_end)) & (s < len(supply_end))
+    d, s, left, right = d[covered], s[covered], left[covered], points[covered]
+    covered = (demand_start[d] <= left) & (supply_start[s] <= left)
+    return demand_order[d[covered]], candidates[supply_order[s[covered]]], (right - left)[covered]
+
+
+def plan(stock, limit=None):
+    # Moves stock above a store's minimum to stores below theirs, product by
+    # product: first between stores of the same city, then across cities
+    # for what is left. Sources never drop below their own minimum. Lines
+    # come largest first; `limit` keeps only that many.
+    excess = stock['quantity'] - stock['minimum']
+    short = np.flatnonzero(excess < 0)
+    spare = np.flatnonzero(excess > 0)
+    need, left_over = -excess[short], excess[spare]
+    product, store = stock['product'], stock['store']
+    city = stock['store_city'][store]
+    cities = int(city.max()) + 1 if len(city) else 1
+
+    lines = []
+    for keys in (product * cities + city, product):
+        d, s, quantity = match(keys[short], need, keys[spare], left_over)
+        np.subtract.at(need, d, quantity)
+        np.subtract.at(left_over, s, quantity)
+        lines.append((short[d], spare[s], quantity))
+        short, need = short[need > 0], need[need > 0]
+        spare, left_over = spare[left_over > 0], left_over[left_over > 0]
+
+    targets, sources, quantity = (np.concatenate(column) for column in zip(*lines))
+    order = np.argsort(-quantity, kind='stable')[:limit]
+    transfers, total = len(quantity), int(quantity.sum())
+    targets, sources, quantity = targets[order], sources[order], quantity[order]
+    # Ids are converted once per store and product, not once per line.
+    store_ids = [_uuid(value) for value in stock['store_ids']]
+    products, product_index = _factorize(product[targets])
+    product_ids = [_uuid(value) for value in stock['product_ids'][products]]
+    return {
+        'transfers': transfers,
+        'quantity': total,
+        'same_city_quantity': int(lines[0][2].sum()),
+        'unmet_quantity': int(need.sum()),
+        'lines': [
+            {
+                'product_id': product_ids[product_code],
+                'source_store_id': store_ids[source],
+                'target_store_id': store_ids[target],
+                'quantity': amount,
+            }
+            for product_code, source, target, amount in zip(
+                product_index.tolist(), store[sources].tolist(), store[targets].tolist(), quantity.tolist()
+            )
+        ],
+    }
+
+
+def plan_replenishment(category=None, city=None, limit=None):
+    return plan(load_stock(category=category, city=city), limit=limit)
@@ -0,0 +1,72 @@
+from datetime import time, timedelta, timezone as dt_timezone
+
+from django.db.models import DateField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncWeek
+
+from .models import Movement, MovementDailyRollup
+
+# Periods are cut in UTC, like the partitions and the daily rollups.
+MOVEMENT_PERIODS = {
+    'day': TruncDate('timestamp', tzinfo=dt_timezone.utc),
+    'week': TruncWeek('timestamp', output_field=DateField(), tzinfo=dt_timezone.utc),
+}
+ROLLUP_PERIODS = {
+    'day': F('day'),
+    'week': TruncWeek('day', output_field=DateField()),
+}
+
+
+def _whole_days(since, until):
+    # Rolled-up history only has daily totals, so it contributes the days
+    # that start inside [since, until).
+    since, until = since.astimezone(dt_timezone.utc), until.astimezone(dt_timezone.utc)
+    first = since.date() + timedelta(days=since.time() != time.min)
+    last = until.date() + timedelta(days=until.time() != time.min)
+    return first, last
+
+
+def movement_summary(since, until, interval='day', product=None, store=None, type=None):
+    # In/out quantities per period, aggregated by Postgres from the ledger
+    # and, for partitions that were rolled up and detached, from the daily
+    # rollups. A transfer counts out of its source and into its target, so
+    # without a store filter transfers add to both sides and net to zero.
+    movements = Movement.objects.filter(timestamp__gte=since, timestamp__lt=until)
+    first_day, last_day = _whole_days(since, until)
+    rollups = MovementDailyRollup.objects.filter(day__gte=first_day, day__lt=last_day)
+    if product is not None:
+        movements = movements.filter(product_id=product)
+        rollups = rollups.filter(product_id=product)
+    if type is not None:
+        movements = movements.filter(type=type)
+        rollups = rollups.filter(type=type)
+
+    if store is not None:
+        moved_in, moved_out = Q(targetStore_id=store), Q(sourceStore_id=store)
+        movements = movements.filter(moved_in | moved_out)
+        rollups = rollups.filter(store_id=store)
+    else:
+        moved_in, moved_out = Q(targetStore__isnull=False), Q(sourceStore__isnull=False)
+
+    ledger = movements.annotate(period=MOVEMENT_PERIODS[interval]).values('period').annotate(
+        quantity_in=Coalesce(Sum('quantity', filter=moved_in), 0),
+        quantity_out=Coalesce(Sum('quantity', filter=moved_out), 0),
+    ).values_list('period', 'quantity_in', 'quantity_out')
+    history = rollups.annotate(period=ROLLUP_PERIODS[interval]).values('period').annotate(
+        quantity_in=Sum('quantity_in'),
+        quantity_out=Sum('quantity_out'),
+    ).values_list('period', 'quantity_in', 'quantity_out')
+
+    totals = {}
+    for period, quantity_in, quantity_out in [*ledger, *history]:
+        current = totals.setdefault(period, [0, 0])
+        current[0] += quantity_in
+        current[1] += quantity_out
+    return [
+        {
+            'period': period,
+            'quantity_in': quantity_in,
+            'quantity_out': quantity_out,
+            'net': quantity_in - quantity_out,
+        }
+        for period, (quantity_in, quantity_out) in sorted(totals.items())
+    ]
@@ -0,0 +1,151 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULTS = {
+    'ALIASES': [],
+    'PIN_SECONDS': 5,
+    'COOKIE_NAME': 'inventory_primary_until',
+}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The replica alias the current request reads from, None for the primary.
+# Views run inside a copy of the request's context, also under ASGI, where
+# the async ORM hops to a thread.
+_read_alias = ContextVar('inventory_read_alias', default=None)
+
+
+def get_replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'INVENTORY_READ_REPLICAS', {})}
+
+
+def reading_from_replica():
+    return _read_alias.get() is not None
+
+
+def reads_from_replica(view):
+    view.read_replica = True
+    return view
+
+
+def _marked(view_func):
+    view_class = getattr(view_func, 'view_class', None)
+    return getattr(view_func, 'read_replica', False) or getattr(view_class, 'read_replica', False)
+
+
+def _read_from(alias, content):
+    iterator = iter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+async def _aread_from(alias, content):
+    iterator = aiter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+class ReplicaRouter:
+    # Reads go where ReplicaMiddleware pointed the request; everything else,
+    # including every write and migration, goes to the primary.
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in get_replica_settings()['ALIASES']
+
+
+class ReplicaMiddleware:
+    # GETs to views marked with reads_from_replica read from a random
+    # replica. A write sets a cookie that keeps the client's reads on the
+    # primary for PIN_SECONDS, so it sees its own writes despite lag.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_alias.set(None)
+        try:
+            response = self.bind_stream(self.get_response(request))
+        finally:
+            _read_alias.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = _read_alias.set(None)
+        try:
+            response = self.bind_stream(await self.get_response(request))
+        finally:
+            _read_alias.reset(token)
+        return self.pin(request, response)
+
+    def bind_stream(self, response):
+        # Streamed exports query while the server iterates the body, after
+        # the view has returned, so the request's alias goes with it.
+        alias = _read_alias.get()
+        if alias is not None and response.streaming:
+            if response.is_async:
+                response.streaming_content = _aread_from(alias, response.streaming_content)
+            else:
+                response.streaming_content = _read_from(alias, response.streaming_content)
+        return response
+
+    def pinned(self, request, options):
+        try:
+            return float(request.COOKIES.get(options['COOKIE_NAME'], 0)) > time.time()
+        except ValueError:
+            return False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        options = get_replica_settings()
+        if not options['ALIASES'] or request.method not in SAFE_METHODS or not _marked(view_func):
+            return None
+        # Read by the response cache, which a pinned client must bypass: an
+        # entry may have been filled from a replica that missed its write.
+        request.pinned_to_primary = self.pinned(request, options)
+        if not request.pinned_to_primary:
+            _read_alias.set(random.choice(options['ALIASES']))
+        return None
+
+    def pin(self, request, response):
+        options = get_replica_settings()
+        if options['ALIASES'] and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                options['COOKIE_NAME'],
+                f"{time.time() + options['PIN_SECONDS']:.3f}",
+                max_age=options['PIN_SECONDS'],
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -1,39 +1,206 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
+from . import metrics
 from .models import (
     Product,
     Store,
     Inventory,
-    Movement
+    Movement,
+    MOVEMENT_IN,
+    MOVEMENT_OUT,
+    MOVEMENT_TYPE_CHOICES
 )
 
+SUMMARY_DEFAULT_WINDOW = timedelta(days=30)
+SUMMARY_MAX_WINDOW = timedelta(days=731)
+# Inventory and Movement quantities are 32-bit integer columns.
+MAX_QUANTITY = 2147483647
+
+
+class TimedSerializerMixin:
+    # Response serializers report their time, lazy related lookups
+    # included, to the request metrics.
+    def to_representation(self, instance):
+        with metrics.serializing():
+            return super().to_representation(instance)
+
+class SparseFieldsMixin:
+    # `fields` keeps only the named fields (all of them when None).
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class ValuesRepresentationMixin:
+    # The fast rendering path (renderers.fast_rendering_enabled): the same
+    # representation as to_representation(), built from .values() rows
+    # without model instances or per-field calls. A layout lists (key,
+    # column) pairs in the serializer's field order, or (key, layout) for a
+    # nested serializer. It only covers fields whose representation is the
+    # column value as the JSON encoder writes it: ids, text, numbers,
+    # booleans and primary keys of relations.
+    @classmethod
+    def values_layout(cls, fields=None, prefix=''):
+        names = [name for name in cls._field_names() if fields is None or name in fields]
+        return [(name, f'{prefix}{cls._column(name)}') for name in names]
+
+    @classmethod
+    def _field_names(cls):
+        if '_values_fields' not in cls.__dict__:
+            cls._values_fields = {
+                name: isinstance(field, serializers.PrimaryKeyRelatedField)
+                for name, field in cls().fields.items()
+            }
+        return cls._values_fields
+
+    @classmethod
+    def _column(cls, name):
+        return f'{name}_id' if cls._field_names()[name] else name
+
+    @classmethod
+    def values_columns(cls, layout):
+        columns = []
+        for _, column in layout:
+            columns += cls.values_columns(column) if isinstance(column, list) else [column]
+        return columns
+
+    @classmethod
+    def values_queryset(cls, queryset, layout):
+        # Annotations are kept for keyset cursors (e.g. the search rank);
+        # from_values() leaves them out of the representation.
+        return queryset.values(*cls.values_columns(layout), *queryset.query.annotation_select)
+
+    @classmethod
+    def from_values(cls, rows, layout):
+        with metrics.serializing():
+            keys = [key for key, _ in layout]
+            if cls.values_columns(layout) == keys and all(len(row) == len(keys) for row in rows[:1]):
+                # values() already returns these keys, in this order, and
+                # no annotations besides.
+                return list(rows)
+            return [_shape(row, layout) for row in rows]
 
-class StoreSerializer(serializers.ModelSerializer):
+
+def _shape(row, layout):
+    return {
+        key: _shape(row, column) if isinstance(column, list) else row[column]
+        for key, column in layout
+    }
+
+class StoreSerializer(SparseFieldsMixin, ValuesRepresentationMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Store
         fields = '__all__'
         read_only_fields = ['id']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, ValuesRepresentationMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_vector']
         read_only_fields = ['id']
 
+class ProductImportSerializer(serializers.ModelSerializer):
+    # SKU uniqueness is resolved by the upsert itself, so the per-row
+    # lookup done by the default unique validator is dropped.
+    class Meta:
+        model = Product
+        fields = ['sku', 'name', 'description', 'category', 'price']
+        extra_kwargs = {'sku': {'validators': []}}
+
 class InventorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Inventory
         fields = '__all__'
         read_only_fields = ['id']
 
-class InventoryListSerializer(serializers.ModelSerializer):
-    # product = ProductSerializer(read_only=True)
-    # store = StoreSerializer(read_only=True)
-    
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+class InventoryListSerializer(ValuesRepresentationMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    # Product and store are ids unless expanded (?expand=product,store), and
+    # ?fields= keeps only the named fields, `product.name` for nested ones.
+    # prepare_queryset() fetches the expansions in the same query and only
+    # the columns that end up in the response.
+    expandable = {'product': ProductSerializer, 'store': StoreSerializer}
+
+    def __init__(self, *args, expand=(), fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = fields or {}
+        for relation in expand:
+            self.fields[relation] = self.expandable[relation](read_only=True, fields=fields.get(relation))
+        if '' in fields:
+            for name in set(self.fields) - fields['']:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_options(cls, query_params):
+        # Returns the serializer's `expand` and `fields` arguments. Fields
+        # are grouped by relation, '' holding the top-level ones, and naming
+        # a nested field expands its relation.
+        expand = set(_split(query_params.get('expand', '')))
+        fields = {}
+        for name in _split(query_params.get('fields', '')):
+            relation, _, field = name.rpartition('.')
+            fields.setdefault(relation, set()).add(field)
+
+        errors = {}
+        if expand - cls.expandable.keys():
+            errors['expand'] = [f"Can't expand: {', '.join(sorted(expand - cls.expandable.keys()))}."]
+        unknown = []
+        for relation, names in fields.items():
+            if relation == '':
+                available = set(cls.Meta.fields)
+            elif relation in cls.expandable:
+                available = set(cls.expandable[relation]().fields)
+            else:
+                available = set()
+            prefix = f'{relation}.' if relation else ''
+            unknown += [prefix + name for name in sorted(names - available)]
+        if unknown:
+            errors['fields'] = [f"Unknown fields: {', '.join(unknown)}."]
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        nested = fields.keys() - {''}
+        expand |= nested
+        if '' in fields:
+            fields[''] |= nested
+        return {'expand': expand, 'fields': fields}
+
+    @classmethod
+    def prepare_queryset(cls, queryset, expand, fields):
+        if not expand and not fields:
+            return queryset
+        # The keys stay loaded: keyset pagination orders by them.
+        columns = {'product', 'store', *fields.get('', cls.Meta.fields)}
+        for relation in expand:
+            names = fields.get(relation) or cls.expandable[relation]().fields
+            columns |= {f'{relation}__{name}' for name in names}
+        return queryset.select_related(*expand).only(*columns)
+
+    @classmethod
+    def values_layout(cls, expand=(), fields=None):
+        fields = fields or {}
+        layout = []
+        for key, column in super().values_layout(fields.get('')):
+            if key in expand:
+                column = cls.expandable[key].values_layout(fields.get(key), prefix=f'{key}__')
+            layout.append((key, column))
+        return layout
+
+    @classmethod
+    def values_columns(cls, layout):
+        # The keys stay loaded: keyset pagination orders by them.
+        return list(dict.fromkeys([*super().values_columns(layout), 'product_id', 'store_id']))
+
     class Meta:
         model = Inventory
-        fields = '__all__'
+        fields = ['id', 'product', 'store', 'quantity', 'minStock']
 
-class MovementSerializer(serializers.ModelSerializer):
+class MovementSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     type_display = serializers.SerializerMethodField()
 
     def get_type_display(self, obj):
@@ -48,9 +215,64 @@ class StockTransferSerializer(serializers.Serializer):
     product_id = serializers.UUIDField()
     source_store_id = serializers.UUIDField()
     target_store_id = serializers.UUIDField()
-    quantity = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY)
 
     def validate(self, data):
         if data['source_store_id'] == data['target_store_id']:
             raise serializers.ValidationError("Cannot transfer products to the same store.")
-        return data
\ No newline at end of file
+        return data
+
+class BatchTransferSerializer(serializers.Serializer):
+    lines = StockTransferSerializer(many=True, allow_empty=False, max_length=1000)
+    atomic = serializers.BooleanField(default=True)
+
+class ReplenishmentPlanQuerySerializer(serializers.Serializer):
+    category = serializers.CharField(required=False)
+    city = serializers.CharField(required=False)
+    # One batch transfer request's worth by default.
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=1000)
+
+class StockMatrixQuerySerializer(serializers.Serializer):
+    category = serializers.CharField(required=False)
+    city = serializers.CharField(required=False)
+    # Repeated: ?store=<id>&store=<id>
+    store = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False)
+
+class StockEventSerializer(serializers.Serializer):
+    event_id = serializers.CharField(max_length=100)
+    type = serializers.ChoiceField(choices=[MOVEMENT_IN, MOVEMENT_OUT])
+    product_id = serializers.UUIDField()
+    store_id = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_QUANTITY)
+
+class StockEventBatchSerializer(serializers.Serializer):
+    events = StockEventSerializer(many=True, allow_empty=False, max_length=5000)
+
+class MovementSummaryQuerySerializer(serializers.Serializer):
+    product = serializers.UUIDField(required=False)
+    store = serializers.UUIDField(required=False)
+    type = serializers.ChoiceField(choices=MOVEMENT_TYPE_CHOICES, required=False)
+    interval = serializers.ChoiceField(choices=['day', 'week'], default='day')
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'product' not in data and 'store' not in data:
+            raise serializers.ValidationError("Filter by product, store or both.")
+        until = data.setdefault('until', timezone.now())
+        since = data.setdefault('since', until - SUMMARY_DEFAULT_WINDOW)
+        if since >= until:
+            raise serializers.ValidationError("since must be before until.")
+        if until - since > SUMMARY_MAX_WINDOW:
+            raise serializers.ValidationError("The window can't be longer than two years.")
+        return data
+
+class StockAsOfQuerySerializer(serializers.Serializer):
+    product_id = serializers.UUIDField()
+    store_id = serializers.UUIDField()
+    at = serializers.DateTimeField()
+
+    def validate_at(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("Can't reconstruct stock in the future.")
+        return value
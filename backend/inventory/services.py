@@ -0,0 +1,378 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import PRODUCTS, REPLENISHMENT, get_response_cache
+from .models import (
+    Product,
+    Store,
+    Inventory,
+    Movement,
+    StockEvent,
+    MOVEMENT_IN,
+    MOVEMENT_TRANSFER
+)
+from .serializers import ProductImportSerializer
+
+NOT_ENOUGH_STOCK = 'Not enough stock to transfer.'
+NOT_ENOUGH_STOCK_TO_SELL = 'Not enough stock.'
+PRODUCT_NOT_FOUND = 'Product not found.'
+STORE_NOT_FOUND = 'Store not found.'
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_UPDATE_FIELDS = ['name', 'description', 'category', 'price']
+
+STOCK_EVENT_RETENTION = timedelta(days=30)
+
+
+class TransferError(Exception):
+    pass
+
+
+class InsufficientStock(TransferError):
+    pass
+
+
+class TransferNotFound(TransferError):
+    pass
+
+
+class BatchTransferError(Exception):
+    def __init__(self, report):
+        super().__init__('Batch transfer rejected.')
+        self.report = report
+
+
+def _debit(product_id, store_id, quantity):
+    # The quantity guard runs inside the UPDATE itself, so the check and the
+    # decrement happen under the same row lock and can't be interleaved.
+    return Inventory.objects.filter(
+        product_id=product_id,
+        store_id=store_id,
+        quantity__gte=quantity
+    ).update(quantity=F('quantity') - quantity)
+
+
+def _credit(product_id, store_id, quantity):
+    table = Inventory._meta.db_table
+    store_table = Store._meta.db_table
+    sql = (
+        f'INSERT INTO {table} (id, product_id, store_id, quantity, "minStock") '
+        f'SELECT gen_random_uuid(), %s, id, %s, 0 FROM {store_table} WHERE id = %s '
+        f'ON CONFLICT (product_id, store_id) '
+        f'DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity '
+        f'RETURNING quantity'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [str(product_id), quantity, str(store_id)])
+        return cursor.rowcount
+
+
+def _debit_failure(product_id, store_id):
+    if Inventory.objects.filter(product_id=product_id, store_id=store_id).exists():
+        return InsufficientStock(NOT_ENOUGH_STOCK)
+    if not Product.objects.filter(pk=product_id).exists():
+        return TransferNotFound(PRODUCT_NOT_FOUND)
+    if not Store.objects.filter(pk=store_id).exists():
+        return TransferNotFound(STORE_NOT_FOUND)
+    return InsufficientStock(NOT_ENOUGH_STOCK)
+
+
+def transfer_stock(product_id, source_store_id, target_store_id, quantity):
+    source = (product_id, source_store_id)
+    target = (product_id, target_store_id)
+
+    with transaction.atomic():
+        # Both rows are touched in (product, store) order, the same order the
+        # batch path locks in, so opposite transfers can't deadlock.
+        for key in sorted([source, target]):
+            if key == source and not _debit(*key, quantity):
+                raise _debit_failure(*key)
+            if key == target and not _credit(*key, quantity):
+                raise TransferNotFound(STORE_NOT_FOUND)
+
+        Movement.objects.create(
+            product_id=product_id,
+            sourceStore_id=source_store_id,
+            targetStore_id=target_store_id,
+            quantity=quantity,
+            type=MOVEMENT_TRANSFER
+        )
+        get_response_cache().invalidate(REPLENISHMENT)
+
+
+def _lock_inventory_rows(keys, create):
+    # Missing rows that stock may move into are inserted first, then every
+    # row is locked with FOR UPDATE. Both statements go in (product, store)
+    # order, so two batches can never wait on each other in a cycle. An
+    # insert that races another batch waits for it to finish, and the lock
+    # then sees the row it committed. Keys without a row (sources that were
+    # never stocked) are left out and count as a balance of 0.
+    table = Inventory._meta.db_table
+    with connection.cursor() as cursor:
+        if create:
+            cursor.execute(
+                f'INSERT INTO {table} (id, product_id, store_id, quantity, "minStock") '
+                f'SELECT gen_random_uuid(), key.product_id, key.store_id, 0, 0 '
+                f'FROM unnest(%s::uuid[], %s::uuid[]) AS key (product_id, store_id) '
+                f'ORDER BY key.product_id, key.store_id '
+                f'ON CONFLICT (product_id, store_id) DO NOTHING',
+                [[str(product_id) for product_id, _ in create], [str(store_id) for _, store_id in create]]
+            )
+        cursor.execute(
+            f'SELECT id, product_id, store_id, quantity FROM {table} '
+            f'WHERE (product_id, store_id) IN (SELECT * FROM unnest(%s::uuid[], %s::uuid[])) '
+            f'ORDER BY product_id, store_id '
+            f'FOR UPDATE',
+            [[str(product_id) for product_id, _ in keys], [str(store_id) for _, store_id in keys]]
+        )
+        return {
+            (product_id, store_id): (pk, quantity)
+            for pk, product_id, store_id, quantity in cursor.fetchall()
+        }
+
+
+def transfer_stock_batch(lines, atomic=True):
+    product_ids = {line['product_id'] for line in lines}
+    store_ids = {line['source_store_id'] for line in lines} | {line['target_store_id'] for line in lines}
+    results = [{'line': index, 'status': 'ok'} for index in range(len(lines))]
+
+    with transaction.atomic():
+        known_products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        known_stores = set(Store.objects.filter(pk__in=store_ids).values_list('pk', flat=True))
+
+        for index, line in enumerate(lines):
+            if line['product_id'] not in known_products:
+                results[index].update(status='error', error=PRODUCT_NOT_FOUND)
+            elif not {line['source_store_id'], line['target_store_id']} <= known_stores:
+                results[index].update(status='error', error=STORE_NOT_FOUND)
+
+        pending = [index for index, result in enumerate(results) if result['status'] == 'ok']
+        targets = {(lines[index]['product_id'], lines[index]['target_store_id']) for index in pending}
+        keys = targets | {(lines[index]['product_id'], lines[index]['source_store_id']) for index in pending}
+        rows = _lock_inventory_rows(keys, targets) if keys else {}
+        balances = {key: quantity for key, (_, quantity) in rows.items()}
+
+        # Lines are applied in request order against the locked balances, so a
+        # later line can spend stock that an earlier line moved in.
+        applied = []
+        for index in pending:
+            line = lines[index]
+            source = (line['product_id'], line['source_store_id'])
+            target = (line['product_id'], line['target_store_id'])
+            if balances.get(source, 0) < line['quantity']:
+                results[index].update(status='error', error=NOT_ENOUGH_STOCK)
+                continue
+            balances[source] -= line['quantity']
+            balances[target] += line['quantity']
+            applied.append(line)
+
+        failed = len(lines) - len(applied)
+        if atomic and failed:
+            raise BatchTransferError({'transferred': 0, 'failed': failed, 'results': results})
+
+        touched = {
+            (line['product_id'], line[field])
+            for line in applied
+            for field in ('source_store_id', 'target_store_id')
+        }
+        Inventory.objects.bulk_update(
+            [
+                Inventory(pk=rows[key][0], quantity=balances[key])
+                for key in sorted(touched)
+                if balances[key] != rows[key][1]
+            ],
+            ['quantity']
+        )
+        Movement.objects.bulk_create([
+            Movement(
+                product_id=line['product_id'],
+                sourceStore_id=line['source_store_id'],
+                targetStore_id=line['target_store_id'],
+                quantity=line['quantity'],
+                type=MOVEMENT_TRANSFER
+            ) for line in applied
+        ])
+        if applied:
+            get_response_cache().invalidate(REPLENISHMENT)
+
+    return {
+        'transferred': len(applied),
+        'failed': failed,
+        'results': results
+    }
+
+
+def _claim_events(event_ids):
+    # Inserting the ids is the dedupe check: only the ones that weren't
+    # stored yet come back. A concurrent batch claiming the same id waits on
+    # this transaction and gets it back only if this one rolls back. Ids are
+    # inserted in sorted order so overlapping batches can't deadlock.
+    table = StockEvent._meta.db_table
+    sql = (
+        f'INSERT INTO {table} (event_id, received_at) '
+        f'SELECT unnest(%s::varchar[]), statement_timestamp() '
+        f'ON CONFLICT (event_id) DO NOTHING '
+        f'RETURNING event_id'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [sorted(event_ids)])
+        return {event_id for event_id, in cursor.fetchall()}
+
+
+def _set_quantities(quantities):
+    # One UPDATE for every row, joined to the new quantities by id.
+    table = Inventory._meta.db_table
+    sql = (
+        f'UPDATE {table} SET quantity = new.quantity '
+        f'FROM unnest(%s::uuid[], %s::integer[]) AS new (id, quantity) '
+        f'WHERE {table}.id = new.id'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(quantities), list(quantities.values())])
+
+
+def record_stock_events(events):
+    # POS sales (OUT) and goods receipts (IN), recorded in bulk. Events are
+    # applied in request order against the locked balances, so a sale can
+    # spend stock received earlier in the same batch, and every (product,
+    # store) ends up with one net update however many events it had. An
+    # event id already recorded, by this batch or an earlier one, is
+    # skipped; rejected events are not recorded and can be sent again.
+    report = {'events': len(events), 'recorded': 0, 'duplicates': 0, 'failed': 0, 'errors': []}
+    first = {}
+    for index, event in enumerate(events):
+        first.setdefault(event['event_id'], index)
+
+    def reject(index, error):
+        report['failed'] += 1
+        report['errors'].append({'event': index, 'event_id': events[index]['event_id'], 'error': error})
+
+    with transaction.atomic():
+        claimed = _claim_events(list(first))
+        pending = [index for index in sorted(first.values()) if events[index]['event_id'] in claimed]
+        report['duplicates'] = len(events) - len(pending)
+
+        product_ids = {events[index]['product_id'] for index in pending}
+        store_ids = {events[index]['store_id'] for index in pending}
+        known_products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        known_stores = set(Store.objects.filter(pk__in=store_ids).values_list('pk', flat=True))
+        valid = []
+        for index in pending:
+            if events[index]['product_id'] not in known_products:
+                reject(index, PRODUCT_NOT_FOUND)
+            elif events[index]['store_id'] not in known_stores:
+                reject(index, STORE_NOT_FOUND)
+            else:
+                valid.append(index)
+
+        keys = {(events[index]['product_id'], events[index]['store_id']) for index in valid}
+        receipts = {
+            (events[index]['product_id'], events[index]['store_id'])
+            for index in valid
+            if events[index]['type'] == MOVEMENT_IN
+        }
+        rows = _lock_inventory_rows(keys, receipts) if keys else {}
+        balances = {key: quantity for key, (_, quantity) in rows.items()}
+
+        applied = []
+        for index in valid:
+            event = events[index]
+            key = (event['product_id'], event['store_id'])
+            if event['type'] == MOVEMENT_IN:
+                balances[key] += event['quantity']
+            elif balances.get(key, 0) >= event['quantity']:
+                balances[key] -= event['quantity']
+            else:
+                reject(index, NOT_ENOUGH_STOCK_TO_SELL)
+                continue
+            applied.append(event)
+
+        touched = {(event['product_id'], event['store_id']) for event in applied}
+        changed = {
+            rows[key][0]: balances[key]
+            for key in sorted(touched)
+            if balances[key] != rows[key][1]
+        }
+        if changed:
+            _set_quantities(changed)
+        Movement.objects.bulk_create([
+            Movement(
+                product_id=event['product_id'],
+                sourceStore_id=None if event['type'] == MOVEMENT_IN else event['store_id'],
+                targetStore_id=event['store_id'] if event['type'] == MOVEMENT_IN else None,
+                quantity=event['quantity'],
+                type=event['type']
+            ) for event in applied
+        ])
+        if applied:
+            get_response_cache().invalidate(REPLENISHMENT)
+
+        if report['errors']:
+            StockEvent.objects.filter(pk__in=[error['event_id'] for error in report['errors']]).delete()
+
+    report['recorded'] = len(applied)
+    return report
+
+
+def prune_stock_events(retention=STOCK_EVENT_RETENTION):
+    # Ids older than the retention can't be deduplicated anymore, so POS
+    # clients must not retry events older than that.
+    deleted, _ = StockEvent.objects.filter(received_at__lt=timezone.now() - retention).delete()
+    return deleted
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _import_chunk(chunk, offset, serializer, report):
+    # Rows are keyed by SKU so a SKU repeated within the chunk is written
+    # once, with its last values; Postgres rejects an upsert that would
+    # touch the same row twice.
+    products = {}
+    for index, row in enumerate(chunk, start=offset):
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as e:
+            report['failed'] += 1
+            report['errors'].append({'row': index, 'errors': e.detail})
+            continue
+        products[data['sku']] = Product(**data)
+
+    if not products:
+        return
+
+    with transaction.atomic():
+        existing = set(Product.objects.filter(sku__in=products).values_list('sku', flat=True))
+        Product.objects.bulk_create(
+            products.values(),
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=IMPORT_UPDATE_FIELDS
+        )
+    report['created'] += len(products.keys() - existing)
+    report['updated'] += len(products.keys() & existing)
+
+
+def import_products(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    # Each chunk is validated and upserted on its own, so memory stays flat
+    # however long the feed is and a bad row only costs that row.
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    serializer = ProductImportSerializer()
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            _import_chunk(chunk, report['rows'], serializer, report)
+            report['rows'] += len(chunk)
+    finally:
+        # bulk_create sends no post_save, so cached catalog pages are
+        # dropped here instead.
+        if report['created'] or report['updated']:
+            get_response_cache().invalidate(PRODUCTS)
+    return report
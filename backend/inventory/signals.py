@@ -0,0 +1,41 @@
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .cache import PRODUCTS, REPLENISHMENT, STORES, get_response_cache
+from .models import Inventory, Product, Store
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_responses(sender, **kwargs):
+    get_response_cache().invalidate(PRODUCTS)
+
+
+@receiver([post_save, post_delete], sender=Store)
+def invalidate_store_responses(sender, **kwargs):
+    # Plans only cover active stores and match them by city.
+    get_response_cache().invalidate(STORES, REPLENISHMENT)
+
+
+@receiver([post_save, post_delete], sender=Inventory)
+def invalidate_replenishment_plans(sender, **kwargs):
+    # Single-row edits (e.g. Admin); the bulk stock writes in services and
+    # reorder invalidate for themselves.
+    get_response_cache().invalidate(REPLENISHMENT)
+
+
+@receiver(request_finished)
+def record_pool_stats(sender, **kwargs):
+    # Pool gauges follow every request, so a scrape also sees workers that
+    # haven't served it.
+    metrics.record_pool_stats()
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    # Fires on every (re)connect of the same wrapper, which keeps its
+    # execute_wrappers, so the recorder is only added once.
+    if metrics.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.record_query)
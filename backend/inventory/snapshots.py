@@ -0,0 +1,159 @@
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import partitions
+from .models import Inventory, InventorySnapshot, InventorySnapshotRun, Movement
+
+SNAPSHOT_SOURCE = 'snapshot'
+INVENTORY_SOURCE = 'inventory'
+# Movement.timestamp is set by the application before its transaction
+# commits, so a movement can become visible well after its timestamp.
+# Snapshots are dated this far back: every movement stamped before then is
+# assumed to have committed by the time the snapshot is taken.
+SNAPSHOT_SETTLE_SECONDS = 300
+
+
+class LedgerExpired(Exception):
+    pass
+
+
+def take_snapshot():
+    # Writes today's (UTC) snapshot: only rows whose quantity differs from
+    # their latest earlier snapshot, including rows that disappeared (as 0).
+    # Re-running on the same day replaces that day's rows. Everything is read
+    # and written by one statement. taken_at is SNAPSHOT_SETTLE_SECONDS
+    # before it, and the movements already visible that are stamped after
+    # taken_at are taken back out of the live quantities, so the rows are the
+    # stock as of taken_at and replaying from it counts each movement once.
+    day = timezone.now().astimezone(dt_timezone.utc).date()
+    snapshot_table = InventorySnapshot._meta.db_table
+    run_table = InventorySnapshotRun._meta.db_table
+    inventory_table = Inventory._meta.db_table
+    movement_table = Movement._meta.db_table
+    sql = (
+        f'WITH cutoff AS ('
+        f'SELECT statement_timestamp() - make_interval(secs => %(settle)s) AS taken_at'
+        f'), recent AS ('
+        f'SELECT product_id, store_id, sum(quantity) AS quantity FROM ('
+        f'SELECT product_id, "targetStore_id" AS store_id, quantity FROM {movement_table} '
+        f'WHERE "timestamp" > (SELECT taken_at FROM cutoff) AND "targetStore_id" IS NOT NULL '
+        f'UNION ALL '
+        f'SELECT product_id, "sourceStore_id", -quantity FROM {movement_table} '
+        f'WHERE "timestamp" > (SELECT taken_at FROM cutoff) AND "sourceStore_id" IS NOT NULL'
+        f') legs GROUP BY product_id, store_id'
+        f'), live AS ('
+        f'SELECT inventory.product_id, inventory.store_id, '
+        f'inventory.quantity - coalesce(recent.quantity, 0) AS quantity '
+        f'FROM {inventory_table} inventory '
+        f'LEFT JOIN recent ON recent.product_id = inventory.product_id AND recent.store_id = inventory.store_id'
+        f'), previous AS ('
+        f'SELECT DISTINCT ON (product_id, store_id) product_id, store_id, quantity '
+        f'FROM {snapshot_table} WHERE day < %(day)s '
+        f'ORDER BY product_id, store_id, day DESC'
+        f'), run AS ('
+        f'INSERT INTO {run_table} (id, day, taken_at) '
+        f'SELECT gen_random_uuid(), %(day)s, taken_at FROM cutoff '
+        f'ON CONFLICT (day) DO UPDATE SET taken_at = EXCLUDED.taken_at'
+        f') '
+        f'INSERT INTO {snapshot_table} (id, day, product_id, store_id, quantity) '
+        f'SELECT gen_random_uuid(), %(day)s, '
+        f'coalesce(live.product_id, previous.product_id), '
+        f'coalesce(live.store_id, previous.store_id), '
+        f'coalesce(live.quantity, 0) '
+        f'FROM live '
+        f'FULL JOIN previous ON previous.product_id = live.product_id AND previous.store_id = live.store_id '
+        f'WHERE coalesce(live.quantity, 0) <> coalesce(previous.quantity, 0)'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {snapshot_table} WHERE day = %s', [day])
+        cursor.execute(sql, {'day': day, 'settle': SNAPSHOT_SETTLE_SECONDS})
+        return day, cursor.rowcount
+
+
+def _net_movements(product_id, store_id, after, until):
+    totals = Movement.objects.filter(
+        Q(sourceStore_id=store_id) | Q(targetStore_id=store_id),
+        product_id=product_id,
+        timestamp__gt=after,
+        timestamp__lte=until
+    ).aggregate(
+        moved_in=Coalesce(Sum('quantity', filter=Q(targetStore_id=store_id)), 0),
+        moved_out=Coalesce(Sum('quantity', filter=Q(sourceStore_id=store_id)), 0),
+        movements=Count('id')
+    )
+    return totals['moved_in'] - totals['moved_out'], totals['movements']
+
+
+def _live_quantity(product_id, store_id, at):
+    # Live Inventory minus every movement stamped after `at`, read by one
+    # statement so both come from the same snapshot: a transfer committing
+    # in between would otherwise be counted on one side only. Movements are
+    # stamped before their transaction commits, so any movement visible here
+    # is already part of the Inventory quantity, whatever its timestamp.
+    inventory_table = Inventory._meta.db_table
+    movement_table = Movement._meta.db_table
+    sql = (
+        f'SELECT coalesce(('
+        f'SELECT quantity FROM {inventory_table} WHERE product_id = %(product)s AND store_id = %(store)s'
+        f'), 0) '
+        f'- coalesce(sum(quantity) FILTER (WHERE "targetStore_id" = %(store)s), 0) '
+        f'+ coalesce(sum(quantity) FILTER (WHERE "sourceStore_id" = %(store)s), 0), '
+        f'count(*) '
+        f'FROM {movement_table} '
+        f'WHERE product_id = %(product)s '
+        f'AND ("sourceStore_id" = %(store)s OR "targetStore_id" = %(store)s) '
+        f'AND "timestamp" > %(at)s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'product': str(product_id), 'store': str(store_id), 'at': at})
+        return cursor.fetchone()
+
+
+def _snapshot_quantity(product_id, store_id, run):
+    quantity = InventorySnapshot.objects.filter(
+        product_id=product_id, store_id=store_id, day__lte=run.day
+    ).order_by('-day').values_list('quantity', flat=True).first()
+    return quantity or 0
+
+
+def stock_as_of(product_id, store_id, at):
+    # Starts from whichever known state is closest in time to `at` (the
+    # snapshot before it, the one after it, or live Inventory when no later
+    # snapshot exists) and replays only the movements in between, forwards
+    # or backwards. The work is bounded by the snapshot interval, not by the
+    # size of the ledger. Replays can't cross months whose movements expired
+    # into daily rollups.
+    since = partitions.retained_since()
+    if since is not None and at < since:
+        raise LedgerExpired(f'Movements before {since.isoformat()} have expired; stock before then is unknown.')
+    before = InventorySnapshotRun.objects.filter(taken_at__lte=at).order_by('-taken_at').first()
+    if before is not None and since is not None and before.taken_at < since:
+        before = None
+    after = InventorySnapshotRun.objects.filter(taken_at__gt=at).order_by('taken_at').first()
+
+    if after is not None:
+        later, later_at = after, after.taken_at
+    else:
+        later, later_at = None, timezone.now()
+    if before is not None and at - before.taken_at <= later_at - at:
+        base = _snapshot_quantity(product_id, store_id, before)
+        net, movements = _net_movements(product_id, store_id, before.taken_at, at)
+        quantity, source, source_at = base + net, SNAPSHOT_SOURCE, before.taken_at
+    elif later is not None:
+        base = _snapshot_quantity(product_id, store_id, later)
+        net, movements = _net_movements(product_id, store_id, at, later_at)
+        quantity, source, source_at = base - net, SNAPSHOT_SOURCE, later_at
+    else:
+        quantity, movements = _live_quantity(product_id, store_id, at)
+        source, source_at = INVENTORY_SOURCE, later_at
+
+    return {
+        'quantity': quantity,
+        'source': source,
+        'source_at': source_at,
+        'movements_applied': movements,
+    }
@@ -0,0 +1,105 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.db.models import Sum
+from django.test import TransactionTestCase
+
+from inventory import services
+from inventory.models import (
+    Product,
+    Store,
+    Inventory,
+    Movement,
+    StockEvent,
+    MOVEMENT_IN,
+    MOVEMENT_OUT
+)
+
+
+class TransferConcurrencyTests(TransactionTestCase):
+    workers = 8
+    transfers_per_worker = 25
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Hot SKU', price=10, category='Tools', sku='SKU-HOT'
+        )
+        self.stores = [
+            Store.objects.create(name=f'Store {i}', city='City') for i in range(4)
+        ]
+        for store in self.stores:
+            Inventory.objects.create(product=self.product, store=store, quantity=50, minStock=10)
+
+    def run_transfers(self, seed):
+        rng = random.Random(seed)
+        done = 0
+        try:
+            for _ in range(self.transfers_per_worker):
+                source, target = rng.sample(self.stores, 2)
+                try:
+                    services.transfer_stock(self.product.id, source.id, target.id, rng.randint(1, 30))
+                    done += 1
+                except services.InsufficientStock:
+                    pass
+        finally:
+            connection.close()
+        return done
+
+    def test_parallel_transfers_preserve_total_stock(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            done = sum(executor.map(self.run_transfers, range(self.workers)))
+
+        inventory = Inventory.objects.filter(product=self.product)
+        self.assertEqual(inventory.aggregate(Sum('quantity'))['quantity__sum'], 200)
+        self.assertFalse(inventory.filter(quantity__lt=0).exists())
+        self.assertEqual(Movement.objects.count(), done)
+
+        # Replaying the ledger over the starting stock must land on the
+        # stored quantities, i.e. no update was lost.
+        for store in self.stores:
+            moved_in = Movement.objects.filter(targetStore=store).aggregate(Sum('quantity'))['quantity__sum'] or 0
+            moved_out = Movement.objects.filter(sourceStore=store).aggregate(Sum('quantity'))['quantity__sum'] or 0
+            self.assertEqual(inventory.get(store=store).quantity, 50 + moved_in - moved_out)
+
+
+class StockEventConcurrencyTests(TransactionTestCase):
+    workers = 6
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Item {i}', price=1, category='Tools', sku=f'SKU-E{i}') for i in range(5)
+        ]
+        self.store = Store.objects.create(name='Till', city='City')
+        for product in self.products:
+            Inventory.objects.create(product=product, store=self.store, quantity=20, minStock=0)
+
+    def send(self, seed):
+        # Every worker sends the same 200 events (a POS retrying through
+        # several nodes), shuffled, so batches overlap in every order.
+        events = [
+            {
+                'event_id': f'till-{i}',
+                'type': MOVEMENT_OUT if i % 2 else MOVEMENT_IN,
+                'product_id': self.products[i % 5].id,
+                'store_id': self.store.id,
+                'quantity': 1 + i % 3,
+            }
+            for i in range(200)
+        ]
+        random.Random(seed).shuffle(events)
+        try:
+            return services.record_stock_events(events)['recorded']
+        finally:
+            connection.close()
+
+    def test_parallel_retries_record_each_event_once(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            recorded = sum(executor.map(self.send, range(self.workers)))
+
+        self.assertEqual(recorded, Movement.objects.count())
+        self.assertEqual(StockEvent.objects.count(), recorded)
+        for product in self.products:
+            moved_in = Movement.objects.filter(product=product, type=MOVEMENT_IN).aggregate(Sum('quantity'))['quantity__sum'] or 0
+            moved_out = Movement.objects.filter(product=product, type=MOVEMENT_OUT).aggregate(Sum('quantity'))['quantity__sum'] or 0
+            self.assertEqual(Inventory.objects.get(product=product).quantity, 20 + moved_in - moved_out)
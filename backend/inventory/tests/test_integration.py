@@ -1,11 +1,43 @@
-from rest_framework.test import APITestCase
+import asyncio
+import base64
+import copy
+import csv
+import io
+import json
+import os
+import struct
+import tempfile
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import parse_qsl
+
+from asgiref.sync import async_to_sync
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework.throttling import BaseThrottle
 from rest_framework import status
-from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from inventory import matrix, metrics, partitions, snapshots, views
+from inventory.cache import get_response_cache
 from inventory.models import (
     Product,
     Store,
-    Inventory
-    # Movimiento
+    Inventory,
+    Movement,
+    InventorySnapshotRun,
+    StockEvent,
+    MOVEMENT_IN,
+    MOVEMENT_OUT,
+    MOVEMENT_TRANSFER
 )
 
 class ProductAPITests(APITestCase):
@@ -26,6 +58,54 @@ class ProductAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
 
+    def test_list_products_cursor_pagination(self):
+        for i in range(4):
+            Product.objects.create(
+                name='Sample Product', description='', category='Books',
+                price='1.00', sku=f'SKU-C{i}'
+            )
+        seen = []
+        response = self.client.get(self.url_list, {'pagination': 'cursor', 'page_size': 2})
+        self.assertNotIn('count', response.data)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [product['id'] for product in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_list_products_count_modes(self):
+        response = self.client.get(self.url_list, {'pagination': 'cursor', 'count': 'exact'})
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get(self.url_list, {'count': 'approx', 'category': 'Books'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_list_products_approx_count_pages_by_rows(self):
+        for i in range(4):
+            Product.objects.create(
+                name=f'Extra {i}', description='', category='Books', price='1.00', sku=f'SKU-APPROX-{i}'
+            )
+        params = {'count': 'approx', 'page_size': 2}
+        # An estimate below the real count neither hides nor truncates pages.
+        with mock.patch('inventory.filters.estimate_count', return_value=1):
+            response = self.client.get(self.url_list, {**params, 'page': 2})
+            self.assertEqual(response.data['count'], 1)
+            self.assertEqual(len(response.data['results']), 2)
+            self.assertIsNotNone(response.data['next'])
+            response = self.client.get(self.url_list, {**params, 'page': 3})
+            self.assertEqual((len(response.data['results']), response.data['next']), (1, None))
+            self.assertEqual(self.client.get(self.url_list, {**params, 'page': 4}).status_code, 404)
+            response = self.client.get(self.url_list, {**params, 'page': 'last'})
+            self.assertEqual((response.data['count'], len(response.data['results'])), (5, 1))
+
+    def test_list_products_invalid_cursor(self):
+        response = self.client.get(self.url_list, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_create_product(self):
         new_product_data = {
             'name': 'New Product',
@@ -58,6 +138,148 @@ class ProductAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Product.objects.count(), 0)
 
+class ProductImportTests(APITestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.url = reverse('product-import')
+        Product.objects.create(
+            name='Old Name', description='Old.', category='Books',
+            price='5.00', sku='IMP-001'
+        )
+
+    def test_import_json_upserts_by_sku(self):
+        rows = [
+            {'sku': 'IMP-001', 'name': 'New Name', 'description': 'New.', 'category': 'Books', 'price': '6.50'},
+            {'sku': 'IMP-002', 'name': 'Second', 'description': 'Two.', 'category': 'Toys', 'price': '1.00'},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(Product.objects.get(sku='IMP-001').name, 'New Name')
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_import_ndjson_reports_bad_rows(self):
+        body = '\n'.join([
+            json.dumps({'sku': 'IMP-010', 'name': 'Ok', 'description': 'Toy.', 'category': 'Toys', 'price': '2.00'}),
+            '{not json',
+            json.dumps({'sku': 'IMP-011', 'name': 'No price', 'description': 'Toy.', 'category': 'Toys'}),
+        ])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rows'], 3)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2])
+        self.assertIn('price', response.data['errors'][1]['errors'])
+
+    def test_import_csv(self):
+        body = (
+            'sku,name,description,category,price\r\n'
+            'IMP-020,Café Table,"Round, oak",Home,120.00\r\n'
+            'IMP-020,Café Table,"Round, walnut",Home,130.00\r\n'
+        )
+        response = self.client.post(self.url, body.encode('utf-8'), content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+        product = Product.objects.get(sku='IMP-020')
+        self.assertEqual(product.name, 'Café Table')
+        self.assertEqual(product.description, 'Round, walnut')
+
+    def test_import_rejects_object_body(self):
+        response = self.client.post(self.url, {'sku': 'IMP-030'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_invalidates_cached_list(self):
+        list_url = reverse('product-list-create')
+        self.client.get(list_url)
+        rows = [{'sku': 'IMP-040', 'name': 'Fresh', 'description': 'Toy.', 'category': 'Toys', 'price': '1.00'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, rows, format='json')
+        response = self.client.get(list_url)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write('sku,name,description,category,price\n')
+            source.write('IMP-050,Lamp,Desk lamp,Home,15.00\n')
+            source.write('IMP-051,Broken,,Home,not-a-price\n')
+        self.addCleanup(os.remove, source.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', source.name, stdout=out, stderr=err)
+        self.assertIn('1 created, 0 updated, 1 failed', out.getvalue())
+        self.assertIn('rows/sec', out.getvalue())
+        self.assertEqual(json.loads(err.getvalue())['row'], 1)
+        self.assertTrue(Product.objects.filter(sku='IMP-050').exists())
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.url = reverse('product-list-create')
+        for name, category, sku in [
+            ('Cordless Drill', 'Tools', 'TOO-1001'),
+            ('Drill Bit Set', 'Tools', 'TOO-1002'),
+            ('Garden Hose', 'Garden', 'GAR-2001'),
+        ]:
+            Product.objects.create(
+                name=name, description=f'{name} for home use.',
+                category=category, price='9.99', sku=sku
+            )
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_search_by_name_prefix(self):
+        self.assertEqual(set(self.search(search='dril')), {'Cordless Drill', 'Drill Bit Set'})
+
+    def test_search_ranks_name_over_description(self):
+        Product.objects.create(
+            name='Workbench', description='Holds a drill.',
+            category='Tools', price='99.00', sku='TOO-1003'
+        )
+        self.assertEqual(self.search(search='drill')[-1], 'Workbench')
+
+    def test_search_by_sku(self):
+        self.assertEqual(self.search(search='gar-20'), ['Garden Hose'])
+
+    def test_search_tolerates_typos(self):
+        self.assertEqual(self.search(search='hoes garden'), ['Garden Hose'])
+
+    def test_search_with_filters(self):
+        self.assertEqual(self.search(search='drill bit', category='tools'), ['Drill Bit Set'])
+        self.assertEqual(self.search(search='drill', category='garden'), [])
+
+    def test_search_response_has_no_vector(self):
+        response = self.client.get(self.url, {'search': 'hose'})
+        self.assertNotIn('search_vector', response.data['results'][0])
+
+    @override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+    def test_search_cursor_pages_by_relevance(self):
+        Product.objects.create(
+            name='Anvil', description='Holds a drill.', category='Tools', price='99.00', sku='TOO-1003'
+        )
+        for search in ('drill', 'drils'):
+            for fast in (False, True):
+                with self.subTest(search=search, fast=fast), \
+                        override_settings(INVENTORY_FAST_RENDERING={'ENABLED': fast}):
+                    ranked = self.search(search=search)
+                    names, url = [], self.url
+                    params = {'search': search, 'pagination': 'cursor', 'page_size': 1}
+                    while url:
+                        # The page and the choice between full-text and
+                        # trigram matches are one query.
+                        with self.assertNumQueries(1):
+                            response = self.client.get(url, params)
+                        page = response.json()
+                        self.assertNotIn('search_rank', page['results'][0])
+                        names += [product['name'] for product in page['results']]
+                        url, params = page['next'], None
+                    self.assertEqual(names, ranked)
+        self.assertEqual(self.search(search='drill')[-1], 'Anvil')
+
+
 class InventoryAPITests(APITestCase):
     def setUp(self):
         self.product = Product.objects.create(
@@ -77,8 +299,94 @@ class InventoryAPITests(APITestCase):
         url = reverse('store-inventory', args=[str(self.store1.id)])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['quantity'], 100)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['quantity'], 100)
+        self.assertIsNone(response.data['next'])
+
+    def test_cursor_with_invalid_values(self):
+        # Well-formed cursors whose values don't fit the ordering columns.
+        cases = [
+            (reverse('store-inventory', args=[str(self.store1.id)]), {}, ['abc']),
+            (reverse('inventory-alerts'), {}, ['abc', 'def']),
+            (reverse('inventory-alerts'), {}, [{'a': 1}, 'x']),
+            (reverse('inventory-alerts'), {}, [str(self.store1.id), None]),
+            (reverse('movement-list'), {}, ['yesterday', str(self.store1.id)]),
+            (reverse('product-list-create'), {'pagination': 'cursor'}, ['a', 'zz']),
+        ]
+        for url, params, position in cases:
+            with self.subTest(url=url, position=position):
+                cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+                response = self.client.get(url, {**params, 'cursor': cursor})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_store_inventory_keyset_pages(self):
+        products = [
+            Product.objects.create(name=f'Part {i}', price=1, category='Tools', sku=f'SKU-P{i}')
+            for i in range(4)
+        ]
+        for product in products:
+            Inventory.objects.create(product=product, store=self.store1, quantity=1, minStock=0)
+        url = reverse('store-inventory', args=[str(self.store1.id)])
+
+        seen = []
+        response = self.client.get(url, {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [row['product'] for row in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(seen, sorted(seen, key=str))
+
+    def test_store_inventory_ndjson(self):
+        url = reverse('store-inventory', args=[str(self.store1.id)])
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['quantity'], 100)
+        self.assertEqual(row['product'], str(self.product.id))
+
+    def test_store_inventory_csv(self):
+        url = reverse('store-inventory', args=[str(self.store1.id)])
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'quantity', 'minStock', 'product', 'store'])
+        self.assertEqual(rows[1][1], '100')
+
+    def test_store_inventory_expand(self):
+        url = reverse('store-inventory', args=[str(self.store1.id)])
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'expand': 'product,store'})
+        row = response.data['results'][0]
+        self.assertEqual(row['product']['sku'], 'SKU-003')
+        self.assertEqual(row['store']['name'], 'Store A')
+        self.assertEqual(row['quantity'], 100)
+
+    def test_store_inventory_fields(self):
+        url = reverse('store-inventory', args=[str(self.store1.id)])
+        response = self.client.get(url, {'fields': 'quantity,product.sku,product.price'})
+        self.assertEqual(response.data['results'], [
+            {'product': {'sku': 'SKU-003', 'price': Decimal('10.00')}, 'quantity': 100}
+        ])
+        response = self.client.get(url, {'expand': 'store', 'fields': 'product.name'})
+        row = response.data['results'][0]
+        self.assertEqual(row['product'], {'name': 'Widget'})
+        self.assertEqual(row['store']['city'], 'City A')
+        self.assertEqual(row['minStock'], 10)
+
+    def test_store_inventory_invalid_options(self):
+        url = reverse('store-inventory', args=[str(self.store1.id)])
+        response = self.client.get(url, {'expand': 'movements', 'fields': 'quantity,price,store.owner'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'expand': ["Can't expand: movements."],
+            'fields': ['Unknown fields: price, store.owner.'],
+        })
 
     def test_transfer_stock(self):
         url = reverse('transfer-stock')
@@ -119,10 +427,1026 @@ class InventoryAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Not enough stock to transfer', response.data['error'])
 
+    def test_transfer_creates_target_inventory(self):
+        store3 = Store.objects.create(name='Store C', city='City C')
+        url = reverse('transfer-stock')
+        data = {
+            'product_id': str(self.product.id),
+            'source_store_id': str(self.store1.id),
+            'target_store_id': str(store3.id),
+            'quantity': 10
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Inventory.objects.get(product=self.product, store=store3).quantity, 10)
+        self.assertEqual(Movement.objects.count(), 1)
+
+    def test_transfer_unknown_target_store(self):
+        url = reverse('transfer-stock')
+        data = {
+            'product_id': str(self.product.id),
+            'source_store_id': str(self.store1.id),
+            'target_store_id': '00000000-0000-0000-0000-000000000000',
+            'quantity': 10
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.inventory1.refresh_from_db()
+        self.assertEqual(self.inventory1.quantity, 100)
+
 
     def test_inventory_alerts(self):
         url = reverse('inventory-alerts')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['quantity'], 5)
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['quantity'], 5)
+
+    def test_inventory_alerts_filters(self):
+        url = reverse('inventory-alerts')
+        response = self.client.get(url, {'city': 'city b', 'category': 'tools'})
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get(url, {'store': str(self.store1.id)})
+        self.assertEqual(len(response.data['results']), 0)
+        response = self.client.get(url, {'city': 'City A'})
+        self.assertEqual(len(response.data['results']), 0)
+
+    def test_inventory_alerts_expand(self):
+        url = reverse('inventory-alerts')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'expand': 'store', 'fields': 'quantity,product.name'})
+        self.assertEqual(response.data['results'], [
+            {'product': {'name': 'Widget'}, 'quantity': 5}
+        ])
+        response = self.client.get(url, {'expand': 'store', 'fields': 'store.name,quantity'})
+        self.assertEqual(response.data['results'], [{'store': {'name': 'Store B'}, 'quantity': 5}])
+
+    def test_inventory_alerts_follow_transfers(self):
+        url = reverse('inventory-alerts')
+        self.client.post(reverse('transfer-stock'), {
+            'product_id': str(self.product.id),
+            'source_store_id': str(self.store1.id),
+            'target_store_id': str(self.store2.id),
+            'quantity': 95
+        }, format='json')
+        response = self.client.get(url)
+        self.assertEqual([row['store'] for row in response.data['results']], [self.store1.id])
+
+class BatchTransferAPITests(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Widget',
+            price=10,
+            category='Tools',
+            sku='SKU-004'
+        )
+        self.store1 = Store.objects.create(name='Store A', city='City A')
+        self.store2 = Store.objects.create(name='Store B', city='City B')
+        self.store3 = Store.objects.create(name='Store C', city='City C')
+        self.inventory1 = Inventory.objects.create(
+            product=self.product, store=self.store1, quantity=100, minStock=10)
+        self.inventory2 = Inventory.objects.create(
+            product=self.product, store=self.store2, quantity=5, minStock=10)
+        self.url = reverse('transfer-stock-batch')
+
+    def line(self, source, target, quantity):
+        return {
+            'product_id': str(self.product.id),
+            'source_store_id': str(source.id),
+            'target_store_id': str(target.id),
+            'quantity': quantity
+        }
+
+    def test_batch_transfer(self):
+        data = {'lines': [
+            self.line(self.store1, self.store2, 30),
+            self.line(self.store2, self.store3, 20),
+        ]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transferred'], 2)
+        self.inventory1.refresh_from_db()
+        self.inventory2.refresh_from_db()
+        self.assertEqual(self.inventory1.quantity, 70)
+        self.assertEqual(self.inventory2.quantity, 15)
+        self.assertEqual(Inventory.objects.get(product=self.product, store=self.store3).quantity, 20)
+        self.assertEqual(Movement.objects.count(), 2)
+
+    def test_batch_transfer_all_or_nothing(self):
+        data = {'lines': [
+            self.line(self.store1, self.store2, 30),
+            self.line(self.store2, self.store3, 500),
+        ]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertIn('Not enough stock to transfer', response.data['results'][1]['error'])
+        self.inventory1.refresh_from_db()
+        self.assertEqual(self.inventory1.quantity, 100)
+        self.assertFalse(Inventory.objects.filter(store=self.store3).exists())
+        self.assertEqual(Movement.objects.count(), 0)
+
+    def test_batch_transfer_partial(self):
+        data = {'atomic': False, 'lines': [
+            self.line(self.store1, self.store2, 30),
+            self.line(self.store3, self.store2, 1),
+        ]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transferred'], 1)
+        self.assertEqual(response.data['results'][1]['status'], 'error')
+        self.inventory2.refresh_from_db()
+        self.assertEqual(self.inventory2.quantity, 35)
+        self.assertFalse(Inventory.objects.filter(store=self.store3).exists())
+        self.assertEqual(Movement.objects.count(), 1)
+
+    def test_batch_transfer_only_writes_changed_rows(self):
+        def row_versions():
+            with connections['default'].cursor() as cursor:
+                cursor.execute('SELECT id, ctid FROM inventory_inventory')
+                return dict(cursor.fetchall())
+
+        before = row_versions()
+        data = {'atomic': False, 'lines': [self.line(self.store2, self.store3, 50)]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.data['failed'], 1)
+        # Locking doesn't rewrite the rows, and the target row created for
+        # the failed line is kept, empty.
+        after = row_versions()
+        self.assertEqual(after[self.inventory2.id], before[self.inventory2.id])
+        self.assertEqual(Inventory.objects.get(product=self.product, store=self.store3).quantity, 0)
+
+
+class StockEventAPITests(APITestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Widget', price=10, category='Tools', sku='SKU-POS')
+        self.other_product = Product.objects.create(name='Gadget', price=5, category='Tools', sku='SKU-POS2')
+        self.store1 = Store.objects.create(name='Store A', city='City A')
+        self.store2 = Store.objects.create(name='Store B', city='City B')
+        self.inventory = Inventory.objects.create(
+            product=self.product, store=self.store1, quantity=10, minStock=2)
+        self.url = reverse('stock-events')
+
+    def event(self, event_id, type, quantity=1, product=None, store=None):
+        return {
+            'event_id': event_id,
+            'type': type,
+            'product_id': str((product or self.product).id),
+            'store_id': str((store or self.store1).id),
+            'quantity': quantity
+        }
+
+    def test_net_update_per_product_and_store(self):
+        events = [self.event(f'sale-{i}', 'OUT') for i in range(8)]
+        events += [self.event('receipt-1', 'IN', 5), self.event('receipt-2', 'IN', 3, store=self.store2)]
+        response = self.client.post(self.url, {'events': events}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'events': 10, 'recorded': 10, 'duplicates': 0, 'failed': 0, 'errors': []})
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 7)
+        self.assertEqual(Inventory.objects.get(product=self.product, store=self.store2).quantity, 3)
+        self.assertEqual(Inventory.objects.get(product=self.product, store=self.store2).minStock, 0)
+
+        movements = Movement.objects.filter(product=self.product)
+        self.assertEqual(movements.filter(type='OUT', sourceStore=self.store1, targetStore=None).count(), 8)
+        self.assertEqual(movements.filter(type='IN', sourceStore=None).count(), 2)
+
+    def test_quantity_out_of_range(self):
+        response = self.client.post(self.url, {'events': [self.event('receipt-1', 'IN', 2 ** 31)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StockEvent.objects.exists())
+
+    def test_duplicates_are_skipped(self):
+        events = [self.event('sale-1', 'OUT', 2), self.event('sale-1', 'OUT', 2)]
+        response = self.client.post(self.url, {'events': events}, format='json')
+        self.assertEqual((response.data['recorded'], response.data['duplicates']), (1, 1))
+
+        # A retry of the whole batch changes nothing.
+        response = self.client.post(self.url, {'events': events + [self.event('sale-2', 'OUT')]}, format='json')
+        self.assertEqual((response.data['recorded'], response.data['duplicates']), (1, 2))
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 7)
+        self.assertEqual(Movement.objects.count(), 2)
+        self.assertEqual(StockEvent.objects.count(), 2)
+
+    def test_sales_need_stock(self):
+        # A sale can spend stock received earlier in the same batch.
+        events = [
+            self.event('sale-1', 'OUT', 12),
+            self.event('receipt-1', 'IN', 4),
+            self.event('sale-2', 'OUT', 12),
+            self.event('sale-3', 'OUT', 1, product=self.other_product),
+            self.event('sale-4', 'OUT', 1, store=self.store2),
+        ]
+        response = self.client.post(self.url, {'events': events}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recorded'], 2)
+        self.assertEqual(response.data['errors'], [
+            {'event': 0, 'event_id': 'sale-1', 'error': 'Not enough stock.'},
+            {'event': 3, 'event_id': 'sale-3', 'error': 'Not enough stock.'},
+            {'event': 4, 'event_id': 'sale-4', 'error': 'Not enough stock.'},
+        ])
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.quantity, 2)
+        # No row is left behind for the rejected sales, and their ids can be
+        # sent again once the stock is there.
+        self.assertFalse(Inventory.objects.filter(store=self.store2).exists())
+        self.assertEqual(set(StockEvent.objects.values_list('event_id', flat=True)), {'receipt-1', 'sale-2'})
+        response = self.client.post(self.url, {'events': [self.event('sale-1', 'OUT', 2)]}, format='json')
+        self.assertEqual(response.data['recorded'], 1)
+
+    def test_unknown_product_or_store(self):
+        missing = Product(pk=uuid.uuid4())
+        events = [
+            self.event('receipt-1', 'IN', product=missing),
+            self.event('receipt-2', 'IN', store=Store(pk=uuid.uuid4())),
+        ]
+        response = self.client.post(self.url, {'events': events}, format='json')
+        self.assertEqual([error['error'] for error in response.data['errors']], ['Product not found.', 'Store not found.'])
+        self.assertFalse(StockEvent.objects.exists())
+
+    def test_invalid_events(self):
+        for events in ([], [self.event('transfer-1', 'TRANSFER')], [self.event('sale-1', 'OUT', 0)]):
+            with self.subTest(events=events):
+                response = self.client.post(self.url, {'events': events}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Movement.objects.exists())
+
+    def test_prune_stock_events(self):
+        self.client.post(self.url, {'events': [self.event('receipt-1', 'IN')]}, format='json')
+        StockEvent.objects.update(received_at=timezone.now() - timedelta(days=31))
+        self.client.post(self.url, {'events': [self.event('receipt-2', 'IN')]}, format='json')
+        call_command('prune_stock_events', stdout=io.StringIO())
+        self.assertEqual(list(StockEvent.objects.values_list('event_id', flat=True)), ['receipt-2'])
+
+
+class ReplenishmentPlanAPITests(APITestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.stores = [Store.objects.create(name=f'Store {i}', city=f'City {i // 2}') for i in range(4)]
+        for i in range(3):
+            product = Product.objects.create(name=f'Item {i}', category='Tools', price=1, sku=f'SKU-PLAN{i}')
+            for store, quantity in zip(self.stores, [0, 30, 4, 25]):
+                Inventory.objects.create(product=product, store=store, quantity=quantity, minStock=10)
+        self.url = reverse('replenishment-plan')
+
+    def test_plan_can_be_submitted(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'category': 'tools'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transfers'], 6)
+        self.assertEqual(response.data['unmet_quantity'], 0)
+        # Each store is short on the same product as its city neighbour
+        # has spare, so nothing crosses cities.
+        self.assertEqual(response.data['same_city_quantity'], response.data['quantity'])
+
+        response = self.client.post(reverse('transfer-stock-batch'), response.json(), format='json')
+        self.assertEqual(response.data['transferred'], 6)
+        self.assertEqual(self.client.get(reverse('inventory-alerts')).data['results'], [])
+
+    def test_limit(self):
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(response.data['transfers'], 6)
+        self.assertEqual(len(response.data['lines']), 2)
+        response = self.client.get(self.url, {'limit': 1001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_plan_is_cached_per_scope(self):
+        self.client.get(self.url, {'category': 'tools'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'category': 'TOOLS', 'limit': 2})
+        self.assertEqual((response.data['transfers'], len(response.data['lines'])), (6, 2))
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'category': 'tools', 'city': 'City 0'})
+
+    def test_applied_plan_is_not_served_again(self):
+        plan = self.client.get(self.url).json()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('transfer-stock-batch'), plan, format='json')
+        self.assertEqual(response.data['transferred'], 6)
+        response = self.client.get(self.url)
+        self.assertEqual((response.data['transfers'], response.data['lines']), (0, []))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'plan.json')
+            out = io.StringIO()
+            call_command('plan_replenishment', '--city', 'City 0', '--output', path, '--apply', stdout=out)
+            with open(path) as plan:
+                self.assertEqual(len(json.load(plan)['lines']), 3)
+        self.assertIn('Applied 3 transfers, 0 failed.', out.getvalue())
+        self.assertFalse(Inventory.objects.filter(store__city='City 0', quantity__lt=F('minStock')).exists())
+        self.assertTrue(Inventory.objects.filter(store__city='City 1', quantity__lt=F('minStock')).exists())
+
+
+class StockMatrixAPITests(APITestCase):
+    def setUp(self):
+        self.stores = sorted(
+            (Store.objects.create(name=f'Store {i}', city=f'City {i // 2}') for i in range(3)),
+            key=lambda store: store.id
+        )
+        self.products = sorted(
+            (
+                Product.objects.create(name=f'Item {i}', category=category, price=1, sku=f'SKU-MATRIX{i}')
+                for i, category in enumerate(['Tools', 'Tools', 'Books'])
+            ),
+            key=lambda product: product.id
+        )
+        self.quantities = {}
+        for i, product in enumerate(self.products):
+            for j, store in enumerate(self.stores):
+                # One cell without an Inventory row.
+                if (i, j) != (0, 1):
+                    Inventory.objects.create(product=product, store=store, quantity=10 * i + j, minStock=0)
+                    self.quantities[i, j] = 10 * i + j
+        self.url = reverse('inventory-matrix')
+
+    def expected(self, products, stores):
+        return [self.quantities.get((i, j), 0) for i in products for j in stores]
+
+    def test_json(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'products': [str(product.id) for product in self.products],
+            'stores': [str(store.id) for store in self.stores],
+            'quantities': self.expected(range(3), range(3)),
+        })
+
+    def test_filters(self):
+        city = self.stores[0].city
+        in_city = [j for j, store in enumerate(self.stores) if store.city == city]
+        tools = [i for i, product in enumerate(self.products) if product.category == 'Tools']
+        response = self.client.get(self.url, {'category': 'tools', 'city': city.lower()})
+        self.assertEqual(response.data['products'], [str(self.products[i].id) for i in tools])
+        self.assertEqual(response.data['stores'], [str(self.stores[j].id) for j in in_city])
+        self.assertEqual(response.data['quantities'], self.expected(tools, in_city))
+
+        response = self.client.get(self.url, {'store': [self.stores[2].id, self.stores[0].id]})
+        self.assertEqual(response.data['stores'], [str(self.stores[0].id), str(self.stores[2].id)])
+        self.assertEqual(response.data['quantities'], self.expected(range(3), [0, 2]))
+
+        response = self.client.get(self.url, {'city': 'Nowhere'})
+        self.assertEqual(response.data, {'products': [], 'stores': [], 'quantities': []})
+        response = self.client.get(self.url, {'store': 'not-a-uuid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_binary(self):
+        response = self.client.get(self.url, {'format': 'bin'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        content = response.content
+        products, stores = struct.unpack_from('<II', content)
+        self.assertEqual((products, stores), (3, 3))
+        ids = [uuid.UUID(bytes=content[8 + 16 * i:24 + 16 * i]) for i in range(products + stores)]
+        self.assertEqual(ids, [product.id for product in self.products] + [store.id for store in self.stores])
+        quantities = struct.unpack_from(f'<{products * stores}i', content, 8 + 16 * (products + stores))
+        self.assertEqual(list(quantities), self.expected(range(3), range(3)))
+
+    @mock.patch.object(matrix, 'MATRIX_CHUNK_SIZE', 1)
+    def test_chunks(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['quantities'], self.expected(range(3), range(3)))
+
+    def test_inactive_stores_are_left_out(self):
+        Store.objects.filter(pk=self.stores[1].pk).update(is_active=False)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['stores'], [str(self.stores[0].id), str(self.stores[2].id)])
+        self.assertEqual(response.data['quantities'], self.expected(range(3), [0, 2]))
+
+    @mock.patch.object(matrix, 'MATRIX_MAX_CELLS', 8)
+    def test_too_large(self):
+        # Rejected after counting the products, before the cells are read.
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('filter by category, city or store', response.data['error'])
+        self.assertEqual(self.client.get(self.url, {'category': 'tools'}).status_code, status.HTTP_200_OK)
+
+
+class MovementAPITests(APITestCase):
+    def setUp(self):
+        self.product1 = Product.objects.create(name='P1', description='D', category='C', price='1.00', sku='MOV-1')
+        self.product2 = Product.objects.create(name='P2', description='D', category='C', price='1.00', sku='MOV-2')
+        self.store1 = Store.objects.create(name='Store 1', city='City')
+        self.store2 = Store.objects.create(name='Store 2', city='City')
+        self.today = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.record(self.product1, None, self.store1, 50, MOVEMENT_IN, days_ago=2)
+        self.record(self.product1, self.store1, self.store2, 20, MOVEMENT_TRANSFER, days_ago=1)
+        self.record(self.product1, self.store2, None, 5, MOVEMENT_OUT, days_ago=1)
+        self.record(self.product2, None, self.store2, 30, MOVEMENT_IN, days_ago=0)
+
+    def record(self, product, source, target, quantity, type, days_ago):
+        movement = Movement.objects.create(
+            product=product, sourceStore=source, targetStore=target, quantity=quantity, type=type
+        )
+        Movement.objects.filter(pk=movement.pk).update(timestamp=self.today - timedelta(days=days_ago))
+        return movement
+
+    def test_list_movements_newest_first(self):
+        response = self.client.get(reverse('movement-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quantities = [m['quantity'] for m in response.data['results']]
+        self.assertEqual((quantities[0], quantities[-1]), (30, 50))
+        timestamps = [m['timestamp'] for m in response.data['results']]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_list_movements_keyset_pages(self):
+        seen = []
+        url = reverse('movement-list') + '?page_size=1'
+        while url:
+            response = self.client.get(url)
+            seen.extend(m['id'] for m in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_filter_movements_by_store_either_direction(self):
+        response = self.client.get(reverse('movement-list'), {'store': self.store2.id})
+        self.assertEqual(sorted(m['quantity'] for m in response.data['results']), [5, 20, 30])
+        response = self.client.get(reverse('movement-list'), {'target_store': self.store2.id})
+        self.assertEqual(sorted(m['quantity'] for m in response.data['results']), [20, 30])
+
+    def test_filter_movements_by_product_type_and_time(self):
+        params = {
+            'product': self.product1.id,
+            'type': MOVEMENT_TRANSFER,
+            'since': (self.today - timedelta(days=1, hours=1)).isoformat(),
+            'until': self.today.isoformat(),
+        }
+        response = self.client.get(reverse('movement-list'), params)
+        self.assertEqual([m['quantity'] for m in response.data['results']], [20])
+
+    def test_summary_for_store_by_day(self):
+        response = self.client.get(reverse('movement-summary'), {
+            'store': self.store2.id,
+            'since': (self.today - timedelta(days=7)).isoformat(),
+            'until': (self.today + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = {row['period']: row for row in response.json()['results']}
+        yesterday = (self.today - timedelta(days=1)).date().isoformat()
+        self.assertEqual(rows[yesterday], {'period': yesterday, 'quantity_in': 20, 'quantity_out': 5, 'net': 15})
+        self.assertEqual(rows[self.today.date().isoformat()]['net'], 30)
+
+    def test_summary_for_product_nets_out_transfers(self):
+        response = self.client.get(reverse('movement-summary'), {
+            'product': self.product1.id,
+            'interval': 'week',
+            'since': (self.today - timedelta(days=14)).isoformat(),
+        })
+        results = response.json()['results']
+        self.assertEqual(sum(row['net'] for row in results), 45)
+        self.assertEqual(sum(row['quantity_in'] for row in results), 70)
+
+    def test_summary_includes_rolled_up_history(self):
+        old = self.record(self.product1, self.store1, None, 7, MOVEMENT_OUT, days_ago=3 * 365)
+        partitions.ensure_partitions()
+        partitions.expire_partitions(retain_months=24)
+        self.assertFalse(Movement.objects.filter(pk=old.pk).exists())
+        response = self.client.get(reverse('movement-summary'), {
+            'store': self.store1.id,
+            'since': (self.today - timedelta(days=3 * 365 + 1)).isoformat(),
+            'until': (self.today - timedelta(days=3 * 365 - 1)).isoformat(),
+        })
+        self.assertEqual(
+            [(row['quantity_in'], row['quantity_out']) for row in response.json()['results']],
+            [(0, 7)]
+        )
+
+    def test_summary_requires_product_or_store(self):
+        response = self.client.get(reverse('movement-summary'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('movement-summary'), {
+            'store': self.store1.id, 'since': '2026-02-01', 'until': '2026-01-01'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class InventoryAsOfTests(APITestCase):
+    def setUp(self):
+        self.url = reverse('inventory-as-of')
+        self.product = Product.objects.create(name='P', description='D', category='C', price='1.00', sku='ASOF-1')
+        self.store1 = Store.objects.create(name='Store 1', city='City')
+        self.store2 = Store.objects.create(name='Store 2', city='City')
+        self.inventory1 = Inventory.objects.create(product=self.product, store=self.store1, quantity=100, minStock=0)
+        snapshots.take_snapshot()
+        self.now = timezone.now()
+        InventorySnapshotRun.objects.update(taken_at=self.now - timedelta(days=10))
+
+        self.move(self.store1, self.store2, 30, MOVEMENT_TRANSFER, days_ago=8)
+        self.move(self.store1, None, 10, MOVEMENT_OUT, days_ago=2)
+        self.inventory1.quantity = 60
+        self.inventory1.save()
+        Inventory.objects.create(product=self.product, store=self.store2, quantity=30, minStock=0)
+
+    def move(self, source, target, quantity, type, days_ago):
+        movement = Movement.objects.create(
+            product=self.product, sourceStore=source, targetStore=target, quantity=quantity, type=type
+        )
+        Movement.objects.filter(pk=movement.pk).update(timestamp=self.now - timedelta(days=days_ago))
+
+    def as_of(self, store, days_ago):
+        return self.client.get(self.url, {
+            'product_id': self.product.id,
+            'store_id': store.id,
+            'at': (self.now - timedelta(days=days_ago)).isoformat(),
+        })
+
+    def test_replays_forward_from_earlier_snapshot(self):
+        response = self.as_of(self.store1, 5)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity'], 70)
+        self.assertEqual(response.data['source'], 'snapshot')
+        self.assertEqual(response.data['movements_applied'], 1)
+        self.assertEqual(self.as_of(self.store2, 5).data['quantity'], 30)
+        self.assertEqual(self.as_of(self.store2, 9).data['quantity'], 0)
+
+    def test_replays_backward_from_live_inventory(self):
+        response = self.as_of(self.store1, 3)
+        self.assertEqual((response.data['quantity'], response.data['source']), (70, 'inventory'))
+        self.assertEqual(self.as_of(self.store1, 1).data['quantity'], 60)
+
+    def test_live_inventory_and_movements_agree(self):
+        # A movement that commits while the request runs can be stamped after
+        # the request started; it is in the live quantity, so it is replayed.
+        self.move(self.store1, None, 5, MOVEMENT_OUT, days_ago=-1)
+        self.inventory1.quantity = 55
+        self.inventory1.save()
+        response = self.as_of(self.store1, 1)
+        self.assertEqual((response.data['quantity'], response.data['source']), (60, 'inventory'))
+        self.assertEqual(response.data['movements_applied'], 1)
+
+    def test_replays_backward_from_later_snapshot(self):
+        response = self.as_of(self.store1, 20)
+        self.assertEqual((response.data['quantity'], response.data['source']), (100, 'snapshot'))
+
+    def test_expired_ledger(self):
+        self.move(self.store1, self.store2, 5, MOVEMENT_TRANSFER, days_ago=3 * 365)
+        partitions.ensure_partitions(since=self.now - timedelta(days=40))
+        partitions.expire_partitions(retain_months=12)
+        response = self.as_of(self.store1, 2 * 365)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expired', response.data['error'])
+        self.assertEqual(self.as_of(self.store1, 5).data['quantity'], 70)
+
+    def test_validation(self):
+        response = self.client.get(self.url, {
+            'product_id': self.product.id, 'store_id': self.store1.id,
+            'at': (self.now + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {
+            'product_id': self.store1.id, 'store_id': self.store1.id, 'at': self.now.isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.product = Product.objects.create(
+            name='Cached', description='', category='Books', price='5.00', sku='SKU-CACHE'
+        )
+        self.url_list = reverse('product-list-create')
+        self.url_detail = reverse('product-detail', args=[str(self.product.id)])
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.client.get(self.url_list, {'category': 'Books'})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url_list, {'category': 'Books', 'price_min': ''})
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_write_invalidates(self):
+        self.client.get(self.url_detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url_detail, {'name': 'Renamed'}, format='json')
+        response = self.client.get(self.url_detail)
+        self.assertEqual(response.json()['name'], 'Renamed')
+
+    def test_invalidation_waits_for_commit(self):
+        self.client.get(self.url_detail)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.name = 'Renamed'
+            self.product.save()
+            # Until the commit, other requests still read the old row, and
+            # whatever they cache stays under the old version.
+            self.assertEqual(self.client.get(self.url_detail).json()['name'], 'Cached')
+        callbacks[0]()
+        self.assertEqual(self.client.get(self.url_detail).json()['name'], 'Renamed')
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url_list)['ETag']
+        response = self.client.get(self.url_list, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_stock_filters_bypass_cache(self):
+        self.client.get(self.url_list, {'has_stock': 'true'})
+        with self.assertNumQueries(1):
+            self.client.get(self.url_list, {'has_stock': 'true'})
+
+    @override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+    def test_cache_disabled(self):
+        self.client.get(self.url_detail)
+        with self.assertNumQueries(1):
+            self.client.get(self.url_detail)
+
+
+@override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name='Store 1', city='City')
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Widget {i}', category='Tools', price='1.00', sku=f'SKU-M{i}'
+            )
+            Inventory.objects.create(product=product, store=self.store, quantity=1, minStock=5)
+
+    def sample(self, name, view):
+        return metrics.REGISTRY.get_sample_value(name, {'view': view}) or 0
+
+    def test_headers_are_opt_in(self):
+        response = self.client.get('/api/stores/')
+        self.assertNotIn('X-Query-Count', response)
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(INVENTORY_REQUEST_METRICS={'HEADERS': True})
+    def test_query_count_header(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(f'/api/stores/{self.store.id}/inventory/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(int(response['X-Query-Count']), len(queries))
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;dur=[\d.]+;desc="{len(queries)} queries", serializer;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+
+    @override_settings(INVENTORY_REQUEST_METRICS={'HEADERS': True}, ROOT_URLCONF='inventorymgmt.asgi_urls')
+    async def test_async_views_count_queries(self):
+        # The async ORM runs the queries in another thread.
+        response = await self.async_client.get('/api/inventory/alerts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(int(response['X-Query-Count']), 0)
+
+    def test_view_histograms(self):
+        view = 'inventory-alerts'
+        names = (
+            'inventory_request_queries_count', 'inventory_request_queries_sum',
+            'inventory_request_serializer_seconds_sum', 'inventory_response_size_bytes_sum'
+        )
+        before = {name: self.sample(name, view) for name in names}
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get('/api/inventory/alerts/')
+        after = {name: self.sample(name, view) - before[name] for name in names}
+
+        self.assertEqual(after['inventory_request_queries_count'], 1)
+        self.assertEqual(after['inventory_request_queries_sum'], len(queries))
+        self.assertGreater(after['inventory_request_serializer_seconds_sum'], 0)
+        self.assertEqual(after['inventory_response_size_bytes_sum'], len(response.content))
+        self.assertIn(
+            b'inventory_request_duration_seconds_count{method="GET",view="inventory-alerts"}',
+            self.client.get('/metrics').content
+        )
+
+    @override_settings(INVENTORY_REQUEST_METRICS={'SLOW_QUERY_COUNT': 1, 'SLOW_QUERY_TOP': 1})
+    def test_slow_requests_are_logged(self):
+        url = f'/api/stores/{self.store.id}/inventory/'
+        with self.assertLogs('inventory.metrics', 'WARNING') as logs:
+            with CaptureQueriesContext(connections['default']) as queries:
+                self.client.get(url)
+
+        self.assertEqual(len(logs.records), 1)
+        message = logs.records[0].getMessage()
+        self.assertTrue(message.startswith(f'GET {url} ran {len(queries)} queries'))
+        self.assertEqual(len(message.splitlines()), 2)
+
+
+@override_settings(ROOT_URLCONF='inventorymgmt.asgi_urls', INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+class AsyncReadViewTests(APITestCase):
+    def setUp(self):
+        self.stores = [
+            Store.objects.create(name=f'Store {i}', city='City A' if i % 2 else 'City B')
+            for i in range(3)
+        ]
+        for i in range(5):
+            product = Product.objects.create(
+                name=f'Widget {i}', description='A widget', category='Tools' if i % 2 else 'Books',
+                price=f'{i + 1}.00', sku=f'SKU-A{i}'
+            )
+            for store in self.stores:
+                Inventory.objects.create(product=product, store=store, quantity=i * 3, minStock=5)
+
+    def assertSameResponse(self, name, params=None, args=()):
+        url = reverse(name, args=args)
+        with override_settings(ROOT_URLCONF='inventorymgmt.urls'):
+            expected = self.client.get(url, params)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_read_views_are_async(self):
+        for url in ('/api/products/', '/api/stores/', '/api/inventory/alerts/',
+                    f'/api/stores/{self.stores[0].id}/inventory/'):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+
+    def test_product_list_matches_sync(self):
+        for params in (
+            {}, {'category': 'Tools'}, {'page': 2, 'page_size': 2}, {'page': 'last', 'page_size': 2},
+            {'count': 'approx'}, {'count': 'approx', 'page_size': 2, 'page': 3},
+            {'count': 'approx', 'page': 9}, {'count': 'approx', 'page': 'last', 'page_size': 2},
+            {'pagination': 'cursor', 'page_size': 2, 'count': 'exact'},
+            {'search': 'widg'}, {'search': 'wigdet'}, {'has_stock': 'true'},
+            {'price_min': 'abc'}, {'page': 9}, {'cursor': 'bogus'},
+        ):
+            with self.subTest(params=params):
+                self.assertSameResponse('product-list-create', params)
+
+    def test_product_list_cursor_pages(self):
+        seen = []
+        response = self.assertSameResponse('product-list-create', {'pagination': 'cursor', 'page_size': 2})
+        while response.json()['next'] is not None:
+            seen += [product['id'] for product in response.json()['results']]
+            response = self.client.get(response.json()['next'])
+        seen += [product['id'] for product in response.json()['results']]
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_access_checks_match_sync(self):
+        class Closed(BaseThrottle):
+            def allow_request(self, request, view):
+                return False
+
+            def wait(self):
+                return 30
+
+        user = User.objects.create_user('clerk')
+        for view_class, name, args in (
+            (views.StoreListAPIView, 'store-list', ()),
+            (views.store_inventory.cls, 'store-inventory', [str(self.stores[0].id)]),
+            (views.inventory_alerts.cls, 'inventory-alerts', ()),
+        ):
+            with self.subTest(name=name), mock.patch.object(view_class, 'permission_classes', [IsAuthenticated]):
+                self.client.logout()
+                self.assertEqual(self.assertSameResponse(name, args=args).status_code, status.HTTP_403_FORBIDDEN)
+                self.client.force_login(user)
+                self.assertEqual(self.assertSameResponse(name, args=args).status_code, status.HTTP_200_OK)
+                with mock.patch.object(view_class, 'throttle_classes', [Closed]):
+                    response = self.assertSameResponse(name, args=args)
+                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                self.assertEqual(response['Retry-After'], '30')
+
+    def test_store_list_matches_sync(self):
+        self.assertSameResponse('store-list')
+        self.assertSameResponse('store-list', {'pagination': 'cursor', 'page_size': 1})
+
+    def test_store_inventory_matches_sync(self):
+        args = [str(self.stores[0].id)]
+        response = self.assertSameResponse('store-inventory', {'page_size': 2}, args)
+        next_url = response.json()['next']
+        self.assertSameResponse('store-inventory', dict(parse_qsl(next_url.split('?')[1])), args)
+        response = self.client.get(reverse('store-inventory', args=[str(Product.objects.first().id)]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_store_inventory_ndjson(self):
+        url = reverse('store-inventory', args=[str(self.stores[0].id)])
+        response = await self.async_client.get(url, {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(row['quantity'] for row in rows), [0, 3, 6, 9, 12])
+        self.assertEqual([row['product'] for row in rows], sorted(row['product'] for row in rows))
+
+    def test_inventory_alerts_match_sync(self):
+        for params in ({}, {'city': 'city a'}, {'category': 'Books', 'page_size': 1}, {'store': 'nope'}):
+            with self.subTest(params=params):
+                self.assertSameResponse('inventory-alerts', params)
+
+    def test_expand_and_fields_match_sync(self):
+        options = (
+            {'expand': 'product,store'}, {'fields': 'quantity,store.city'},
+            {'expand': 'product', 'fields': 'product.sku', 'page_size': 2}, {'expand': 'bogus'},
+        )
+        for params in options:
+            with self.subTest(params=params):
+                self.assertSameResponse('store-inventory', params, [str(self.stores[0].id)])
+                self.assertSameResponse('inventory-alerts', params)
+
+    def test_product_create_goes_to_sync_view(self):
+        response = self.client.post(reverse('product-list-create'), {
+            'name': 'New', 'description': 'New product', 'category': 'Tools', 'price': '3.00', 'sku': 'SKU-NEW'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Product.objects.filter(sku='SKU-NEW').exists())
+        response = self.client.delete(reverse('inventory-alerts'))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    @override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'lru'})
+    def test_shares_response_cache_with_sync_views(self):
+        url = reverse('product-list-create')
+        with override_settings(ROOT_URLCONF='inventorymgmt.urls'):
+            expected = self.client.get(url, {'category': 'Tools'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'category': 'Tools'})
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['ETag'], expected['ETag'])
+
+
+@override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+class FastRenderingTests(APITestCase):
+    # The fast path must return the serializers' bytes exactly.
+    def setUp(self):
+        self.stores = [
+            Store.objects.create(name='Tienda Ñandú', city='Zürich', address='Rue "du" Lac\n3'),
+            Store.objects.create(name='Store   line', city='City', address=None, is_active=False),
+        ]
+        for i, (name, price) in enumerate([
+            ('Widget', '0.01'), ('Café 😀', '99999999.99'), ('Tab\tand \\ slash', '10.00'),
+            ('Control \x01\x1f', '1234.50'), ('Para graph', '0.10'),
+        ]):
+            product = Product.objects.create(
+                name=name, description=f'{name} <b>&</b>', category='Tools' if i % 2 else 'Books',
+                price=price, sku=f'SKU-F{i}'
+            )
+            for store in self.stores:
+                Inventory.objects.create(product=product, store=store, quantity=i * 3, minStock=5)
+
+    def assertSameBytes(self, name, params=None, args=()):
+        url = reverse(name, args=args)
+        for urlconf in ('inventorymgmt.urls', 'inventorymgmt.asgi_urls'):
+            with override_settings(ROOT_URLCONF=urlconf):
+                expected = self.client.get(url, params)
+                with override_settings(INVENTORY_FAST_RENDERING={'ENABLED': True}):
+                    response = self.client.get(url, params)
+            with self.subTest(params=params, urlconf=urlconf):
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+        return expected
+
+    def test_product_and_store_lists(self):
+        for params in (
+            {}, {'category': 'Tools'}, {'page': 2, 'page_size': 2}, {'search': 'widget'},
+            {'pagination': 'cursor', 'page_size': 2, 'count': 'exact'}, {'has_stock': 'true'},
+        ):
+            self.assertSameBytes('product-list-create', params)
+        self.assertSameBytes('store-list')
+        self.assertSameBytes('store-list', {'pagination': 'cursor', 'page_size': 1})
+
+    def test_cursor_pages(self):
+        params = {'page_size': 2}
+        for _ in range(4):
+            next_link = json.loads(self.assertSameBytes('inventory-alerts', params).content)['next']
+            if next_link is None:
+                break
+            params = dict(parse_qsl(next_link.split('?', 1)[1]))
+        else:
+            self.fail('Expected the alerts to end within four pages.')
+
+    def test_store_inventory_options(self):
+        for params in (
+            {}, {'page_size': 2}, {'expand': 'product,store'}, {'expand': 'store'},
+            {'fields': 'quantity,product.name,product.price'}, {'fields': 'minStock'},
+            {'expand': 'product', 'fields': 'id,store'}, {'expand': 'bogus'},
+        ):
+            self.assertSameBytes('store-inventory', params, args=[self.stores[0].id])
+
+    def test_alert_filters(self):
+        for params in ({'city': 'zürich'}, {'category': 'Tools', 'expand': 'product'}, {'store': 'bogus'}):
+            self.assertSameBytes('inventory-alerts', params)
+
+
+REPLICAS ={'ALIASES': ['replica'], 'PIN_SECONDS': 5}
+
+# A second connection to the test database (a test mirror of default)
+# stands in for a read replica. Only ReadReplicaTests routes reads to it.
+_replica_settings = copy.deepcopy(connections.settings['default'])
+_replica_settings['TEST']['MIRROR'] = 'default'
+connections.settings.setdefault('replica', _replica_settings)
+
+
+@override_settings(INVENTORY_READ_REPLICAS=REPLICAS, INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+class ReadReplicaTests(APITransactionTestCase):
+    # The replica connection only sees committed rows, hence no TestCase.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Widget', description='A widget', category='Tools', price='10.00', sku='SKU-R1'
+        )
+        self.stores = [Store.objects.create(name=f'Store {i}', city='City') for i in range(2)]
+        for store in self.stores:
+            Inventory.objects.create(product=self.product, store=store, quantity=5, minStock=10)
+
+    def assertReadsFrom(self, alias, method, url, *args, **kwargs):
+        other = 'default' if alias == 'replica' else 'replica'
+        with CaptureQueriesContext(connections[alias]) as used, \
+                CaptureQueriesContext(connections[other]) as unused:
+            response = getattr(self.client, method)(url, *args, **kwargs)
+            if response.streaming:
+                # Exports query as the body is read.
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        self.assertTrue(used.captured_queries)
+        self.assertEqual(unused.captured_queries, [])
+        return response
+
+    def test_listing_reads_go_to_replica(self):
+        for url in (
+            reverse('product-list-create'),
+            reverse('store-list'),
+            reverse('store-inventory', args=[str(self.stores[0].id)]),
+            reverse('inventory-alerts'),
+            reverse('replenishment-plan'),
+            reverse('inventory-matrix'),
+        ):
+            with self.subTest(url=url):
+                self.assertReadsFrom('replica', 'get', url)
+
+    def test_exports_read_from_replica(self):
+        url = reverse('store-inventory', args=[str(self.stores[0].id)])
+        for export in ('ndjson', 'csv'):
+            with self.subTest(format=export):
+                self.assertReadsFrom('replica', 'get', url, {'format': export})
+
+    @override_settings(ROOT_URLCONF='inventorymgmt.asgi_urls')
+    def test_async_exports_read_from_replica(self):
+        url = reverse('store-inventory', args=[str(self.stores[0].id)])
+
+        async def export():
+            response = await self.async_client.get(url, {'format': 'ndjson'})
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        with CaptureQueriesContext(connections['replica']) as used, \
+                CaptureQueriesContext(connections['default']) as unused:
+            content = async_to_sync(export)()
+        self.assertEqual(len(content.splitlines()), 1)
+        self.assertTrue(used.captured_queries)
+        self.assertEqual(unused.captured_queries, [])
+
+    def test_other_reads_stay_on_primary(self):
+        self.assertReadsFrom('default', 'get', reverse('product-detail', args=[str(self.product.id)]))
+
+    def test_writes_go_to_primary_and_pin_reads(self):
+        response = self.assertReadsFrom('default', 'post', reverse('product-list-create'), {
+            'name': 'New', 'description': 'New product', 'category': 'Tools', 'price': '3.00', 'sku': 'SKU-R2'
+        }, format='json')
+        self.assertIn('inventory_primary_until', response.cookies)
+        self.assertEqual(response.cookies['inventory_primary_until']['max-age'], 5)
+        self.assertReadsFrom('default', 'get', reverse('product-list-create'))
+
+    def test_transfer_pins_reads_until_window_ends(self):
+        self.assertReadsFrom('default', 'post', reverse('transfer-stock'), {
+            'product_id': str(self.product.id),
+            'source_store_id': str(self.stores[0].id),
+            'target_store_id': str(self.stores[1].id),
+            'quantity': 2,
+        }, format='json')
+        url = reverse('store-inventory', args=[str(self.stores[1].id)])
+        self.assertReadsFrom('default', 'get', url)
+        self.client.cookies['inventory_primary_until'] = str(timezone.now().timestamp() - 1)
+        self.assertReadsFrom('replica', 'get', url)
+
+    @override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'lru'})
+    def test_pinned_reads_bypass_response_cache(self):
+        get_response_cache().clear()
+        url = reverse('product-list-create')
+        self.client.get(url)
+        self.client.cookies['inventory_primary_until'] = str(timezone.now().timestamp() + 5)
+        self.assertReadsFrom('default', 'get', url)
+
+    @override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'lru'})
+    def test_replica_reads_after_a_write_are_not_cached(self):
+        # The replica may not have the write yet, so nothing it returns is
+        # cached until PIN_SECONDS after the bump.
+        get_response_cache().clear()
+        url = reverse('product-list-create')
+        self.client.post(url, {
+            'name': 'New', 'description': 'New product', 'category': 'Tools', 'price': '3.00', 'sku': 'SKU-R5'
+        }, format='json')
+        self.client.cookies.clear()
+        self.assertReadsFrom('replica', 'get', url)
+        self.assertReadsFrom('replica', 'get', url)
+        with override_settings(INVENTORY_READ_REPLICAS={**REPLICAS, 'PIN_SECONDS': 0}):
+            self.client.get(url)
+            with CaptureQueriesContext(connections['replica']) as queries:
+                self.client.get(url)
+        self.assertEqual(queries.captured_queries, [])
+
+    @override_settings(ROOT_URLCONF='inventorymgmt.asgi_urls')
+    def test_async_views_read_from_replica(self):
+        self.assertReadsFrom('replica', 'get', reverse('product-list-create'))
+        self.assertReadsFrom('replica', 'get', reverse('inventory-alerts'))
+        self.assertReadsFrom('default', 'post', reverse('product-list-create'), {
+            'name': 'New', 'description': 'New product', 'category': 'Tools', 'price': '3.00', 'sku': 'SKU-R3'
+        }, format='json')
+        self.assertReadsFrom('default', 'get', reverse('inventory-alerts'))
+
+    @override_settings(INVENTORY_READ_REPLICAS={'ALIASES': []})
+    def test_without_replicas_everything_uses_primary(self):
+        response = self.assertReadsFrom('default', 'post', reverse('product-list-create'), {
+            'name': 'New', 'description': 'New product', 'category': 'Tools', 'price': '3.00', 'sku': 'SKU-R4'
+        }, format='json')
+        self.assertNotIn('inventory_primary_until', response.cookies)
+        self.assertReadsFrom('default', 'get', reverse('product-list-create'))
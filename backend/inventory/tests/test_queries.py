@@ -0,0 +1,254 @@
+from collections import Counter
+from itertools import combinations
+
+from asgiref.sync import async_to_sync
+from faker import Faker
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from inventory.datagen import load_products, load_stores
+from inventory.metrics import fingerprint
+from inventory.models import Product, Store
+
+SEED = 18
+STORES = 12
+PRODUCTS = 250
+MOVEMENTS = 4
+
+# Every combination of these is requested from the product list.
+PRODUCT_FILTERS = {
+    'category': 'books',
+    'price_min': '10',
+    'price_max': '400',
+    'has_stock': 'true',
+    'min_total_stock': '50',
+    'max_total_stock': '5000',
+    'search': 'steel',
+}
+PRODUCT_PAGINATION = (
+    {},
+    {'page': 'last', 'page_size': 2},
+    {'count': 'approx'},
+    {'count': 'none'},
+    {'pagination': 'cursor', 'page_size': 100},
+    {'pagination': 'cursor', 'count': 'exact'},
+)
+URLCONFS = ('inventorymgmt.urls', 'inventorymgmt.asgi_urls')
+
+
+async def drain(content):
+    return b''.join([chunk async for chunk in content])
+
+
+def catalog_budget(params):
+    # One query for the page and one for the count (page numbers always
+    # need it, cursors only when asked); search picks between full-text and
+    # trigram matches within them.
+    cursor = params.get('pagination') == 'cursor'
+    count = not cursor or params.get('count') in ('exact', 'approx')
+    return 1 + count
+
+
+# Query budgets at the seeded volume: a store holds PRODUCTS rows and a
+# catalog page up to 100, so anything that queries per row blows through
+# them. The response cache is off, so every request reaches the database.
+@override_settings(INVENTORY_RESPONSE_CACHE={'BACKEND': 'none'})
+class QueryBudgetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store_ids = load_stores(SEED, STORES, Faker())
+        load_products(SEED, 0, PRODUCTS, store_ids, movements=MOVEMENTS)
+        # The stock rollup is applied by a deferred trigger at commit, and
+        # ?count=approx reads the table statistics.
+        connection.check_constraints()
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Product._meta.db_table}')
+        cls.store = Store.objects.get(pk=store_ids[0])
+        cls.other_store = Store.objects.get(pk=store_ids[1])
+        cls.product = Product.objects.order_by('sku').first()
+        cls.products = list(Product.objects.order_by('sku')[:50])
+
+    def assertQueryBudget(self, budget, method, url, data=None, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, **extra)
+            if response.streaming:
+                # Exports query as they stream, so the body is read in here.
+                if response.is_async:
+                    async_to_sync(drain)(response.streaming_content)
+                else:
+                    b''.join(response.streaming_content)
+        if len(queries) > budget:
+            sql = [query['sql'] for query in queries]
+            repeated = Counter(fingerprint(statement) for statement in sql).most_common(3)
+            self.fail('\n'.join([
+                f'{method.upper()} {url} {data or ""} ran {len(sql)} queries, over its budget of {budget}.',
+                'Most repeated:',
+                *(f'  {count}x {statement}' for statement, count in repeated),
+                'All queries:',
+                *(f'  {index}. {statement}' for index, statement in enumerate(sql, start=1)),
+            ]))
+        return response
+
+    def transfer_line(self, product, quantity=1):
+        return {
+            'product_id': str(product.id),
+            'source_store_id': str(self.store.id),
+            'target_store_id': str(self.other_store.id),
+            'quantity': quantity,
+        }
+
+    def test_product_list_filters(self):
+        names = list(PRODUCT_FILTERS)
+        for size in range(len(names) + 1):
+            for subset in combinations(names, size):
+                params = {name: PRODUCT_FILTERS[name] for name in subset}
+                for urlconf in URLCONFS:
+                    with self.subTest(params=params, urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                        response = self.assertQueryBudget(
+                            catalog_budget(params), 'get', reverse('product-list-create'), params
+                        )
+                        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_product_list_pagination(self):
+        for filters in ({}, {'has_stock': 'false'}, PRODUCT_FILTERS):
+            for pagination in PRODUCT_PAGINATION:
+                params = {**filters, **pagination}
+                for urlconf in URLCONFS:
+                    with self.subTest(params=params, urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                        response = self.assertQueryBudget(
+                            catalog_budget(params), 'get', reverse('product-list-create'), params
+                        )
+                        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_product_detail(self):
+        url = reverse('product-detail', args=[self.product.id])
+        self.assertQueryBudget(1, 'get', url)
+        self.assertQueryBudget(2, 'patch', url, {'price': '12.50'}, format='json')
+        self.assertQueryBudget(3, 'put', url, {
+            'sku': self.product.sku, 'name': 'Renamed', 'description': 'Renamed', 'category': 'Books', 'price': '3.00'
+        }, format='json')
+        response = self.assertQueryBudget(2, 'post', reverse('product-list-create'), {
+            'sku': 'BUDGET-1', 'name': 'New', 'description': 'New', 'category': 'Books', 'price': '3.00'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_product_import(self):
+        # One lookup and one upsert per chunk, whatever its size.
+        for count in (1, 200):
+            rows = [
+                {'sku': f'BULK-{count}-{index}', 'name': 'Bulk', 'description': 'Bulk', 'category': 'Books', 'price': '1.00'}
+                for index in range(count)
+            ]
+            with self.subTest(rows=count):
+                response = self.assertQueryBudget(4, 'post', reverse('product-import'), rows, format='json')
+                self.assertEqual(response.data['created'], count)
+
+    def test_store_list(self):
+        for params in ({}, {'page_size': 100}, {'pagination': 'cursor'}):
+            for urlconf in URLCONFS:
+                with self.subTest(params=params, urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                    self.assertQueryBudget(catalog_budget(params), 'get', reverse('store-list'), params)
+
+    def test_store_inventory(self):
+        url = reverse('store-inventory', args=[self.store.id])
+        for params in (
+            {}, {'page_size': 1000}, {'format': 'ndjson'}, {'format': 'csv'},
+            {'expand': 'product,store', 'page_size': 1000}, {'fields': 'quantity,product.sku'},
+        ):
+            for urlconf in URLCONFS:
+                with self.subTest(params=params, urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                    response = self.assertQueryBudget(2, 'get', url, params)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_inventory_alerts(self):
+        for params in (
+            {}, {'page_size': 1000}, {'store': self.store.id}, {'city': self.store.city},
+            {'category': 'Books', 'page_size': 1000}, {'expand': 'product,store', 'page_size': 1000},
+            {'fields': 'quantity,product.name,store.city', 'page_size': 1000},
+        ):
+            for urlconf in URLCONFS:
+                with self.subTest(params=params, urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                    response = self.assertQueryBudget(1, 'get', reverse('inventory-alerts'), params)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(INVENTORY_FAST_RENDERING={'ENABLED': True})
+    def test_fast_rendering(self):
+        # .values() rows, expansions joined in the same query.
+        inventory_url = reverse('store-inventory', args=[self.store.id])
+        for urlconf in URLCONFS:
+            with override_settings(ROOT_URLCONF=urlconf):
+                for params in ({'page_size': 1000}, {'expand': 'product,store', 'page_size': 1000}):
+                    with self.subTest(params=params, urlconf=urlconf):
+                        self.assertQueryBudget(2, 'get', inventory_url, params)
+                        self.assertQueryBudget(1, 'get', reverse('inventory-alerts'), params)
+                for params in ({'page_size': 100}, {'pagination': 'cursor', 'search': 'steel'}):
+                    with self.subTest(params=params, urlconf=urlconf):
+                        self.assertQueryBudget(catalog_budget(params), 'get', reverse('product-list-create'), params)
+
+    def test_transfer(self):
+        response = self.assertQueryBudget(
+            5, 'post', reverse('transfer-stock'), self.transfer_line(self.product), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_batch_transfer(self):
+        for products in (self.products[:1], self.products):
+            with self.subTest(lines=len(products)):
+                lines = [self.transfer_line(product) for product in products]
+                # Missing target rows are inserted before the rows are locked.
+                response = self.assertQueryBudget(
+                    8, 'post', reverse('transfer-stock-batch'), {'lines': lines}, format='json'
+                )
+                self.assertEqual(response.data['transferred'], len(products))
+
+    def test_replenishment_plan(self):
+        for params in ({}, {'category': 'Books'}, {'city': self.store.city}):
+            with self.subTest(params=params):
+                response = self.assertQueryBudget(1, 'get', reverse('replenishment-plan'), params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_stock_matrix(self):
+        # The store axis, the products in the category, then the cells.
+        for params in ({}, {'category': 'Books'}, {'city': self.store.city}, {'format': 'bin'}):
+            with self.subTest(params=params):
+                response = self.assertQueryBudget(3, 'get', reverse('inventory-matrix'), params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_stock_events(self):
+        # Claim, product and store lookups, missing receipt rows, lock, one
+        # net update and the movement insert (plus the savepoint), whatever
+        # the number of events. Each product is received before it is sold.
+        for count in (1, 50, 1000):
+            events = [
+                {
+                    'event_id': f'budget-{count}-{index}',
+                    'type': 'OUT' if index // len(self.products) % 2 else 'IN',
+                    'product_id': str(self.products[index % len(self.products)].id),
+                    'store_id': str(self.store.id),
+                    'quantity': 1,
+                }
+                for index in range(count)
+            ]
+            with self.subTest(events=count):
+                response = self.assertQueryBudget(9, 'post', reverse('stock-events'), {'events': events}, format='json')
+                self.assertEqual(response.data['failed'], 0)
+
+    def test_movements(self):
+        for params in (
+            {}, {'page_size': 1000}, {'store': self.store.id}, {'product': self.product.id, 'type': 'TRANSFER'},
+        ):
+            with self.subTest(params=params):
+                self.assertQueryBudget(1, 'get', reverse('movement-list'), params)
+        self.assertQueryBudget(2, 'get', reverse('movement-summary'), {'store': self.store.id, 'interval': 'week'})
+
+    def test_inventory_as_of(self):
+        # Includes the check for expired movements. The live quantity and the
+        # movements since `at` are read together.
+        self.assertQueryBudget(6, 'get', reverse('inventory-as-of'), {
+            'product_id': self.product.id, 'store_id': self.store.id, 'at': timezone.now().isoformat()
+        })
@@ -1,16 +1,51 @@
+import random
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+import psycopg
 from faker import Faker
-from django.test import TestCase
+from psycopg_pool import ConnectionPool
+from rest_framework.renderers import JSONRenderer
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
 
+from inventory.datagen import product_rows
+from inventory import metrics, partitions, reorder, replenishment, snapshots
 from inventory.utils import generate_unique_sku
 from inventory.filters import ProductFilter
+from inventory.renderers import FastJSONRenderer
 from inventory.serializers import StockTransferSerializer
+from inventory import services
 from inventory.models import (
     Product,
+    ProductStock,
     Store,
-    Inventory
+    Inventory,
+    Movement,
+    MovementDailyRollup,
+    InventorySnapshot,
+    InventorySnapshotRun,
+    ReorderPointRun,
+    StockDemandDay,
+    MOVEMENT_IN,
+    MOVEMENT_OUT,
+    MOVEMENT_TRANSFER
 )
 
 
+def apply_stock_rollup():
+    # ProductStock is folded in by a deferred trigger at commit; test cases
+    # never commit, so fire the pending triggers explicitly.
+    connection.check_constraints()
+
+
 class ProductFilterTests(TestCase):
     def setUp(self):
         self.faker = Faker()
@@ -30,6 +65,7 @@ class ProductFilterTests(TestCase):
         
         Inventory.objects.create(product=self.p1, store=self.store, quantity=5, minStock=5)
         Inventory.objects.create(product=self.p2, store=self.store, quantity=0, minStock=5)
+        apply_stock_rollup()
 
     def test_filter_by_category(self):
         queryset = Product.objects.all()
@@ -58,6 +94,518 @@ class ProductFilterTests(TestCase):
         self.assertEqual(filtered_qs.count(), 2)
         self.assertNotIn(self.p1, filtered_qs)
 
+    def test_filter_by_min_total_stock(self):
+        queryset = Product.objects.all()
+        filtered_qs = ProductFilter({'min_total_stock': 5}, queryset=queryset).qs
+        self.assertEqual(list(filtered_qs), [self.p1])
+        filtered_qs = ProductFilter({'min_total_stock': 6}, queryset=queryset).qs
+        self.assertEqual(filtered_qs.count(), 0)
+
+
+class ProductStockRollupTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Widget', category='Tools', price=1, sku='SKU-ROLL')
+        self.store1 = Store.objects.create(name='Store 1', city='City')
+        self.store2 = Store.objects.create(name='Store 2', city='City')
+        self.inventory = Inventory.objects.create(
+            product=self.product, store=self.store1, quantity=10, minStock=1)
+        apply_stock_rollup()
+
+    def assertRollup(self, total_quantity, stores_in_stock):
+        stock = ProductStock.objects.get(product=self.product)
+        self.assertEqual((stock.total_quantity, stock.stores_in_stock), (total_quantity, stores_in_stock))
+
+    def test_rollup_created_with_inventory(self):
+        self.assertRollup(10, 1)
+
+    def test_rollup_follows_transfers(self):
+        services.transfer_stock(self.product.id, self.store1.id, self.store2.id, 4)
+        apply_stock_rollup()
+        self.assertRollup(10, 2)
+        services.transfer_stock(self.product.id, self.store1.id, self.store2.id, 6)
+        apply_stock_rollup()
+        self.assertRollup(10, 1)
+
+    def test_rollup_follows_updates_and_deletes(self):
+        self.inventory.quantity = 3
+        self.inventory.save()
+        apply_stock_rollup()
+        self.assertRollup(3, 1)
+        self.inventory.delete()
+        apply_stock_rollup()
+        self.assertRollup(0, 0)
+
+    def test_apply_is_queued_once_per_transaction(self):
+        # Only the first delta of a transaction queues the deferred apply
+        # (migration 0004); queuing it per row made commits quadratic.
+        def pending():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT count(*) FILTER (WHERE flush), count(*) FROM inventory_productstock_delta')
+                return cursor.fetchone()
+
+        Inventory.objects.create(product=self.product, store=self.store2, quantity=5, minStock=1)
+        for quantity in (7, 0, 2):
+            self.inventory.quantity = quantity
+            self.inventory.save()
+        self.assertEqual(pending(), (1, 4))
+        apply_stock_rollup()
+        self.assertEqual(pending(), (0, 0))
+        self.assertRollup(7, 2)
+        # The apply step clears the flag, so later writes queue it again.
+        self.inventory.delete()
+        self.assertEqual(pending(), (1, 1))
+        apply_stock_rollup()
+        self.assertRollup(5, 1)
+
+    def test_product_delete_drops_rollup(self):
+        self.product.delete()
+        apply_stock_rollup()
+        self.assertFalse(ProductStock.objects.exists())
+
+
+class PopulateCatalogsTests(TestCase):
+    def populate(self, *args, **kwargs):
+        call_command('populate_catalogs', *args, stdout=StringIO(), **kwargs)
+
+    def test_creates_catalog_offline(self):
+        self.populate(12, 3, seed=7, movements=5, chunk_size=6)
+        self.assertEqual(Product.objects.count(), 12)
+        self.assertEqual(Store.objects.count(), 3)
+        self.assertEqual(Inventory.objects.count(), 36)
+        self.assertFalse(Inventory.objects.filter(quantity__lt=0).exists())
+        self.assertTrue(Movement.objects.exists())
+
+    def test_inventory_reconciles_with_ledger(self):
+        self.populate(4, 3, seed=7, movements=20)
+        apply_stock_rollup()
+        for item in Inventory.objects.all():
+            ledger = Movement.objects.filter(product=item.product_id)
+            moved_in = ledger.filter(targetStore=item.store_id).aggregate(total=Sum('quantity'))['total'] or 0
+            moved_out = ledger.filter(sourceStore=item.store_id).aggregate(total=Sum('quantity'))['total'] or 0
+            self.assertTrue(10 <= item.quantity - moved_in + moved_out <= 100)
+        for stock in ProductStock.objects.all():
+            totals = Inventory.objects.filter(product=stock.product_id).aggregate(
+                quantity=Sum('quantity'))
+            self.assertEqual(stock.total_quantity, totals['quantity'])
+
+    def test_seed_is_reproducible(self):
+        self.assertEqual(list(product_rows(7, 0, 5)), list(product_rows(7, 0, 5)))
+        self.assertNotEqual(list(product_rows(7, 0, 5)), list(product_rows(8, 0, 5)))
+
+    def test_reused_seed_is_rejected(self):
+        self.populate(2, 1, seed=7)
+        with self.assertRaises(CommandError):
+            self.populate(2, 1, seed=7)
+
+
+class MovementPartitionTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Widget', category='Tools', price=1, sku='SKU-PART')
+        self.store1 = Store.objects.create(name='Store 1', city='City')
+        self.store2 = Store.objects.create(name='Store 2', city='City')
+        self.old = timezone.now() - timedelta(days=3 * 365)
+        self.old_month = partitions.month_of(self.old)
+
+    def create_old_transfer(self, quantity):
+        movement = Movement.objects.create(
+            product=self.product, sourceStore=self.store1, targetStore=self.store2,
+            quantity=quantity, type=MOVEMENT_TRANSFER
+        )
+        Movement.objects.filter(pk=movement.pk).update(timestamp=self.old)
+        return movement
+
+    def default_partition_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {partitions.DEFAULT_PARTITION}')
+            return cursor.fetchone()[0]
+
+    def test_upcoming_partitions_exist(self):
+        current = partitions.month_of(timezone.now())
+        months = partitions.list_partitions()
+        for count in range(partitions.AHEAD_MONTHS + 1):
+            self.assertIn(partitions.add_months(current, count), months)
+
+    def test_ensure_moves_rows_out_of_default_partition(self):
+        movement = self.create_old_transfer(5)
+        self.assertEqual(self.default_partition_count(), 1)
+        self.assertEqual(partitions.ensure_partitions(), [self.old_month])
+        self.assertEqual(self.default_partition_count(), 0)
+        self.assertTrue(Movement.objects.filter(pk=movement.pk).exists())
+
+    def test_compact_drops_time_btree(self):
+        partitions.create_partition(self.old_month, hot=True)
+        self.assertEqual(partitions.compact_partitions(), [self.old_month])
+        self.assertEqual(partitions.compact_partitions(), [])
+
+    def test_expired_partition_is_rolled_up_and_detached(self):
+        self.create_old_transfer(5)
+        self.create_old_transfer(3)
+        partitions.ensure_partitions()
+        expired = partitions.expire_partitions(retain_months=12)
+        self.assertEqual(expired, {self.old_month: 2})
+        self.assertNotIn(self.old_month, partitions.list_partitions())
+        self.assertFalse(Movement.objects.exists())
+        rollups = {
+            (rollup.store_id, rollup.quantity_in, rollup.quantity_out, rollup.movements)
+            for rollup in MovementDailyRollup.objects.all()
+        }
+        self.assertEqual(rollups, {(self.store1.id, 0, 8, 2), (self.store2.id, 8, 0, 2)})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('movement_partitions', retain_months=24, drop=True, stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+
+class InventorySnapshotTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Widget', category='Tools', price=1, sku='SKU-SNAP')
+        self.store1 = Store.objects.create(name='Store 1', city='City')
+        self.store2 = Store.objects.create(name='Store 2', city='City')
+        self.inventory1 = Inventory.objects.create(product=self.product, store=self.store1, quantity=10, minStock=1)
+        self.inventory2 = Inventory.objects.create(product=self.product, store=self.store2, quantity=0, minStock=1)
+
+    def snapshot_rows(self, day):
+        return dict(InventorySnapshot.objects.filter(day=day).values_list('store_id', 'quantity'))
+
+    def test_first_snapshot_skips_empty_rows(self):
+        day, rows = snapshots.take_snapshot()
+        self.assertEqual(rows, 1)
+        self.assertEqual(self.snapshot_rows(day), {self.store1.id: 10})
+
+    def test_only_changes_since_previous_day_are_written(self):
+        day, _ = snapshots.take_snapshot()
+        InventorySnapshot.objects.update(day=day - timedelta(days=1))
+        self.inventory2.quantity = 4
+        self.inventory2.save()
+        _, rows = snapshots.take_snapshot()
+        self.assertEqual(rows, 1)
+        self.assertEqual(self.snapshot_rows(day), {self.store2.id: 4})
+
+    def test_removed_rows_are_snapshotted_as_zero(self):
+        day, _ = snapshots.take_snapshot()
+        InventorySnapshot.objects.update(day=day - timedelta(days=1))
+        self.inventory1.delete()
+        snapshots.take_snapshot()
+        self.assertEqual(self.snapshot_rows(day), {self.store1.id: 0})
+
+    def test_rerun_replaces_the_day(self):
+        day, _ = snapshots.take_snapshot()
+        self.inventory1.quantity = 12
+        self.inventory1.save()
+        out = StringIO()
+        call_command('snapshot_inventory', stdout=out)
+        self.assertIn('1 changed rows', out.getvalue())
+        self.assertEqual(self.snapshot_rows(day), {self.store1.id: 12})
+
+    def test_movements_in_the_settle_window_are_left_to_replay(self):
+        # The sale is already in Inventory, but it is stamped after taken_at:
+        # the snapshot holds the stock before it and the replay applies it.
+        Movement.objects.create(product=self.product, sourceStore=self.store1, quantity=3, type=MOVEMENT_OUT)
+        self.inventory1.quantity = 7
+        self.inventory1.save()
+        day, _ = snapshots.take_snapshot()
+        self.assertEqual(self.snapshot_rows(day), {self.store1.id: 10})
+        taken_at = InventorySnapshotRun.objects.get(day=day).taken_at
+        self.assertEqual(snapshots._net_movements(self.product.id, self.store1.id, taken_at, timezone.now()), (-3, 1))
+
+
+class ReplenishmentPlanTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Item {i}', category='Tools' if i else 'Books', price=1, sku=f'SKU-R{i}')
+            for i in range(3)
+        ]
+        self.stores = [
+            Store.objects.create(name=f'Store {i}', city=city)
+            for i, city in enumerate(['North', 'North', 'South', 'South'])
+        ]
+
+    def stock(self, product, quantities, minimum=10):
+        for store, quantity in zip(self.stores, quantities):
+            if quantity is not None:
+                Inventory.objects.create(product=product, store=store, quantity=quantity, minStock=minimum)
+
+    def lines(self, plan):
+        return sorted(
+            (line['product_id'], line['source_store_id'], line['target_store_id'], line['quantity'])
+            for line in plan['lines']
+        )
+
+    def test_same_city_sources_first(self):
+        # Store 0 is short by 8: its city neighbour has 5 spare, the rest
+        # comes from the other city.
+        self.stock(self.products[1], [2, 15, 40, None])
+        plan = replenishment.plan_replenishment()
+        product, stores = self.products[1].id, [store.id for store in self.stores]
+        self.assertEqual(self.lines(plan), sorted([
+            (product, stores[1], stores[0], 5),
+            (product, stores[2], stores[0], 3),
+        ]))
+        self.assertEqual(
+            (plan['transfers'], plan['quantity'], plan['same_city_quantity'], plan['unmet_quantity']), (2, 8, 5, 0)
+        )
+
+    def test_cities_match_case_insensitively(self):
+        Store.objects.filter(pk=self.stores[1].pk).update(city='NORTH')
+        self.stock(self.products[1], [2, 15, 40, None])
+        self.assertEqual(replenishment.plan_replenishment()['same_city_quantity'], 5)
+
+    def test_shortfall_beyond_spare_stock(self):
+        self.stock(self.products[1], [0, 12, 0, 0])
+        plan = replenishment.plan_replenishment()
+        self.assertEqual((plan['quantity'], plan['unmet_quantity']), (2, 28))
+
+    def test_scope(self):
+        self.stock(self.products[0], [0, 20, 20, 20])
+        self.stock(self.products[1], [0, 10, 0, 30])
+        self.stores[1].is_active = False
+        self.stores[1].save()
+        self.assertEqual(
+            {line['product_id'] for line in replenishment.plan_replenishment(category='books')['lines']},
+            {self.products[0].id}
+        )
+        # Only South is planned: store 3's surplus covers store 2.
+        plan = replenishment.plan_replenishment(city='south')
+        self.assertEqual(
+            {(line['source_store_id'], line['target_store_id']) for line in plan['lines']},
+            {(self.stores[3].id, self.stores[2].id)}
+        )
+        # The inactive store neither gives nor receives.
+        plan = replenishment.plan_replenishment()
+        self.assertNotIn(self.stores[1].id, {line['source_store_id'] for line in plan['lines']})
+
+    def test_matches_every_key_greedily(self):
+        rng = random.Random(7)
+        keys = np.array([rng.randrange(20) for _ in range(300)])
+        amounts = np.array([rng.randint(1, 50) for _ in range(300)])
+        demand, supply = slice(0, 120), slice(120, None)
+        d, s, quantity = replenishment.match(keys[demand], amounts[demand], keys[supply], amounts[supply])
+        self.assertTrue((keys[demand][d] == keys[supply][s]).all())
+        self.assertTrue((quantity > 0).all())
+        for key in range(20):
+            wanted = amounts[demand][keys[demand] == key].sum()
+            offered = amounts[supply][keys[supply] == key].sum()
+            self.assertEqual(quantity[keys[demand][d] == key].sum(), min(wanted, offered))
+        self.assertTrue((np.bincount(d, weights=quantity, minlength=120) <= amounts[demand]).all())
+        self.assertTrue((np.bincount(s, weights=quantity, minlength=180) <= amounts[supply]).all())
+
+    def test_empty(self):
+        self.stock(self.products[1], [20, 20, None, None])
+        self.assertEqual(replenishment.plan_replenishment(), {
+            'transfers': 0, 'quantity': 0, 'same_city_quantity': 0, 'unmet_quantity': 0, 'lines': []
+        })
+
+
+class ReorderPointTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Widget', category='Tools', price=1, sku='SKU-REORDER')
+        self.other_product = Product.objects.create(name='Gadget', category='Tools', price=1, sku='SKU-REORDER-2')
+        self.store1 = Store.objects.create(name='Store 1', city='City')
+        self.store2 = Store.objects.create(name='Store 2', city='City')
+        self.inventory1 = Inventory.objects.create(product=self.product, store=self.store1, quantity=50, minStock=5)
+        self.inventory2 = Inventory.objects.create(product=self.product, store=self.store2, quantity=50, minStock=5)
+        self.idle = Inventory.objects.create(product=self.other_product, store=self.store1, quantity=50, minStock=5)
+        self.now = timezone.now()
+
+    def move(self, quantity, at, type=MOVEMENT_OUT, source=None, target=None):
+        movement = Movement.objects.create(
+            product=self.product, sourceStore=source, targetStore=target, quantity=quantity, type=type
+        )
+        Movement.objects.filter(pk=movement.pk).update(timestamp=at)
+
+    def days_ago(self, days):
+        return self.now - timedelta(days=days)
+
+    def min_stock(self, inventory):
+        inventory.refresh_from_db()
+        return inventory.minStock
+
+    def test_first_run_sets_points_from_daily_demand(self):
+        self.move(10, self.days_ago(1), source=self.store1)
+        self.move(4, self.days_ago(2), source=self.store1)
+        self.move(6, self.days_ago(2), MOVEMENT_TRANSFER, source=self.store2, target=self.store1)
+        self.move(30, self.days_ago(1), MOVEMENT_IN, target=self.store1)
+        run = reorder.recompute_min_stock(now=self.now)
+        self.assertEqual(run.movements, 3)
+        self.assertIsNotNone(run.finished_at)
+        # 14 units in 28 days: 14 / 28 * 7 = 3.5, stddev sqrt((116 - 14 * 14 / 28) / 27)
+        # = 2.009, safety 1.65 * 2.009 * sqrt(7) = 8.77; ceil(12.27).
+        self.assertEqual(self.min_stock(self.inventory1), 13)
+        # 6 / 28 * 7 = 1.5, stddev sqrt((36 - 6 * 6 / 28) / 27) = 1.134,
+        # safety 1.65 * 1.134 * sqrt(7) = 4.95; ceil(6.45).
+        self.assertEqual(self.min_stock(self.inventory2), 7)
+        # No demand in the window: back to the floor.
+        self.assertEqual(self.min_stock(self.idle), 0)
+
+    def test_incremental_run_reads_only_movements_after_the_watermark(self):
+        self.move(10, self.days_ago(1), source=self.store1)
+        reorder.recompute_min_stock(now=self.now)
+        Inventory.objects.filter(pk=self.inventory2.pk).update(minStock=99)
+        # Already behind the watermark, so never read again.
+        self.move(500, self.days_ago(1), source=self.store1)
+        self.move(8, self.now + timedelta(hours=1), source=self.store1)
+        run = reorder.recompute_min_stock(now=self.now + timedelta(hours=2))
+        self.assertEqual((run.movements, run.updated), (1, 1))
+        # 18 / 28 * 7 = 4.5, stddev 2.376, safety 10.37; ceil(14.87).
+        self.assertEqual(self.min_stock(self.inventory1), 15)
+        # Keys without new demand aren't rewritten.
+        self.assertEqual(self.min_stock(self.inventory2), 99)
+
+    def test_days_leaving_the_window_are_dropped(self):
+        self.move(10, self.days_ago(2), source=self.store1)
+        reorder.recompute_min_stock(now=self.now)
+        self.assertGreater(self.min_stock(self.inventory1), 0)
+        reorder.recompute_min_stock(now=self.now + timedelta(days=30))
+        self.assertFalse(StockDemandDay.objects.exists())
+        self.assertEqual(self.min_stock(self.inventory1), 0)
+
+    def test_unfinished_run_rewrites_every_row(self):
+        reorder.recompute_min_stock(now=self.now)
+        ReorderPointRun.objects.update(finished_at=None)
+        Inventory.objects.update(minStock=50)
+        run = reorder.recompute_min_stock(now=self.now + timedelta(hours=1))
+        self.assertEqual(run.updated, 3)
+        self.assertFalse(Inventory.objects.exclude(minStock=0).exists())
+
+    def test_full_run_rebuilds_the_demand(self):
+        self.move(10, self.days_ago(1), source=self.store1)
+        reorder.recompute_min_stock(now=self.now)
+        StockDemandDay.objects.update(quantity=1000)
+        reorder.recompute_min_stock(full=True, now=self.now)
+        self.assertEqual(StockDemandDay.objects.get().quantity, 10)
+        # 10 / 28 * 7 = 2.5, stddev 1.890, safety 8.25; ceil(10.75).
+        self.assertEqual(self.min_stock(self.inventory1), 11)
+
+    def test_one_run_at_a_time(self):
+        with psycopg.connect(**connection.get_connection_params()) as other:
+            other.execute('SELECT pg_advisory_lock(hashtext(%s))', [reorder.REORDER_LOCK])
+            with self.assertRaises(reorder.ReorderRunInProgress):
+                reorder.recompute_min_stock(now=self.now)
+            with self.assertRaises(CommandError):
+                call_command('recompute_min_stock', stdout=StringIO())
+        self.assertFalse(ReorderPointRun.objects.exists())
+        # The lock is released after a run, including one that failed.
+        with mock.patch.object(reorder, '_write_points', side_effect=RuntimeError):
+            self.move(10, self.days_ago(1), source=self.store1)
+            with self.assertRaises(RuntimeError):
+                reorder.recompute_min_stock(now=self.now)
+        self.assertIsNotNone(reorder.recompute_min_stock(now=self.now).finished_at)
+
+    def test_command(self):
+        self.move(10, self.days_ago(1), source=self.store1)
+        out = StringIO()
+        call_command('recompute_min_stock', stdout=out)
+        self.assertIn('Read 1 movements', out.getvalue())
+        self.assertIn('3 reorder points changed', out.getvalue())
+
+
+class PoolMetricsTests(TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(
+            kwargs=connection.get_connection_params(), min_size=1, max_size=2, open=True
+        )
+        self.addCleanup(self.pool.close)
+        self.pool.wait()
+        self.pool.pop_stats()
+
+    def sample(self, name, **labels):
+        with mock.patch.dict(type(connections['default'])._connection_pools, {'default': self.pool}):
+            metrics.record_pool_stats()
+        return metrics.REGISTRY.get_sample_value(name, {'alias': 'default', **labels}) or 0
+
+    def test_pool_gauges(self):
+        with self.pool.connection():
+            self.assertEqual(self.sample('inventory_db_pool_connections', state='in_use'), 1)
+            self.assertEqual(self.sample('inventory_db_pool_max_size'), 2)
+        self.assertEqual(self.sample('inventory_db_pool_connections', state='in_use'), 0)
+        self.assertEqual(self.sample('inventory_db_pool_connections', state='idle'), 1)
+
+    def test_pool_counters_accumulate(self):
+        before = self.sample('inventory_db_pool_requests_total')
+        for _ in range(3):
+            with self.pool.connection():
+                pass
+        self.assertEqual(self.sample('inventory_db_pool_requests_total'), before + 3)
+        # Counters are popped from the pool, so sampling again adds nothing.
+        self.assertEqual(self.sample('inventory_db_pool_requests_total'), before + 3)
+
+    def test_pools_are_never_created(self):
+        # connection.pool creates the pool on first access.
+        pool = mock.PropertyMock(side_effect=AssertionError('pool created'))
+        with mock.patch.object(type(connections['default']), 'pool', pool):
+            metrics.record_pool_stats()
+        pool.assert_not_called()
+
+    def test_metrics_endpoint(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+
+class RequestMetricsTests(TestCase):
+    def test_fingerprint_groups_parameters(self):
+        self.assertEqual(
+            metrics.fingerprint('SELECT "id"  FROM "inventory_movement_2025_01"\nWHERE "id" IN (%s, %s) AND "kind" = \'IN\' LIMIT 21'),
+            'SELECT "id" FROM "inventory_movement_2025_01" WHERE "id" IN (...) AND "kind" = ? LIMIT ?'
+        )
+        self.assertEqual(
+            metrics.fingerprint('SELECT 1 FROM "inventory_product" WHERE "id" = %(id)s'),
+            metrics.fingerprint('SELECT 1 FROM "inventory_product" WHERE "id" = %s')
+        )
+
+    def test_log_lists_most_repeated_queries(self):
+        stats = metrics.RequestStats()
+        stats.queries = [
+            ('SELECT 1 FROM "inventory_store" LIMIT 1', 0.004),
+            *[(f'SELECT * FROM "inventory_product" WHERE "id" = {i}', 0.001) for i in range(5)],
+            ('SELECT COUNT(*) FROM "inventory_inventory"', 0.002),
+        ]
+        request = RequestFactory().get('/api/inventory/alerts/')
+        middleware = metrics.RequestMetricsMiddleware(lambda request: None)
+        with self.assertLogs('inventory.metrics', 'WARNING') as logs:
+            middleware.log_queries(request, stats, 2)
+
+        lines = logs.records[0].getMessage().splitlines()
+        self.assertTrue(lines[0].startswith('GET /api/inventory/alerts/ ran 7 queries (11.0 ms of SQL)'))
+        self.assertEqual(lines[1], '  5x 5.0 ms  SELECT * FROM "inventory_product" WHERE "id" = ?')
+        self.assertEqual(lines[2], '  1x 4.0 ms  SELECT ? FROM "inventory_store" LIMIT ?')
+        self.assertEqual(len(lines), 3)
+
+
+@override_settings(INVENTORY_FAST_RENDERING={'ENABLED': True})
+class FastJSONRendererTests(TestCase):
+    def assertSameAsJSONRenderer(self, data, media_type=None):
+        self.assertEqual(FastJSONRenderer().render(data, media_type), JSONRenderer().render(data, media_type))
+
+    def test_matches_json_renderer(self):
+        errors = StockTransferSerializer(data={'quantity': 0})
+        errors.is_valid()
+        self.assertSameAsJSONRenderer({
+            'id': uuid.uuid4(),
+            'prices': [Decimal('0.01'), Decimal('10.00'), Decimal('99999999.99'), Decimal('0.00001')],
+            'text': 'Ünïcode 😀 "quoted" \\ \t\n\x00\x1f\u2028\u2029',
+            'when': timezone.now(),
+            'day': date(2026, 1, 2),
+            'nested': {'list': (1, -2, None, True), 'empty': {}},
+            'errors': errors.errors,
+            'numpy': np.int64(7),
+        })
+
+    def test_uses_orjson(self):
+        with mock.patch.object(JSONRenderer, 'render') as render:
+            self.assertEqual(FastJSONRenderer().render({'id': 1}), b'{"id":1}')
+        render.assert_not_called()
+        with override_settings(INVENTORY_FAST_RENDERING={'ENABLED': False}):
+            with mock.patch.object(JSONRenderer, 'render') as render:
+                FastJSONRenderer().render({'id': 1})
+        render.assert_called_once()
+
+    def test_falls_back_when_orjson_differs(self):
+        self.assertSameAsJSONRenderer({'big': 2 ** 70})
+        self.assertSameAsJSONRenderer({1: 'non-str key'})
+        self.assertSameAsJSONRenderer({'a': [1, {'b': 2}]}, 'application/json; indent=4')
+
 
 class StockTransferSerializerTests(TestCase):
     def setUp(self):
@@ -93,3 +641,10 @@ class StockTransferSerializerTests(TestCase):
         self.assertFalse(serializer.is_valid())
         self.assertIn('quantity', serializer.errors)
 
+    def test_invalid_data_quantity_too_large(self):
+        data = self.valid_data.copy()
+        data['quantity'] = 2 ** 31
+        serializer = StockTransferSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('quantity', serializer.errors)
+
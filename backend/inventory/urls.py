@@ -3,9 +3,17 @@ from . import views
 
 urlpatterns = [
     path('products/', views.ProductListCreateAPIView.as_view(), name='product-list-create'),
+    path('products/bulk/', views.import_products, name='product-import'),
     path('products/<uuid:pk>/', views.ProductDetailAPIView.as_view(), name='product-detail'),
     path('stores/', views.StoreListAPIView.as_view(), name='store-list'),
     path('stores/<uuid:store_id>/inventory/', views.store_inventory, name='store-inventory'),
     path('inventory/transfer/', views.transfer_stock, name='transfer-stock'),
+    path('inventory/transfers/batch/', views.transfer_stock_batch, name='transfer-stock-batch'),
+    path('inventory/replenishment-plan/', views.replenishment_plan, name='replenishment-plan'),
+    path('inventory/matrix/', views.stock_matrix, name='inventory-matrix'),
+    path('inventory/events/', views.record_stock_events, name='stock-events'),
     path('inventory/alerts/', views.inventory_alerts, name='inventory-alerts'),
+    path('inventory/as-of/', views.inventory_as_of, name='inventory-as-of'),
+    path('movements/', views.MovementListAPIView.as_view(), name='movement-list'),
+    path('movements/summary/', views.movement_summary, name='movement-summary'),
 ]
\ No newline at end of file
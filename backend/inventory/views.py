@@ -1,56 +1,162 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view
-from rest_framework.filters import SearchFilter
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import F
-from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 
-from .filters import ProductFilter, StandardPagination
+from .cache import PRODUCTS, REPLENISHMENT, STORES, CachedResponseMixin, get_response_cache
+from .filters import (
+    CatalogPagination,
+    InventoryAlertFilter,
+    InventoryAlertPagination,
+    MovementFilter,
+    MovementPagination,
+    ProductFilter,
+    ProductSearchFilter,
+    StoreInventoryPagination
+)
+from .parsers import CSVParser, NDJSONParser
+from .renderers import (
+    CSVRenderer,
+    FastJSONRenderer,
+    NDJSONRenderer,
+    StockMatrixRenderer,
+    fast_rendering_enabled,
+    stream_csv,
+    stream_ndjson
+)
+from .routers import reads_from_replica
+from . import matrix, metrics, replenishment, reports, services, snapshots
 from .models import (
     Product,
     Store,
     Inventory,
-    Movement,
-    MOVEMENT_TRANSFER
+    Movement
 )
 from .serializers import (
+    BatchTransferSerializer,
+    MovementSerializer,
+    MovementSummaryQuerySerializer,
     ProductSerializer,
     InventoryListSerializer,
+    ReplenishmentPlanQuerySerializer,
+    StockAsOfQuerySerializer,
+    StockEventBatchSerializer,
+    StockMatrixQuerySerializer,
     StockTransferSerializer,
     StoreSerializer
 )
 
 
-class ProductListCreateAPIView(generics.ListCreateAPIView):
+# JSONRenderer, switching to orjson when fast rendering is on.
+FAST_RENDERER_CLASSES = [FastJSONRenderer, *api_settings.DEFAULT_RENDERER_CLASSES]
+
+
+class ValuesListMixin:
+    # With fast rendering on, list pages are read with .values() and shaped
+    # by the serializer's from_values(), without model instances.
+    renderer_classes = FAST_RENDERER_CLASSES
+
+    def get_values_layout(self):
+        if not fast_rendering_enabled():
+            return None
+        return self.get_serializer_class().values_layout()
+
+    def list(self, request, *args, **kwargs):
+        layout = self.get_values_layout()
+        if layout is None:
+            return super().list(request, *args, **kwargs)
+        serializer_class = self.get_serializer_class()
+        queryset = serializer_class.values_queryset(self.filter_queryset(self.get_queryset()), layout)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(serializer_class.from_values(page, layout))
+
+
+class ProductListCreateAPIView(ValuesListMixin, CachedResponseMixin, generics.ListCreateAPIView):
     queryset = Product.objects.all().order_by('name') 
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
     filterset_class = ProductFilter
-    pagination_class = StandardPagination
+    pagination_class = CatalogPagination
+    keyset_ordering = ('name', 'id')
+    read_replica = True
+    cache_namespace = PRODUCTS
+    # Stock filters depend on inventory, which changes far too often to cache.
+    cache_bypass_params = ('has_stock', 'min_total_stock', 'max_total_stock')
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+@api_view(['POST'])
+@parser_classes([*api_settings.DEFAULT_PARSER_CLASSES, NDJSONParser, CSVParser])
+def import_products(request):
+    # JSON bodies carry a list of rows; NDJSON and CSV bodies are read
+    # from the request stream as the import goes.
+    rows = request.data
+    if isinstance(rows, (dict, str)) or not hasattr(rows, '__iter__'):
+        return Response(
+            {'detail': 'Expected a list of products.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    report = services.import_products(rows)
+    return Response(report, status=status.HTTP_200_OK)
+
+class ProductDetailAPIView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     lookup_field = 'pk'
+    cache_namespace = PRODUCTS
  
 
-class StoreListAPIView(generics.ListAPIView):
+class StoreListAPIView(ValuesListMixin, CachedResponseMixin, generics.ListAPIView):
     queryset = Store.objects.all().order_by('name') 
     serializer_class = StoreSerializer
-    pagination_class = StandardPagination
+    pagination_class = CatalogPagination
+    keyset_ordering = ('name',)
+    read_replica = True
+    cache_namespace = STORES
+
+
+EXPORT_CHUNK_SIZE = 2000
+INVENTORY_EXPORT_FIELDS = ('id', 'quantity', 'minStock', 'product', 'store')
+EXPORT_STREAMS = {
+    NDJSONRenderer.format: stream_ndjson,
+    CSVRenderer.format: stream_csv,
+}
 
 
+def _inventory_page(request, queryset, paginator):
+    options = InventoryListSerializer.get_options(request.query_params)
+    if fast_rendering_enabled():
+        layout = InventoryListSerializer.values_layout(**options)
+        page = paginator.paginate_queryset(InventoryListSerializer.values_queryset(queryset, layout), request)
+        return paginator.get_paginated_response(InventoryListSerializer.from_values(page, layout))
+    page = paginator.paginate_queryset(InventoryListSerializer.prepare_queryset(queryset, **options), request)
+    serializer = InventoryListSerializer(page, many=True, **options)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@reads_from_replica
 @api_view(['GET'])
+@renderer_classes([*FAST_RENDERER_CLASSES, NDJSONRenderer, CSVRenderer])
 def store_inventory(request, store_id):
-    try:
-        store = Store.objects.get(pk=store_id)
-    except Store.DoesNotExist:
+    if not Store.objects.filter(pk=store_id).exists():
         return Response({'error': 'Store not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    inventory = Inventory.objects.filter(store=store)
-    serializer = InventoryListSerializer(inventory, many=True)
-    return Response(serializer.data)
+
+    inventory = Inventory.objects.filter(store_id=store_id)
+
+    stream = EXPORT_STREAMS.get(request.accepted_renderer.format)
+    if stream is not None:
+        # Rows are pulled through a server-side cursor and written out as
+        # they arrive, so memory use doesn't depend on the store size.
+        rows = inventory.order_by('product_id').values_list(
+            'id', 'quantity', 'minStock', 'product_id', 'store_id'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return StreamingHttpResponse(
+            stream(INVENTORY_EXPORT_FIELDS, rows),
+            content_type=request.accepted_renderer.media_type
+        )
+
+    return _inventory_page(request, inventory, StoreInventoryPagination())
 
 @api_view(['POST'])
 def transfer_stock(request):
@@ -58,51 +164,139 @@ def transfer_stock(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    validated_data = serializer.validated_data
-    product_id = validated_data['product_id']
-    source_store_id = validated_data['source_store_id']
-    target_store_id = validated_data['target_store_id']
-    quantity = validated_data['quantity']
+    try:
+        services.transfer_stock(**serializer.validated_data)
+    except services.InsufficientStock as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except services.TransferNotFound as e:
+        return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({'message': 'Transfer successful'}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+def transfer_stock_batch(request):
+    serializer = BatchTransferSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        with transaction.atomic():
-            product = Product.objects.get(pk=product_id)
-            source_store = Store.objects.get(pk=source_store_id)
-            target_store = Store.objects.get(pk=target_store_id)
-
-            source_inventory = Inventory.objects.get(product=product, store=source_store)
-            target_inventory, _ = Inventory.objects.get_or_create(
-                product=product,
-                store=target_store,
-                defaults={'quantity': 0, 'minStock': 0})
-
-            if source_inventory.quantity < quantity:
-                return Response(
-                    {'error': 'Not enough stock to transfer.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            source_inventory.quantity = F('quantity') - quantity
-            target_inventory.quantity = F('quantity') + quantity
-            source_inventory.save()
-            target_inventory.save()
-
-            Movement.objects.create(
-                product=product,
-                sourceStore=source_store,
-                targetStore=target_store,
-                quantity=quantity,
-                type=MOVEMENT_TRANSFER
-            )
-        
-        return Response({'message': 'Transfer successful'}, status=status.HTTP_200_OK)
-    
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        report = services.transfer_stock_batch(**serializer.validated_data)
+    except services.BatchTransferError as e:
+        return Response(e.report, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report, status=status.HTTP_200_OK)
 
+@reads_from_replica
 @api_view(['GET'])
+def replenishment_plan(request):
+    serializer = ReplenishmentPlanQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    query = serializer.validated_data
+    # Lines come largest first, and the response can be posted as is to
+    # the batch transfer endpoint.
+    plan = _replenishment_plan(query.get('category'), query.get('city'))
+    return Response({**plan, 'lines': plan['lines'][:query['limit']]}, status=status.HTTP_200_OK)
+
+def _replenishment_plan(category, city):
+    # Planning reads all the stock in scope, so the plan is kept in the
+    # response cache per scope, with the largest lines a request can ask
+    # for, and every limit is cut from it. Stock and minStock writes bump
+    # the version once they commit, so a plan that was applied isn't served
+    # again.
+    response_cache = get_response_cache()
+    key = None
+    if response_cache.enabled:
+        key = response_cache.key_for_values(REPLENISHMENT, [(category or '').upper(), (city or '').upper()])
+    plan = None if key is None else response_cache.get(key)
+    if plan is None:
+        plan = replenishment.plan_replenishment(category=category, city=city, limit=replenishment.PLAN_BATCH_SIZE)
+        if key is not None:
+            response_cache.set(key, plan)
+    return plan
+
+@reads_from_replica
+@api_view(['GET'])
+@renderer_classes([*FAST_RENDERER_CLASSES, StockMatrixRenderer])
+def stock_matrix(request):
+    serializer = StockMatrixQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    query = serializer.validated_data
+    try:
+        stock = matrix.load_matrix(
+            category=query.get('category'), city=query.get('city'), stores=query.get('store')
+        )
+    except matrix.MatrixTooLarge as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if request.accepted_renderer.format == StockMatrixRenderer.format:
+        return HttpResponse(matrix.pack(stock), content_type=StockMatrixRenderer.media_type)
+    return Response(matrix.to_json(stock), status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+def record_stock_events(request):
+    serializer = StockEventBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    report = services.record_stock_events(serializer.validated_data['events'])
+    return Response(report, status=status.HTTP_200_OK)
+
+@reads_from_replica
+@api_view(['GET'])
+@renderer_classes(FAST_RENDERER_CLASSES)
 def inventory_alerts(request):
+    # Served from the partial low-stock index, so the cost follows the
+    # number of alerts rather than the size of the inventory table.
     low_stock_items = Inventory.objects.filter(quantity__lt=F('minStock'))
-        # .select_related('product', 'store')
-    serializer = InventoryListSerializer(low_stock_items, many=True)
-    return Response(serializer.data)
+    filterset = InventoryAlertFilter(request.query_params, queryset=low_stock_items)
+    if not filterset.is_valid():
+        return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    return _inventory_page(request, filterset.qs, InventoryAlertPagination())
+
+
+@api_view(['GET'])
+def inventory_as_of(request):
+    serializer = StockAsOfQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    query = serializer.validated_data
+    if not Product.objects.filter(pk=query['product_id']).exists():
+        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not Store.objects.filter(pk=query['store_id']).exists():
+        return Response({'error': 'Store not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        stock = snapshots.stock_as_of(**query)
+    except snapshots.LedgerExpired as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({**query, **stock})
+
+class MovementListAPIView(generics.ListAPIView):
+    queryset = Movement.objects.all()
+    serializer_class = MovementSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MovementFilter
+    pagination_class = MovementPagination
+
+@api_view(['GET'])
+def movement_summary(request):
+    serializer = MovementSummaryQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    query = serializer.validated_data
+    return Response({
+        'interval': query['interval'],
+        'since': query['since'],
+        'until': query['until'],
+        'results': reports.movement_summary(**query),
+    })
+
+
+def prometheus_metrics(request):
+    content, content_type = metrics.render()
+    return HttpResponse(content, content_type=content_type)
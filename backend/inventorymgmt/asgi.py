@@ -7,10 +7,36 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inventorymgmt.settings')
+# Serve the async read views; DJANGO_ROOT_URLCONF=inventorymgmt.urls keeps
+# every endpoint sync.
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'inventorymgmt.asgi_urls')
 
-application = get_asgi_application()
+
+class ConcurrencyLimit:
+    # Every in-flight request runs its queries on its own thread and
+    # connection, so without a cap a burst opens as many Postgres
+    # connections as there are clients. Requests over the limit wait here.
+    def __init__(self, app, limit):
+        self.app = app
+        self.limit = limit
+        self.semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            return await self.app(scope, receive, send)
+
+
+application = ConcurrencyLimit(
+    get_asgi_application(),
+    int(os.getenv('ASGI_CONCURRENCY', 30))
+)
@@ -0,0 +1,20 @@
+"""
+URL configuration used under ASGI (see asgi.py): the same routes as
+inventorymgmt.urls, with async views for the inventory read endpoints.
+"""
+from django.contrib import admin
+from django.urls import include, path
+from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+
+from inventory.views import prometheus_metrics
+
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('inventory.async_urls')),
+    # The async views aren't DRF views, so the schema is built from the
+    # sync URLconf, which describes the same API.
+    path('api/schema/', SpectacularAPIView.as_view(urlconf='inventorymgmt.urls'), name='schema'),
+    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('metrics', prometheus_metrics, name='metrics')
+]
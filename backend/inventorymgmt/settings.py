@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import copy
 import os
 from pathlib import Path
 
@@ -17,6 +18,14 @@ DB_PORT = str(os.getenv('DATABASE_PORT'))
 DB_NAME = str(os.getenv('DATABASE_NAME'))
 DB_USER = str(os.getenv('DATABASE_USERNAME'))
 DB_PASSWORD = str(os.getenv('DATABASE_PASSWORD'))
+DB_POOL = os.getenv('DATABASE_POOL', '').lower() in ('1', 'true', 'yes')
+DB_POOL_MIN_SIZE = int(os.getenv('DATABASE_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DATABASE_POOL_MAX_SIZE', 4))
+DB_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', 10))
+DB_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', 0))
+DB_CONN_HEALTH_CHECKS = os.getenv('DATABASE_CONN_HEALTH_CHECKS', 'true').lower() in ('1', 'true', 'yes')
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DATABASE_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', 5))
 DEBUG = bool(os.environ.get("DEBUG", default=0))
 # ALLOWED_HOSTS = os.environ.get("DJANGO_ALLOWED_HOSTS","127.0.0.1").split(",")
 
@@ -41,6 +50,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
     'drf_spectacular',
@@ -48,7 +58,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'inventory.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,7 +69,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'inventorymgmt.urls'
+# asgi.py defaults this to inventorymgmt.asgi_urls, which swaps in the async
+# read views.
+ROOT_URLCONF = os.getenv('DJANGO_ROOT_URLCONF', 'inventorymgmt.urls')
 
 TEMPLATES = [
     {
@@ -82,6 +96,59 @@ REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False
 }
 
+# Response cache for catalog reads (see inventory/cache.py). BACKEND is 'lru'
+# (per-process: a write only invalidates the worker that made it, the others
+# serve entries from before it for up to TIMEOUT seconds), 'django' (the
+# CACHE_ALIAS entry in CACHES; point it at Redis/Memcached to share entries
+# and invalidations across workers) or 'none'.
+INVENTORY_RESPONSE_CACHE = {
+    'BACKEND': os.getenv('RESPONSE_CACHE_BACKEND', 'lru'),
+    'CACHE_ALIAS': os.getenv('RESPONSE_CACHE_ALIAS', 'default'),
+    'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024)),
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60)),
+}
+
+# Per-request instrumentation exported at /metrics (see inventory/metrics.py).
+# HEADERS adds X-Query-Count and Server-Timing to every response; requests
+# running more than SLOW_QUERY_COUNT queries (0 disables it) log their
+# SLOW_QUERY_TOP most repeated query fingerprints.
+INVENTORY_REQUEST_METRICS = {
+    'HEADERS': os.getenv('REQUEST_METRICS_HEADERS', '').lower() in ('1', 'true', 'yes'),
+    'SLOW_QUERY_COUNT': int(os.getenv('REQUEST_METRICS_SLOW_QUERY_COUNT', 50)),
+    'SLOW_QUERY_TOP': int(os.getenv('REQUEST_METRICS_SLOW_QUERY_TOP', 5)),
+}
+
+# Demand-driven minStock, recomputed by the recompute_min_stock command (see
+# inventory/reorder.py): daily demand over WINDOW_DAYS, LEAD_TIME_DAYS of
+# cover and SERVICE_FACTOR standard deviations of safety stock.
+INVENTORY_REORDER_POINTS = {
+    'WINDOW_DAYS': int(os.getenv('REORDER_WINDOW_DAYS', 28)),
+    'LEAD_TIME_DAYS': int(os.getenv('REORDER_LEAD_TIME_DAYS', 7)),
+    'SERVICE_FACTOR': float(os.getenv('REORDER_SERVICE_FACTOR', 1.65)),
+    'MIN_STOCK_FLOOR': int(os.getenv('REORDER_MIN_STOCK_FLOOR', 0)),
+}
+
+# Serializer-free JSON for the hot list endpoints (see
+# inventory/renderers.py): rows are read with .values() and encoded with
+# orjson, to the same bytes the serializers and JSONRenderer produce.
+INVENTORY_FAST_RENDERING = {
+    'ENABLED': os.getenv('FAST_RENDERING', '').lower() in ('1', 'true', 'yes'),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'inventory': {
+            'handlers': ['console'],
+            'level': os.getenv('DJANGO_LOGLEVEL', 'info').upper(),
+        },
+    },
+}
+
 # OpenAPI Settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Your Project API',
@@ -94,6 +161,14 @@ SPECTACULAR_SETTINGS = {
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connection reuse, see "Database connections" in the README for sizing.
+# DATABASE_POOL=true gives every worker process a psycopg pool of
+# MIN_SIZE..MAX_SIZE connections that requests borrow and return; a request
+# waits up to TIMEOUT seconds for one. Without the pool, DATABASE_CONN_MAX_AGE
+# keeps each worker thread's connection open for that many seconds (0 closes
+# it after every request). Health checks test a reused connection before
+# handing it out, pooled or persistent.
+
 DATABASES = {
     'default': {
         "ENGINE": "django.db.backends.postgresql",
@@ -102,9 +177,40 @@ DATABASES = {
         "NAME": DB_NAME,
         "USER": DB_USER,
         "PASSWORD": DB_PASSWORD,
+        # The pool manages connection lifetime, so Django must not keep them.
+        "CONN_MAX_AGE": 0 if DB_POOL else DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": DB_CONN_HEALTH_CHECKS,
+        "OPTIONS": {
+            "pool": {
+                "min_size": DB_POOL_MIN_SIZE,
+                "max_size": DB_POOL_MAX_SIZE,
+                "timeout": DB_POOL_TIMEOUT,
+            },
+        } if DB_POOL else {},
     }
 }
 
+# Read replicas, see "Read replicas" in the README. Each host[:port] in
+# DATABASE_REPLICA_HOSTS becomes a replicaN alias with the primary's
+# credentials. Tests run them against the primary's test database.
+for index, replica in enumerate(DB_REPLICA_HOSTS, start=1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica{index}'] = {
+        **copy.deepcopy(DATABASES['default']),
+        "HOST": host,
+        "PORT": port or DB_PORT,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ['inventory.routers.ReplicaRouter']
+
+INVENTORY_READ_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    # How long a client that wrote keeps reading from the primary; above
+    # the worst replication lag you expect.
+    'PIN_SECONDS': DB_REPLICA_PIN_SECONDS,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators